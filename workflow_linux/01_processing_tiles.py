@@ -6,8 +6,7 @@ from general_utilities import (
     get_clark_geometries,
     get_gmw_geometries_by_latitude,
     add_country_info,
-    get_tiles_vector,
-    get_tiles_vector_with_buffer,    
+    get_tiles_vectors,
     get_processing_time
 )
 
@@ -45,9 +44,7 @@ if tiles_ids is not None:
 clark_gmw_tiles = get_gmw_geometries_by_latitude(gmw_tiles, clark_tiles, output_dir)
 clark_gmw_tiles_country = add_country_info(clark_gmw_tiles, countries_geometries, clark_countries, output_dir)
 
-get_tiles_vector(output_dir, clark_gmw_tiles_country)
-get_tiles_vector_with_buffer(output_dir, clark_gmw_tiles_country, "EPSG:3857", 10000)
-get_tiles_vector_with_buffer(output_dir, clark_gmw_tiles_country, "EPSG:3857", 200000)
+get_tiles_vectors(output_dir, clark_gmw_tiles_country, "EPSG:3857", [10000, 200000])
 
 end_time = time.time()
 
@@ -6,48 +6,75 @@ from osgeo import gdal
 from general_utilities import (
     get_processing_time
 )
+from ras_utilities import (
+    ingest_zip,
+    filter_sources_by_tiles
+)
 
 # Load config from external file
 with open("config.json", "r") as f:
     config = json.load(f)
 
 # Define inputs from config
+country_name = config["country_name"]
 data_dir = config["data_dir"]
+n_workers = config["n_workers"]
 clark_files = config["clark_files"]
 clark_year = config["clark_year"]  
+ingest_cog = config["ingest_cog"]  # Extract the zip members once into COGs instead of reading through /vsizip/
+vrt_footprint_filter = config["vrt_footprint_filter"]  # Only list the sources that intersect the tiles of the run
 
-# Define logfile
+# Define tiles and COG directory and logfile
+tiles_dir = os.path.join(data_dir, '1_Tiles', country_name)
+cog_dir = os.path.join(clark_files, f"clark_{clark_year}_cog")
 time_logfile = data_dir  
 
-# ------ Processing data -----------
-start_time = time.time()
-
-# Load warnings for gdal
-gdal.UseExceptions()
-
-# List to hold virtual paths to .tif files inside zips
-tif_paths = []
-
-for file_name in os.listdir(clark_files):
-    if file_name.lower().endswith(".zip"):
-        zip_path = os.path.join(clark_files, file_name)
-        
-        with zipfile.ZipFile(zip_path, 'r') as z:
-            for member in z.namelist():
-                base_name = os.path.basename(member)
-                if base_name.endswith(f"_{clark_year}_v1exp.tif") or base_name.endswith(f"_{clark_year}_v2exp.tif"):
-                    vsizip_path = f"/vsizip/{zip_path}/{member}"
-                    tif_paths.append(vsizip_path)
-
-# Create VRT if we found matching files
-if tif_paths:
-    output_vrt = os.path.join(clark_files, "clark_data_global.vrt")
-    vrt_options = gdal.BuildVRTOptions(separate=False)
-    gdal.BuildVRT(output_vrt, tif_paths, options=vrt_options)
-    print(f"VRT created at: {output_vrt}")
-else:
-    print("No matching .tif files found inside the zips.")
-
-end_time = time.time()
-
-get_processing_time(start_time, end_time, time_logfile)
+# A VRT filtered to the tiles of the country is written per country, as the GMW VRTs of step 09,
+# so that the runs of other countries keep reading their own
+clark_vrt = os.path.join(clark_files, "clark_data_global.vrt")
+if vrt_footprint_filter:
+    clark_vrt = os.path.join(clark_files, country_name, "clark_data.vrt")
+    os.makedirs(os.path.dirname(clark_vrt), exist_ok=True)
+
+if __name__ == "__main__":
+    # ------ Processing data -----------
+    start_time = time.time()
+
+    # Load warnings for gdal
+    gdal.UseExceptions()
+
+    # List to hold paths to the .tif files (COGs or virtual paths inside zips)
+    tif_paths = []
+
+    for file_name in sorted(os.listdir(clark_files)):
+        if file_name.lower().endswith(".zip"):
+            zip_path = os.path.join(clark_files, file_name)
+
+            members = []
+            with zipfile.ZipFile(zip_path, 'r') as z:
+                for member in z.namelist():
+                    base_name = os.path.basename(member)
+                    if base_name.endswith(f"_{clark_year}_v1exp.tif") or base_name.endswith(f"_{clark_year}_v2exp.tif"):
+                        members.append(member)
+
+            if ingest_cog:
+                tif_paths.extend(ingest_zip(zip_path, members, cog_dir, n_workers))
+            else:
+                tif_paths.extend(f"/vsizip/{zip_path}/{member}" for member in members)
+
+    # Sources within the 10 km buffer of the tiles, the footprints of the sources are cached between runs
+    if vrt_footprint_filter:
+        footprints_cache = os.path.join(clark_files, "clark_data_global.footprints.json")
+        tif_paths = filter_sources_by_tiles(tif_paths, tiles_dir, 10000, footprints_cache, n_workers)
+
+    # Create VRT if we found matching files
+    if tif_paths:
+        vrt_options = gdal.BuildVRTOptions(separate=False)
+        gdal.BuildVRT(clark_vrt, tif_paths, options=vrt_options)
+        print(f"VRT created at: {clark_vrt}")
+    else:
+        print("No matching .tif files found inside the zips.")
+
+    end_time = time.time()
+
+    get_processing_time(start_time, end_time, time_logfile)
\ No newline at end of file
@@ -0,0 +1,282 @@
+import os
+import json
+import time
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from general_utilities import (
+    get_processing_time,
+    get_tile_paths,
+    process_tiles,
+    get_tile_id,
+    get_tile_bounds,
+    get_manifest_entry,
+    is_up_to_date,
+    write_manifest
+)
+from ras_utilities import (
+    CALCULATOR_NODATA,
+    get_tile_grid,
+    read_raster_to_grid,
+    resample_array_to_grid,
+    write_raster,
+    get_proximity_bands,
+    get_presence_score,
+    reclassify_array,
+    classify_intertidal_array,
+    get_accommodation_mapping,
+    clip_raster_to_geometry,
+    fill_extrapolation_array
+)
+
+# Load config from external file
+with open("config.json", "r") as f:
+    config = json.load(f)
+
+# Define inputs from config
+country_name = config["country_name"]
+data_dir = config["data_dir"]
+n_workers = config["n_workers"]
+incremental = config["incremental"]
+target_res_deg = config["target_res_deg"]  # Approximate 25 meters in degrees
+raster_write_options = config["raster_write_options"]  # compress, predictor, tiled and blocksize of fill_and_write
+vrt_footprint_filter = config["vrt_footprint_filter"]  # Step 02 only lists the sources that intersect the tiles of the run
+clark_files = config["clark_files"]
+clark_vrt = config["clark_vrt"]
+clark_multipliers = config["clark_multipliers"]
+deltadtm_vrt = config["deltadtm_vrt"]
+deltadtm_mangrove_correction = config["deltadtm_mangrove_correction"]
+intertidal_slr_correction = config["intertidal_slr_correction"]
+accommodation_multipliers = config["accommodation_multipliers"]
+gmw_years = config["gmw_years"]
+gmw_stack = config["gmw_stack"]
+historical_gmw_years = config["historical_gmw_years"]
+historical_gmw_multipliers = config["historical_gmw_multipliers"]
+recruitment_gmw_years = config["recruitment_gmw_years"]
+recruitment_gmw_multipliers = config["recruitment_gmw_multipliers"]
+gmw_last_year = config["gmw_last_year"]
+target_res_deg_for_seed_dispersal = config["target_res_deg_for_seed_dispersal"]  # resolution fo approx 100 m
+meters_per_pixel = target_res_deg_for_seed_dispersal * 111320  # Convert degrees to meters
+proximity_distances = config["proximity_distances"]
+proximity_gmw_multipliers = config["proximity_gmw_multipliers"]
+proximity_coastline_multipliers = config["proximity_coastline_multipliers"]
+proximity_rivers_multipliers = config["proximity_rivers_multipliers"]
+distance_bands_mode = config["distance_bands_mode"]  # "raster" or "vector"
+subsidence_data = {"2010": config["subsidence_data_2010"], "2040": config["subsidence_data_2040"]}
+subsidence_multipliers = {"2010": config["subsidence_multipliers_2010"], "2040": config["subsidence_multipliers_2040"]}
+permanent_water_vrt = config["permanent_water_vrt"]
+permanent_water_treshold = config["permanent_water_threshold"]
+fused_outputs = config["fused_outputs"]
+
+# Define tiles, input and output directories and logfile
+tiles_dir = os.path.join(data_dir, '1_Tiles', country_name)
+output_dirs = {
+    "PON": os.path.join(data_dir, '3_Clark_classification', country_name),
+    "ELE": os.path.join(data_dir, '7_Elevation', country_name),
+    "ACC": os.path.join(data_dir, '10_Accommodation_space', country_name),
+    "HIS": os.path.join(data_dir, '4_GMW', country_name),
+    "REC": os.path.join(data_dir, '4_GMW', country_name),
+    "SEE": os.path.join(data_dir, '4_GMW', country_name),
+    "PRR": os.path.join(data_dir, "6_Rivers", country_name),
+    "PRC": os.path.join(data_dir, "13_Coastline", country_name),
+    "SUB": os.path.join(data_dir, "12_Subsidence", country_name),
+    "WAT": os.path.join(data_dir, '14_Permanent_water', country_name),
+    "NVA": os.path.join(data_dir, '15_Mask', country_name),
+    "EMA": os.path.join(data_dir, '15_Mask', country_name),
+    "MPM": os.path.join(data_dir, '16_Mangrove_potential', country_name),
+}
+gmw_dir = os.path.join(data_dir, '4_GMW', country_name)
+tides_dir = os.path.join(data_dir, '8_Tides', country_name)
+coastline_dir = os.path.join(data_dir, "13_Coastline", country_name)
+rivers_dir = os.path.join(data_dir, "6_Rivers", country_name)
+urban_dir = os.path.join(data_dir, '11_Landcover', country_name)
+manifest_dir = os.path.join(data_dir, '0_Manifest', country_name)
+time_logfile = data_dir
+
+# VRT of step 02, per country when its sources are filtered to the tiles of the country
+if vrt_footprint_filter:
+    clark_vrt = os.path.join(clark_files, country_name, "clark_data.vrt")
+
+for product in fused_outputs:
+    os.makedirs(output_dirs[product], exist_ok=True)
+os.makedirs(manifest_dir, exist_ok=True)
+
+# Products whose step ends with fill_and_write: nodata filled with 0 and no nodata value.
+# The other products keep the raster calculator nodata, as written by their step.
+filled_products = ["PON", "WAT", "NVA", "EMA", "MPM"]
+
+# Config values that the fused products depend on
+fused_params = {k: config[k] for k in [
+    "target_res_deg", "clark_multipliers", "deltadtm_mangrove_correction", "intertidal_slr_correction",
+    "accommodation_multipliers", "gmw_years", "historical_gmw_years", "historical_gmw_multipliers",
+    "recruitment_gmw_years", "recruitment_gmw_multipliers", "gmw_last_year", "target_res_deg_for_seed_dispersal",
+    "proximity_distances", "proximity_gmw_multipliers", "proximity_coastline_multipliers",
+    "proximity_rivers_multipliers", "distance_bands_mode", "subsidence_multipliers_2010", "subsidence_multipliers_2040",
+    "permanent_water_threshold", "fused_outputs", "raster_write_options"
+]}
+
+def get_seed_dispersal(tile_id, grid):
+    # Steps 13 to 15: GMW last year at ~100 m in the 10 km buffered tile, dilation and normalization
+    buffer_path = os.path.join(tiles_dir, f"TIL_{tile_id}_10000.geojson")
+    buffer_grid = get_tile_grid(get_tile_bounds(buffer_path, rounding=False), target_res_deg_for_seed_dispersal)
+    gmw_vrt = os.path.join(gmw_dir, f"gmw_v3_{gmw_last_year}_gtiff.vrt")
+    rep = read_raster_to_grid(gmw_vrt, buffer_grid)
+
+    _, add = get_proximity_bands(rep, proximity_distances, meters_per_pixel)
+    cal = reclassify_array(add, proximity_gmw_multipliers).astype(np.float32)
+    return resample_array_to_grid(cal, buffer_grid.transform, buffer_grid.crs, grid)
+
+def get_distance_bands(files, multipliers, grid):
+    # Steps 17 and 18: files are ordered from largest to smallest buffer and the largest is mandatory
+    if not os.path.exists(files[0]):
+        return None
+    # A single ADC_ or ADR_ raster already holds the number of buffers
+    if distance_bands_mode == "raster":
+        return reclassify_array(read_raster_to_grid(files[0], grid), multipliers)
+    add = np.zeros((grid.height, grid.width), dtype=np.float64)
+    for band_file in files:
+        if not os.path.exists(band_file):
+            break
+        add += read_raster_to_grid(band_file, grid) == 1
+    return reclassify_array(add, multipliers)
+
+def get_subsidence(tile_path, grid):
+    # Steps 19 and 20: clip, extrapolate 50 pixels, normalize and combine 2010 and 2040 subsidence
+    tile_geometry = gpd.read_file(tile_path).geometry.iloc[0]
+    nor = {}
+    for year, subsidence_file in subsidence_data.items():
+        cli, transform, crs = clip_raster_to_geometry(subsidence_file, tile_geometry)
+        fil = fill_extrapolation_array(cli, 50)
+        nor[year] = np.ma.masked_array(reclassify_array(fil.data, subsidence_multipliers[year], scale=1), mask=fil.mask)
+    cal = ((nor["2010"] + nor["2040"]) / 200 + np.ma.maximum(nor["2010"], nor["2040"]) / 100) / 2
+    cal = cal.astype(np.float32).filled(CALCULATOR_NODATA)
+    return resample_array_to_grid(cal, transform, crs, grid)
+
+def fill_array(array, fill_value=0):
+    # fill_and_write on an in-memory product: nodata and non finite pixels get fill_value
+    array = np.asarray(array, dtype=np.float32)
+    return np.where(np.isfinite(array) & (array != np.float32(CALCULATOR_NODATA)), array, np.float32(fill_value))
+
+def process_tile(tile_path):
+    tile_id = get_tile_id(tile_path)
+    print(f"\n>>> Processing tile: {tile_id}")
+    tile_log = {"tile_id": tile_id, "up_to_date": False}
+
+    # Skip tile if all its products are up to date
+    gts_raster = os.path.join(tides_dir, f"GTS_{tile_id}.tif")
+    lan_raster = os.path.join(urban_dir, f"LAN_{tile_id}.tif")
+    if distance_bands_mode == "raster":
+        coastline_files = [os.path.join(coastline_dir, f"ADC_{tile_id}.tif")]
+        rivers_files = [os.path.join(rivers_dir, f"ADR_{tile_id}.tif")]
+    else:
+        coastline_files = [os.path.join(coastline_dir, f"COA_{tile_id}_{d}.tif") for d in [7500, 5000, 2500, 500]]
+        rivers_files = [os.path.join(rivers_dir, f"OVE_{tile_id}_{d}.tif") for d in [2500, 500, 250]]
+    gmw_vrts = [os.path.join(gmw_dir, f"gmw_v3_{year}_gtiff.vrt") for year in gmw_years]
+    gms_raster = os.path.join(gmw_dir, f"GMS_{tile_id}.tif")
+    inputs = ([__file__, tile_path, os.path.join(tiles_dir, f"TIL_{tile_id}_10000.geojson"), clark_vrt, deltadtm_vrt,
+               permanent_water_vrt, gts_raster, lan_raster, gms_raster] + list(subsidence_data.values())
+              + coastline_files + rivers_files + gmw_vrts)
+    outputs = [os.path.join(output_dirs[p], f"{p}_{tile_id}.tif") for p in fused_outputs]
+    manifest_entry = get_manifest_entry(inputs, fused_params)
+    if incremental and is_up_to_date(manifest_dir, "FUSED", tile_id, [p for p in outputs if os.path.exists(p)], manifest_entry):
+        print(f"✔ Up to date: {tile_id}")
+        tile_log["up_to_date"] = True
+        return tile_log
+
+    grid = get_tile_grid(get_tile_bounds(tile_path), target_res_deg)
+    products = {}
+
+    # Aquaculture ponds (step 03)
+    cla = read_raster_to_grid(clark_vrt, grid)
+    products["PON"] = reclassify_array(cla, clark_multipliers)
+
+    # Elevation (step 06)
+    cut = read_raster_to_grid(deltadtm_vrt, grid).astype(np.float64)
+    # float32 as the ELE_ raster that step 07 reads
+    products["ELE"] = (cut + products["PON"] / 10000).astype(np.float32)
+
+    # Intertidal and accommodation space (steps 07 and 08)
+    tile_log["GTS_exists"] = os.path.exists(gts_raster)
+    if tile_log["GTS_exists"]:
+        gts = read_raster_to_grid(gts_raster, grid, masked=True)
+        classes = classify_intertidal_array(products["ELE"].astype(np.float64), gts.data.astype(np.float64),
+                                            deltadtm_mangrove_correction, intertidal_slr_correction)
+        classes[np.ma.getmaskarray(gts)] = 0
+        products["ACC"] = reclassify_array(classes, get_accommodation_mapping(accommodation_multipliers))
+
+    # Historical and recruitment mangroves (steps 10 to 12)
+    # Read from the GMS stack of step 10 when available
+    gmw = {}
+    for band, (year, gmw_vrt) in enumerate(zip(gmw_years, gmw_vrts), start=1):
+        if gmw_stack and os.path.exists(gms_raster):
+            gmw[year] = read_raster_to_grid(gms_raster, grid, band=band)
+        else:
+            gmw[year] = read_raster_to_grid(gmw_vrt, grid)
+    products["HIS"] = get_presence_score(np.stack([gmw[y] for y in historical_gmw_years]), historical_gmw_years, historical_gmw_multipliers)
+    products["REC"] = get_presence_score(np.stack([gmw[y] for y in recruitment_gmw_years]), recruitment_gmw_years, recruitment_gmw_multipliers)
+
+    # Seed dispersal (steps 13 to 15)
+    products["SEE"] = get_seed_dispersal(tile_id, grid)
+
+    # Distance to coastline and rivers (steps 17 and 18), using the band rasters of step 16
+    prc = get_distance_bands(coastline_files, proximity_coastline_multipliers, grid)
+    prr = get_distance_bands(rivers_files, proximity_rivers_multipliers, grid)
+    tile_log["PRC_created"] = prc is not None
+    tile_log["PRR_created"] = prr is not None
+    if prc is not None:
+        products["PRC"] = prc
+    if prr is not None:
+        products["PRR"] = prr
+
+    # Subsidence (steps 19 and 20)
+    products["SUB"] = get_subsidence(tile_path, grid)
+
+    # Permanent water (step 22)
+    occurrence = read_raster_to_grid(permanent_water_vrt, grid)
+    products["WAT"] = ((occurrence > permanent_water_treshold) - products["PON"]) > 0
+
+    # No valid and empty areas (steps 23 and 24)
+    tile_log["LAN_exists"] = os.path.exists(lan_raster)
+    lan = read_raster_to_grid(lan_raster, grid) if tile_log["LAN_exists"] else 0
+    products["NVA"] = (gmw[gmw_last_year] + lan + products["WAT"]) > 0
+    products["EMA"] = np.zeros((grid.height, grid.width), dtype=np.float32)
+
+    # Mangrove potential (step 25), missing layers are replaced by the empty layer as in step 25
+    # The layers are rounded to float32 as step 25 reads them, and a nodata layer gives 0 after fill_and_write
+    layers = {k: np.asarray(products.get(k, products["EMA"]), dtype=np.float32)
+              for k in ["PON", "ACC", "HIS", "SEE", "PRR", "PRC", "SUB"]}
+    valid = np.all([layer != np.float32(CALCULATOR_NODATA) for layer in layers.values()], axis=0)
+    layers = {k: layer.astype(np.float64) for k, layer in layers.items()}
+    mpm = (layers["PON"] + layers["ACC"] + layers["HIS"] + layers["SEE"]
+           + np.maximum(layers["PRR"], layers["PRC"]) + layers["SUB"]) / 6
+    products["MPM"] = np.where(valid & (products["NVA"] == 0), mpm, 0)
+
+    # Write final products only
+    for product in fused_outputs:
+        if product in products:
+            output_raster = os.path.join(output_dirs[product], f"{product}_{tile_id}.tif")
+            if product in filled_products:
+                write_raster(fill_array(products[product]), grid, output_raster, nodata=None, **raster_write_options)
+            else:
+                write_raster(products[product], grid, output_raster)
+    tile_log["MPM_created"] = "MPM" in fused_outputs
+    write_manifest(manifest_dir, "FUSED", tile_id, [p for p in outputs if os.path.exists(p)], manifest_entry)
+
+    return tile_log
+
+if __name__ == "__main__":
+    # ------ Processing data -----------
+    start_time = time.time()
+
+    tile_paths = get_tile_paths(tiles_dir, '_0.geojson')
+    log = process_tiles(process_tile, tile_paths, n_workers)
+
+    # Save log
+    log_df = pd.DataFrame(log)
+    log_csv_path = os.path.join(output_dirs["MPM"], "FUSED.csv")
+    log_df.to_csv(log_csv_path, index=False)
+    print(f"Processing finished. Log saved to {log_csv_path}")
+
+    end_time = time.time()
+
+    get_processing_time(start_time, end_time, time_logfile)
@@ -1,20 +1,28 @@
 import os
 import json
-import glob
 import time
 from qgis_utilities import (
-    initialize_qgis, 
-    initialize_processing, 
-    get_projwin,
-    reproject_raster,
-    raster_calculator,
-    fill_and_compress
+    initialize_qgis_worker,
+    reproject_raster
 )
 from general_utilities import (
     get_processing_time,
+    get_tile_paths,
+    process_tiles,
+    get_manifest_entry,
+    is_up_to_date,
+    write_manifest,
     remove_temp_files,
     delete_xml_files
 )
+from ras_utilities import (
+    reclassify,
+    warp_raster,
+    get_catalog_tile_grid,
+    get_grid_bounds,
+    get_grid_projwin,
+    fill_and_write
+)
 
 # Load config from external file
 with open("config.json", "r") as f:
@@ -24,25 +32,30 @@ with open("config.json", "r") as f:
 qgis_env_path = config["qgis_env_path"]
 country_name = config["country_name"]
 data_dir = config["data_dir"]
+n_workers = config["n_workers"]
+incremental = config["incremental"]
+raster_write_options = config["raster_write_options"]  # compress, predictor, tiled and blocksize of fill_and_write
+warp_engine = config["warp_engine"]  # "rasterio" or "qgis"
+vrt_footprint_filter = config["vrt_footprint_filter"]  # Step 02 only lists the sources that intersect the tiles of the run
+clark_files = config["clark_files"]
 clark_vrt = config["clark_vrt"]
 multipliers = config["clark_multipliers"]
 target_res_deg = config["target_res_deg"]  # Approximate 25 meters in degrees
 
-# Initialize qgis
-qgs = initialize_qgis(qgis_env_path)
-initialize_processing()
-
 # Define tiles and output directory and logfile
 tiles_dir = os.path.join(data_dir, '1_Tiles', country_name)
 output_dir = os.path.join(data_dir, '3_Clark_classification', country_name)
+manifest_dir = os.path.join(data_dir, '0_Manifest', country_name)
 time_logfile = data_dir
 
-os.makedirs(output_dir, exist_ok=True)
+# VRT of step 02, per country when its sources are filtered to the tiles of the country
+if vrt_footprint_filter:
+    clark_vrt = os.path.join(clark_files, country_name, "clark_data.vrt")
 
-# ------ Processing data -----------
-start_time = time.time()
+os.makedirs(output_dir, exist_ok=True)
+os.makedirs(manifest_dir, exist_ok=True)
 
-for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
+def process_tile(tile_path):
     # Get tile id
     tile_id = os.path.basename(tile_path).replace("TIL_", "").replace("_0.geojson", "")
     print(f"\n>>> Processing tile: {tile_id}")
@@ -50,14 +63,22 @@ for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
     # Define intermediate and output file paths
     cla_raster = os.path.join(output_dir, f"CLA_{tile_id}.tif")
     bin_raster = os.path.join(output_dir, f"BIN_{tile_id}.tif")
-    fil_raster = os.path.join(output_dir, f"FIL_{tile_id}.tif")
     com_raster = os.path.join(output_dir, f"PON_{tile_id}.tif")
 
-    # Get bounding box of tile
-    projwin = get_projwin(tile_path)
+    # Skip tile if PON is up to date
+    manifest_entry = get_manifest_entry([__file__, tile_path, clark_vrt], {"clark_multipliers": multipliers, "target_res_deg": target_res_deg})
+    if incremental and is_up_to_date(manifest_dir, "PON", tile_id, [com_raster], manifest_entry):
+        print(f"✔ Up to date: {com_raster}")
+        return
 
-    # Clip and reproject raster
-    reproject_raster(clark_vrt, cla_raster, target_res_deg, projwin)
+    # Grid of the tile from the catalog, shared by all the products of the tile
+    grid = get_catalog_tile_grid(tile_path, target_res_deg)
+
+    # Clip and reproject raster, through the mosaic kept open in this worker with the rasterio engine
+    if warp_engine == "rasterio":
+        warp_raster(clark_vrt, cla_raster, target_res_deg, get_grid_bounds(grid))
+    else:
+        reproject_raster(clark_vrt, cla_raster, target_res_deg, get_grid_projwin(grid))
 
     # Normalize raster
     # expression = (
@@ -67,28 +88,34 @@ for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
     #     f'("CLA_{tile_id}@1" = 4) * 0 + '
     #     f'("CLA_{tile_id}@1" = 5) * 0) / 100' 
     # )
-    expr_terms = [
-        f'("CLA_{tile_id}@1" = {k}) * {v}'
-        for k, v in multipliers.items()
-    ]
-    expression = f'({" + ".join(expr_terms)}) / 100'
-    input_rasters = [cla_raster]
-    raster_calculator(expression, input_rasters, bin_raster)
+    reclassify(cla_raster, multipliers, bin_raster)
 
     # Fill no data and compress raster
-    fill_and_compress(bin_raster, fil_raster, com_raster, '')
+    fill_and_write(bin_raster, com_raster, **raster_write_options)
 
     print(f"✔ Saved: {com_raster}")
+    write_manifest(manifest_dir, "PON", tile_id, [com_raster], manifest_entry)
 
     # Remove intermediate files
-    remove_temp_files([cla_raster, bin_raster, fil_raster])
+    remove_temp_files([cla_raster, bin_raster])
+
+if __name__ == "__main__":
+    # ------ Processing data -----------
+    start_time = time.time()
+
+    tile_paths = get_tile_paths(tiles_dir, '_0.geojson')
+    # QGIS is only needed for the gdalwarp engine
+    if warp_engine == "rasterio":
+        process_tiles(process_tile, tile_paths, n_workers)
+    else:
+        process_tiles(process_tile, tile_paths, n_workers, initialize_qgis_worker, (qgis_env_path,))
 
-# Remove .xml files created by qgis when a files is opened
-delete_xml_files(output_dir)
+    # Remove .xml files created by qgis when a files is opened
+    delete_xml_files(output_dir)
 
-# Close qgis
-# qgs.exitQgis()
+    # Close qgis
+    # qgs.exitQgis()
 
-end_time = time.time()
+    end_time = time.time()
 
-get_processing_time(start_time, end_time, time_logfile)
\ No newline at end of file
+    get_processing_time(start_time, end_time, time_logfile)
\ No newline at end of file
@@ -1,20 +1,27 @@
 import os
 import json
-import glob
 import time
 from qgis_utilities import (
-    initialize_qgis, 
-    initialize_processing, 
-    get_projwin,
+    initialize_qgis_worker,
     get_voronoi_from_gtsm,
     rasterize_vector,
     compress_raster
 )
 from general_utilities import (
     get_processing_time,
+    get_tile_paths,
+    process_tiles,
+    get_manifest_entry,
+    is_up_to_date,
+    write_manifest,
     remove_temp_files,
     delete_xml_files
 )
+from ras_utilities import (
+    rasterize_nearest_points,
+    get_catalog_tile_grid,
+    get_grid_projwin
+)
 
 # Load config from external file
 with open("config.json", "r") as f:
@@ -24,38 +31,54 @@ with open("config.json", "r") as f:
 qgis_env_path = config["qgis_env_path"]
 country_name = config["country_name"]
 data_dir = config["data_dir"]
+n_workers = config["n_workers"]
+incremental = config["incremental"]
 gtsm_points = config["gtsm_points"]
 target_res_deg = config["target_res_deg"]  # Approximate 25 meters in degrees
-
-# Initialize qgis
-qgs = initialize_qgis(qgis_env_path)
-initialize_processing()
+gtsm_mode = config["gtsm_mode"]  # "nearest", "idw" or "voronoi"
+gtsm_idw_neighbours = config["gtsm_idw_neighbours"]
+gtsm_coarse_block = config["gtsm_coarse_block"]  # Nearest stations per block of pixels, refined near the boundaries (0 for every pixel)
 
 # Define tiles and output directory and logfile
 tiles_dir = os.path.join(data_dir, '1_Tiles', country_name)
 output_dir = os.path.join(data_dir, '8_Tides', country_name)
+manifest_dir = os.path.join(data_dir, '0_Manifest', country_name)
 time_logfile = data_dir
 
 os.makedirs(output_dir, exist_ok=True)
+os.makedirs(manifest_dir, exist_ok=True)
 
-# ------ Processing data -----------
-start_time = time.time()
-
-for tiles_path in glob.glob(os.path.join(tiles_dir, '*200000.geojson')):
+def process_tile(tiles_path):
     # Get tile id
     tile_id = os.path.basename(tiles_path).replace("TIL_", "").replace("_200000.geojson", "")
     print(f"\n>>> Processing tile: {tile_id}")
 
     # Define intermediate and output file paths
     til_vector = os.path.join(tiles_dir, f"TIL_{tile_id}_0.geojson")
-    gts_vector = os.path.join(output_dir, f"GTS_{tile_id}.geojson")
-    vor_vector = os.path.join(output_dir, f"VOR_{tile_id}.geojson")
-    cli_vector = os.path.join(output_dir, f"CLI_{tile_id}.geojson")
+    gts_vector = os.path.join(output_dir, f"GTS_{tile_id}.fgb")
+    vor_vector = os.path.join(output_dir, f"VOR_{tile_id}.fgb")
+    cli_vector = os.path.join(output_dir, f"CLI_{tile_id}.fgb")
     ras_raster = os.path.join(output_dir, f"RAS_{tile_id}.tif")
     gts_raster = os.path.join(output_dir, f"GTS_{tile_id}.tif")
 
-    # Get bounding box of tile
-    projwin = get_projwin(til_vector)
+    # Skip tile if GTS is up to date
+    params = {"target_res_deg": target_res_deg, "gtsm_mode": gtsm_mode}
+    if gtsm_mode == "idw":
+        params["gtsm_idw_neighbours"] = gtsm_idw_neighbours
+    manifest_entry = get_manifest_entry([__file__, til_vector, tiles_path, gtsm_points], params)
+    if incremental and is_up_to_date(manifest_dir, "GTS", tile_id, [gts_raster], manifest_entry):
+        print(f"✔ Up to date: {gts_raster}")
+        return
+
+    # Nearest station per pixel (the Voronoi polygons as a raster) or inverse distance weighting
+    if gtsm_mode != "voronoi":
+        neighbours = gtsm_idw_neighbours if gtsm_mode == "idw" else 1
+        rasterize_nearest_points(gtsm_points, 'HAT', tiles_path, til_vector, target_res_deg, gts_raster, neighbours, gtsm_coarse_block)
+        write_manifest(manifest_dir, "GTS", tile_id, [gts_raster], manifest_entry)
+        return
+
+    # Grid of the tile from the catalog, shared by all the products of the tile
+    projwin = get_grid_projwin(get_catalog_tile_grid(til_vector, target_res_deg))
 
     # Calculate voronoi polygons and clip to tile
     get_voronoi_from_gtsm(gtsm_points, tiles_path, til_vector, gts_vector, vor_vector, cli_vector)
@@ -67,16 +90,27 @@ for tiles_path in glob.glob(os.path.join(tiles_dir, '*200000.geojson')):
     compress_raster(ras_raster, gts_raster)
 
     print(f"✔ Saved outputs: {gts_raster}")
+    write_manifest(manifest_dir, "GTS", tile_id, [gts_raster], manifest_entry)
 
     # Remove intermediate files
     remove_temp_files([gts_vector, vor_vector, cli_vector, ras_raster])
 
-# Remove .xml files created by qgis when a files is opened
-delete_xml_files(output_dir)
+if __name__ == "__main__":
+    # ------ Processing data -----------
+    start_time = time.time()
+
+    tile_paths = get_tile_paths(tiles_dir, '_200000.geojson')
+    if gtsm_mode == "voronoi":
+        process_tiles(process_tile, tile_paths, n_workers, initialize_qgis_worker, (qgis_env_path,))
+    else:
+        process_tiles(process_tile, tile_paths, n_workers)
+
+    # Remove .xml files created by qgis when a files is opened
+    delete_xml_files(output_dir)
 
-# Close qgis
-# qgs.exitQgis()
+    # Close qgis
+    # qgs.exitQgis()
 
-end_time = time.time()
+    end_time = time.time()
 
-get_processing_time(start_time, end_time, time_logfile)
\ No newline at end of file
+    get_processing_time(start_time, end_time, time_logfile)
\ No newline at end of file
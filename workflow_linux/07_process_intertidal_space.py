@@ -1,19 +1,26 @@
 import os
 import json
-import glob
 import time
 from qgis_utilities import (
-    initialize_qgis, 
-    initialize_processing, 
+    initialize_qgis_worker,
     get_qgis_layer,
-    raster_calculator,
     fill_and_compress
 )
 from general_utilities import (
     get_processing_time,
+    get_tile_paths,
+    process_tiles,
+    get_manifest_entry,
+    is_up_to_date,
+    write_manifest,
     remove_temp_files,
     delete_xml_files
 )
+from ras_utilities import (
+    raster_calculator,
+    classify_intertidal,
+    get_accommodation_mapping
+)
 
 # Load config from external file
 with open("config.json", "r") as f:
@@ -23,26 +30,26 @@ with open("config.json", "r") as f:
 qgis_env_path = config["qgis_env_path"]
 country_name = config["country_name"]
 data_dir = config["data_dir"]
+n_workers = config["n_workers"]
+incremental = config["incremental"]
 deltadtm_mangrove_correction = config["deltadtm_mangrove_correction"]
 intertidal_slr_correction = config["intertidal_slr_correction"]
 target_res_deg = config["target_res_deg"]  # Approximate 25 meters in degrees
-
-# Initialize qgis
-qgs = initialize_qgis(qgis_env_path)
-initialize_processing()
+intertidal_mode = config["intertidal_mode"]  # "categorical" (INT_) or "binary" (MSL_, HAT_ and BEY_)
+intertidal_accommodation = config["intertidal_accommodation"]  # Write ACC_ instead of INT_ in categorical mode
+multipliers = config["accommodation_multipliers"]
 
 # Define tiles and output directory and logfile
 tides_dir = os.path.join(data_dir, '8_Tides', country_name)
 elevation_dir = os.path.join(data_dir, '7_Elevation', country_name)
 output_dir = os.path.join(data_dir, '10_Accommodation_space', country_name)
+manifest_dir = os.path.join(data_dir, '0_Manifest', country_name)
 time_logfile = data_dir
 
 os.makedirs(output_dir, exist_ok=True)
+os.makedirs(manifest_dir, exist_ok=True)
 
-# ------ Processing data -----------
-start_time = time.time()
-
-for tide_path in glob.glob(os.path.join(tides_dir, '*.tif')):
+def process_tile(tide_path):
     tide_id = os.path.basename(tide_path).replace("GTS_", "").replace(".tif", "")
     print(f"\n>>> Processing tile: {tide_id}")
 
@@ -56,10 +63,40 @@ for tide_path in glob.glob(os.path.join(tides_dir, '*.tif')):
     output_acc_compressed = os.path.join(output_dir, f"MSL_{tide_id}.tif")
     output_hat_compressed = os.path.join(output_dir, f"HAT_{tide_id}.tif")
     output_bey_compressed = os.path.join(output_dir, f"BEY_{tide_id}.tif")
+    output_int = os.path.join(output_dir, f"INT_{tide_id}.tif")
+    output_acc_direct = os.path.join(output_dir, f"ACC_{tide_id}.tif")
 
-    # Load rasters as layers with appropriate names
     tide_raster = tide_path
     elevation_raster = os.path.join(elevation_dir, f"ELE_{tide_id}.tif")
+    if intertidal_mode == "categorical" and intertidal_accommodation:
+        outputs = [output_acc_direct]
+    elif intertidal_mode == "categorical":
+        outputs = [output_int]
+    else:
+        outputs = [output_acc_compressed, output_hat_compressed, output_bey_compressed]
+
+    # Skip tile if INT is up to date
+    params = {"deltadtm_mangrove_correction": deltadtm_mangrove_correction, "intertidal_slr_correction": intertidal_slr_correction, "target_res_deg": target_res_deg, "intertidal_mode": intertidal_mode}
+    if intertidal_mode == "categorical" and intertidal_accommodation:
+        params["accommodation_multipliers"] = multipliers
+    manifest_entry = get_manifest_entry([__file__, tide_raster, elevation_raster], params)
+    if incremental and is_up_to_date(manifest_dir, "INT", tide_id, outputs, manifest_entry):
+        print(f"✔ Up to date: {outputs}")
+        return
+
+    # MSL, HAT and BEY classes in one pass over elevation and tide
+    # and straight to ACC_ when step 08 has nothing else to do with them
+    if intertidal_mode == "categorical" and intertidal_accommodation:
+        classify_intertidal(elevation_raster, tide_raster, output_acc_direct, deltadtm_mangrove_correction,
+                            intertidal_slr_correction, get_accommodation_mapping(multipliers))
+        write_manifest(manifest_dir, "INT", tide_id, outputs, manifest_entry)
+        return
+    if intertidal_mode == "categorical":
+        classify_intertidal(elevation_raster, tide_raster, output_int, deltadtm_mangrove_correction, intertidal_slr_correction)
+        write_manifest(manifest_dir, "INT", tide_id, outputs, manifest_entry)
+        return
+
+    # Load rasters as layers with appropriate names
     tide_name = f"GTS_{tide_id}"
     elevation_name = f"ELE_{tide_id}"
     elev_layer = get_qgis_layer(elevation_raster, elevation_name)
@@ -80,24 +117,35 @@ for tide_path in glob.glob(os.path.join(tides_dir, '*.tif')):
     bey_rasters = [elevation_raster, tide_raster]
     raster_calculator(bey_expression, bey_rasters, output_bey)
 
-    # Fill no data and compress rasters
-    fill_and_compress(output_acc, output_acc_filled, output_acc_compressed, f'-tr {target_res_deg} {target_res_deg}')
-    fill_and_compress(output_hat, output_hat_filled, output_hat_compressed, f'-tr {target_res_deg} {target_res_deg}')
-    fill_and_compress(output_bey, output_bey_filled, output_bey_compressed, f'-tr {target_res_deg} {target_res_deg}')
+    # Fill no data and compress rasters, ELE and GTS are on the catalog grid of the tile so no -tr resample is needed
+    fill_and_compress(output_acc, output_acc_filled, output_acc_compressed, '')
+    fill_and_compress(output_hat, output_hat_filled, output_hat_compressed, '')
+    fill_and_compress(output_bey, output_bey_filled, output_bey_compressed, '')
 
     print(f"✔ Saved outputs: {output_acc_compressed}, {output_hat_compressed}, {output_bey_compressed}")
+    write_manifest(manifest_dir, "INT", tide_id, outputs, manifest_entry)
 
     # Remove intermediate files
     remove_temp_files([output_acc, output_hat, output_bey, output_acc_filled, output_hat_filled, output_bey_filled])
 
-# Remove .xml files created by qgis when a files is opened
-path_list = [output_dir, elevation_dir, tides_dir]
-for path in path_list:
-    delete_xml_files(path)
+if __name__ == "__main__":
+    # ------ Processing data -----------
+    start_time = time.time()
+
+    tide_paths = get_tile_paths(tides_dir, '.tif')
+    if intertidal_mode == "categorical":
+        process_tiles(process_tile, tide_paths, n_workers)
+    else:
+        process_tiles(process_tile, tide_paths, n_workers, initialize_qgis_worker, (qgis_env_path,))
+
+    # Remove .xml files created by qgis when a files is opened
+    path_list = [output_dir, elevation_dir, tides_dir]
+    for path in path_list:
+        delete_xml_files(path)
 
-# Close qgis
-# qgs.exitQgis()
+    # Close qgis
+    # qgs.exitQgis()
 
-end_time = time.time()
+    end_time = time.time()
 
-get_processing_time(start_time, end_time, time_logfile)
\ No newline at end of file
+    get_processing_time(start_time, end_time, time_logfile)
\ No newline at end of file
@@ -1,20 +1,27 @@
 import os
 import json
-import glob
 import time
 from qgis_utilities import (
-    initialize_qgis, 
-    initialize_processing, 
+    initialize_qgis_worker,
     get_qgis_layer,
-    get_projwin,
-    raster_calculator,
     compress_raster
 )
 from general_utilities import (
     get_processing_time,
+    get_tile_projwin,
+    get_tile_paths,
+    process_tiles,
+    get_manifest_entry,
+    is_up_to_date,
+    write_manifest,
     remove_temp_files,
     delete_xml_files
 )
+from ras_utilities import (
+    raster_calculator,
+    reclassify,
+    get_accommodation_mapping
+)
 
 # Load config from external file
 with open("config.json", "r") as f:
@@ -24,21 +31,21 @@ with open("config.json", "r") as f:
 qgis_env_path = config["qgis_env_path"]
 country_name = config["country_name"]
 data_dir = config["data_dir"]
+n_workers = config["n_workers"]
+incremental = config["incremental"]
 multipliers = config["accommodation_multipliers"]
-
-# Initialize qgis
-qgs = initialize_qgis(qgis_env_path)
-initialize_processing()
+intertidal_mode = config["intertidal_mode"]  # "categorical" (INT_) or "binary" (MSL_, HAT_ and BEY_)
+intertidal_accommodation = config["intertidal_accommodation"]  # ACC_ written by step 07 in categorical mode
 
 # Define tiles and output directory and logfile
 tiles_dir = os.path.join(data_dir, '1_Tiles', country_name)
 acc_dir = os.path.join(data_dir, '10_Accommodation_space', country_name)
+manifest_dir = os.path.join(data_dir, '0_Manifest', country_name)
 time_logfile = data_dir
 
-# ------ Processing data -----------
-start_time = time.time()
+os.makedirs(manifest_dir, exist_ok=True)
 
-for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
+def process_tile(tile_path):
     tile_id = os.path.basename(tile_path).replace("TIL_", "").replace("_0.geojson", "")
     print(f"\n>>> Processing tile: {tile_id}")
 
@@ -49,6 +56,22 @@ for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
     unc_path = os.path.join(acc_dir, f"UNC_{tile_id}.tif")
     cal_path = os.path.join(acc_dir, f"CAL_{tile_id}.tif")
     acc_path = os.path.join(acc_dir, f"ACC_{tile_id}.tif")
+    int_path = os.path.join(acc_dir, f"INT_{tile_id}.tif")
+
+    # Skip tile if ACC is up to date
+    inputs = [__file__, int_path] if intertidal_mode == "categorical" else [__file__, msl_path, bey_path]
+    manifest_entry = get_manifest_entry(inputs, {"accommodation_multipliers": multipliers, "intertidal_mode": intertidal_mode})
+    if incremental and is_up_to_date(manifest_dir, "ACC", tile_id, [acc_path], manifest_entry):
+        print(f"✔ Up to date: {acc_path}")
+        return
+
+    # The intertidal classes map to MSL * 2 + BEY, the values of the multipliers
+    if intertidal_mode == "categorical":
+        reclassify(int_path, get_accommodation_mapping(multipliers), acc_path)
+        write_manifest(manifest_dir, "ACC", tile_id, [acc_path], manifest_entry)
+        if not incremental:
+            remove_temp_files([int_path])
+        return
 
     # Layer names
     bey_name = f"BEY_{tile_id}"
@@ -65,7 +88,7 @@ for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
     print("✅ All raster layers loaded successfully.")
 
     # Get bounding box of tile
-    projwin = get_projwin(tile_path)
+    projwin = get_tile_projwin(tile_path)
 
     # Combine layers from MSL - HAT and HAT + 1m
     expression = (
@@ -80,28 +103,39 @@ for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
     #     f'(("{unc_name}@1" = 2) * 100 + ' Highest score to intertidal zone
     #     f'("{unc_name}@1" = 1) * 25) / 100'
     # )
-    expr_terms = [
-        f'("{unc_name}@1" = {k}) * {v}'
-        for k, v in multipliers.items()
-    ]
-    expression = f'({" + ".join(expr_terms)}) / 100'
-    input_rasters = [unc_path]
-    raster_calculator(expression, input_rasters, cal_path)
+    reclassify(unc_path, multipliers, cal_path)
 
     # Compress raster
     compress_raster(cal_path, acc_path)
+    write_manifest(manifest_dir, "ACC", tile_id, [acc_path], manifest_entry)
 
     # Remove intermediate files
-    remove_temp_files([bey_path, hat_path, msl_path, unc_path, cal_path])
+    remove_temp_files([unc_path, cal_path])
+
+    # Keep the outputs of step 07 in incremental mode, so it can skip this tile on re-runs
+    if not incremental:
+        remove_temp_files([bey_path, hat_path, msl_path])
+
+if __name__ == "__main__":
+    # ------ Processing data -----------
+    start_time = time.time()
+
+    tile_paths = get_tile_paths(tiles_dir, '_0.geojson')
+    if intertidal_mode == "categorical" and intertidal_accommodation:
+        print("✔ ACC_ rasters already written by 07_process_intertidal_space.py")
+    elif intertidal_mode == "categorical":
+        process_tiles(process_tile, tile_paths, n_workers)
+    else:
+        process_tiles(process_tile, tile_paths, n_workers, initialize_qgis_worker, (qgis_env_path,))
 
-# Remove .xml files created by qgis when a files is opened
-path_list = [acc_dir]
-for path in path_list:
-    delete_xml_files(path)
+    # Remove .xml files created by qgis when a files is opened
+    path_list = [acc_dir]
+    for path in path_list:
+        delete_xml_files(path)
 
-# Close qgis
-# qgs.exitQgis()
+    # Close qgis
+    # qgs.exitQgis()
 
-end_time = time.time()
+    end_time = time.time()
 
-get_processing_time(start_time, end_time, time_logfile)
\ No newline at end of file
+    get_processing_time(start_time, end_time, time_logfile)
\ No newline at end of file
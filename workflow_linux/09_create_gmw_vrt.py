@@ -5,6 +5,11 @@ import zipfile
 from osgeo import gdal
 from general_utilities import (
     get_processing_time,
+    process_tiles
+)
+from ras_utilities import (
+    ingest_zip,
+    filter_sources_by_tiles
 )
 
 # Load config from external file
@@ -14,7 +19,10 @@ with open("config.json", "r") as f:
 # Define inputs from config
 country_name = config["country_name"]
 data_dir = config["data_dir"]
+n_workers = config["n_workers"]
 gmw_years = config["gmw_years"]
+ingest_cog = config["ingest_cog"]  # Extract the zip members once into COGs instead of reading through /vsizip/
+vrt_footprint_filter = config["vrt_footprint_filter"]  # Only list the sources that intersect the tiles of the run
 
 # Define directories and logfile
 tiles_dir = os.path.join(data_dir, '1_Tiles', country_name)
@@ -23,24 +31,34 @@ time_logfile = data_dir
 
 os.makedirs(output_dir, exist_ok=True)
 
-# ------ Processing data -----------
-start_time = time.time()
-
 # Load warnings for gdal
 gdal.UseExceptions()
 
-for year in gmw_years:
+def get_gmw_zip(year):
+    return os.path.join(data_dir,'4_GMW',f'gmw_v3_{year}_gtiff.zip')
+
+def get_gmw_members(zip_path):
+    with zipfile.ZipFile(zip_path, 'r') as z:
+        return [member for member in z.namelist() if member.lower().endswith(".tif")]
+
+def build_gmw_vrt(year):
     print(f"\n>>> Processing year: {year}")
 
-    tif_paths = []
-    zip_path = os.path.join(data_dir,'4_GMW',f'gmw_v3_{year}_gtiff.zip')
+    zip_path = get_gmw_zip(year)
     print("Reading zip file:", zip_path)
 
-    with zipfile.ZipFile(zip_path, 'r') as z:
-        for member in z.namelist():
-            base_name = os.path.basename(member)
-            vsizip_path = f"/vsizip/{zip_path}/{member}"
-            tif_paths.append(vsizip_path)
+    # The COGs are shared by all countries, only the VRT is written per country
+    members = get_gmw_members(zip_path)
+    if ingest_cog:
+        cog_dir = os.path.join(data_dir, '4_GMW', f'gmw_v3_{year}_cog')
+        tif_paths = [os.path.join(cog_dir, os.path.basename(member)) for member in members]
+    else:
+        tif_paths = [f"/vsizip/{zip_path}/{member}" for member in members]
+
+    # Sources within the 10 km buffer of the tiles, the largest extent read from the GMW mosaics
+    if vrt_footprint_filter:
+        footprints_cache = os.path.join(data_dir, '4_GMW', f'gmw_v3_{year}_gtiff.footprints.json')
+        tif_paths = filter_sources_by_tiles(tif_paths, tiles_dir, 10000, footprints_cache)
 
     # Create VRT if we found matching files
     if tif_paths:
@@ -51,6 +69,20 @@ for year in gmw_years:
     else:
         print("No matching .tif files found inside the zips.")
 
-end_time = time.time()
+if __name__ == "__main__":
+    # ------ Processing data -----------
+    start_time = time.time()
+
+    # Convert the archives first, each one with all the workers
+    if ingest_cog:
+        for year in gmw_years:
+            zip_path = get_gmw_zip(year)
+            cog_dir = os.path.join(data_dir, '4_GMW', f'gmw_v3_{year}_cog')
+            ingest_zip(zip_path, get_gmw_members(zip_path), cog_dir, n_workers)
+
+    # One VRT per year, built concurrently
+    process_tiles(build_gmw_vrt, gmw_years, n_workers)
+
+    end_time = time.time()
 
-get_processing_time(start_time, end_time, time_logfile)
\ No newline at end of file
+    get_processing_time(start_time, end_time, time_logfile)
\ No newline at end of file
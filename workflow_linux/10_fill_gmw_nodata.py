@@ -1,18 +1,26 @@
 import os
 import json
-import glob
 import time
 from qgis_utilities import (
-    initialize_qgis, 
-    initialize_processing, 
-    get_projwin,
-    reproject_raster,
-    fill_and_compress
+    initialize_qgis_worker,
+    reproject_raster
 )
 from general_utilities import (
     get_processing_time,
+    get_tile_projwin,
+    get_tile_paths,
+    process_tiles,
+    get_manifest_entry,
+    is_up_to_date,
+    write_manifest,
     remove_temp_files,
-    delete_xml_files
+    delete_xml_files,
+    get_tile_bounds
+)
+from ras_utilities import (
+    write_raster_stack,
+    warp_raster,
+    fill_and_write
 )
 
 # Load config from external file
@@ -23,53 +31,89 @@ with open("config.json", "r") as f:
 qgis_env_path = config["qgis_env_path"]
 country_name = config["country_name"]
 data_dir = config["data_dir"]
+n_workers = config["n_workers"]
+incremental = config["incremental"]
+raster_write_options = config["raster_write_options"]  # compress, predictor, tiled and blocksize of fill_and_write
+warp_engine = config["warp_engine"]  # "rasterio" or "qgis"
 gmw_years = config["gmw_years"]
-
-# Initialize qgis
-qgs = initialize_qgis(qgis_env_path)
-initialize_processing()
+gmw_stack = config["gmw_stack"]
 
 # Define tiles and output directory and logfile
 tiles_dir = os.path.join(data_dir, '1_Tiles', country_name)
 output_dir = os.path.join(data_dir, '4_GMW', country_name)
+manifest_dir = os.path.join(data_dir, '0_Manifest', country_name)
 time_logfile = data_dir
 
 os.makedirs(output_dir, exist_ok=True)
+os.makedirs(manifest_dir, exist_ok=True)
 
-# ------ Processing data -----------
-start_time = time.time()
+def process_tile(tile_path):
+    # Get tile id
+    tile_id = os.path.basename(tile_path).replace("TIL_", "").replace("_0.geojson", "")
+    print(f"\n>>> Processing tile: {tile_id}")
 
-for year in gmw_years:
-    print(f"\n>>> Processing year: {year}")
+    if gmw_stack:
+        process_tile_stack(tile_path, tile_id)
+        return
 
-    for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
-        # Get tile id
-        tile_id = os.path.basename(tile_path).replace("TIL_", "").replace("_0.geojson", "")
-        print(f"\n>>> Processing tile: {tile_id}")
+    for year in gmw_years:
+        print(f"\n>>> Processing year: {year}")
 
         gmw_vrt = os.path.join(output_dir,f"gmw_v3_{year}_gtiff.vrt")
         rep_raster = os.path.join(output_dir, f"REP_{tile_id}_{year}.tif")
-        fil_raster = os.path.join(output_dir, f"FIL_{tile_id}_{year}.tif")
         com_raster = os.path.join(output_dir, f"GMW_{tile_id}_{year}.tif")
 
-        # Get bounding box of tile
-        projwin = get_projwin(tile_path)
+        # Skip year if GMW is up to date
+        manifest_entry = get_manifest_entry([__file__, tile_path, gmw_vrt], {})
+        if incremental and is_up_to_date(manifest_dir, f"GMW_{year}", tile_id, [com_raster], manifest_entry):
+            print(f"✔ Up to date: {com_raster}")
+            continue
 
-        # Clip and reproject raster
-        reproject_raster(gmw_vrt, rep_raster, None, projwin)
+        # Clip and reproject raster, through the mosaic kept open in this worker with the rasterio engine
+        if warp_engine == "rasterio":
+            warp_raster(gmw_vrt, rep_raster, None, get_tile_bounds(tile_path))
+        else:
+            projwin = get_tile_projwin(tile_path)
+            reproject_raster(gmw_vrt, rep_raster, None, projwin)
 
         # Fill no data and compress rasters
-        fill_and_compress(rep_raster, fil_raster, com_raster, '')
+        fill_and_write(rep_raster, com_raster, **raster_write_options)
+        write_manifest(manifest_dir, f"GMW_{year}", tile_id, [com_raster], manifest_entry)
 
         # Remove intermediate files
-        remove_temp_files([rep_raster, fil_raster])
+        remove_temp_files([rep_raster])
+
+def process_tile_stack(tile_path, tile_id):
+    # Read all yearly GMW vrts once for the tile window and write them as one band per year
+    gmw_vrts = [os.path.join(output_dir, f"gmw_v3_{year}_gtiff.vrt") for year in gmw_years]
+    gms_raster = os.path.join(output_dir, f"GMS_{tile_id}.tif")
+
+    # Skip tile if GMS is up to date
+    manifest_entry = get_manifest_entry([__file__, tile_path] + gmw_vrts, {"gmw_years": gmw_years})
+    if incremental and is_up_to_date(manifest_dir, "GMS", tile_id, [gms_raster], manifest_entry):
+        print(f"✔ Up to date: {gms_raster}")
+        return
+
+    write_raster_stack(gmw_vrts, get_tile_bounds(tile_path), gms_raster, band_names=gmw_years)
+    write_manifest(manifest_dir, "GMS", tile_id, [gms_raster], manifest_entry)
+
+if __name__ == "__main__":
+    # ------ Processing data -----------
+    start_time = time.time()
+
+    tile_paths = get_tile_paths(tiles_dir, '_0.geojson')
+    # QGIS is only needed for the gdalwarp engine
+    if warp_engine == "rasterio":
+        process_tiles(process_tile, tile_paths, n_workers)
+    else:
+        process_tiles(process_tile, tile_paths, n_workers, initialize_qgis_worker, (qgis_env_path,))
 
-# Remove .xml files created by qgis when a files is opened
-delete_xml_files(output_dir)
+    # Remove .xml files created by qgis when a files is opened
+    delete_xml_files(output_dir)
 
-# Close qgis
-# qgs.exitQgis()
+    # Close qgis
+    # qgs.exitQgis()
 
-end_time = time.time()
+    end_time = time.time()
 
-get_processing_time(start_time, end_time, time_logfile)
\ No newline at end of file
+    get_processing_time(start_time, end_time, time_logfile)
\ No newline at end of file
@@ -1,18 +1,19 @@
 import os
 import json
-import glob
 import time
-from qgis_utilities import (
-    initialize_qgis, 
-    initialize_processing, 
-    get_qgis_layer,
-    raster_calculator,
-    compress_raster
-)
 from general_utilities import (
     get_processing_time,
-    remove_temp_files,
-    delete_xml_files
+    get_tile_paths,
+    process_tiles,
+    get_manifest_entry,
+    is_up_to_date,
+    write_manifest,
+    remove_temp_files
+)
+from ras_utilities import (
+    read_raster_bands,
+    get_presence_score,
+    write_raster
 )
 
 # Load config from external file
@@ -20,97 +21,49 @@ with open("config.json", "r") as f:
     config = json.load(f)
 
 # Define inputs from config
-qgis_env_path = config["qgis_env_path"]
 country_name = config["country_name"]
 data_dir = config["data_dir"]
+n_workers = config["n_workers"]
+incremental = config["incremental"]
 gmw_years = config["recruitment_gmw_years"]
+all_gmw_years = config["gmw_years"]  # Band order of the GMS stack of step 10
+gmw_stack = config["gmw_stack"]
 multipliers = config["recruitment_gmw_multipliers"]
 
-# Initialize qgis
-qgs = initialize_qgis(qgis_env_path)
-initialize_processing()
-
 # Define tiles and output directory and logfile
 tiles_dir = os.path.join(data_dir, '1_Tiles', country_name)
 gmw_dir = os.path.join(data_dir, '4_GMW', country_name)
+manifest_dir = os.path.join(data_dir, '0_Manifest', country_name)
 time_logfile = data_dir
 
-# ------ Processing data -----------
-start_time = time.time()
+os.makedirs(manifest_dir, exist_ok=True)
 
-for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
+def process_tile(tile_path):
     # Get tile id
     tile_id = os.path.basename(tile_path).replace("TIL_", "").replace("_0.geojson", "")
     print(f"\n>>> Processing tile: {tile_id}")
 
-    exp_raster = os.path.join(gmw_dir, f"EXP_{tile_id}.tif")
-    cal_raster = os.path.join(gmw_dir, f"CAL_{tile_id}.tif")
     nor_raster = os.path.join(gmw_dir, f"REC_{tile_id}.tif")
 
-    # Load gmw rasters
-    raster_info = {}
-    for year in gmw_years:
-        fil_name = f"GMW_{tile_id}_{year}"
-        fil_raster = os.path.join(gmw_dir, f"{fil_name}.tif")
-        fil_layer = get_qgis_layer(fil_raster, fil_name)
-
-        raster_info[year] = {
-            "fil_name": fil_name,
-            "fil_raster": fil_raster,
-            "fil_layer": fil_layer
-        }
-
-    print("✅ All raster layers loaded successfully.")
-
-    # Compute expression historical mangroves
-    expression_parts = []
-    layers_to_use = []
-
-    for i, year in enumerate(gmw_years):
-        current = raster_info[year]["fil_name"]
-        current_layer = raster_info[year]["fil_layer"]
-        layers_to_use.append(current_layer)
-
-        # Mask: ensure the pixel is not mangrove in any *later* years
-        later_years = gmw_years[i + 1:]
-        mask_conditions = [f'("{raster_info[y]["fil_name"]}@1" != 1)' for y in later_years]
-        mask_expr = " * ".join(mask_conditions)
-
-        expr = f'("{current}@1" = 1) * {year}'
-        if mask_expr:
-            expr += f' * {mask_expr}'
-
-        expression_parts.append(expr)
-
-    final_expr = " +\n".join(expression_parts)
-    print(f"📐 Raster calculator expression:\n{final_expr}")
-    raster_calculator(final_expr, layers_to_use, exp_raster)
-
-    # Normalizing layer
-    exp_name = f"EXP_{tile_id}"
-    # expression = (
-    #     f'(("{exp_name}@1" = 1996) * 0 + '
-    #     f'("{exp_name}@1" = 2007) * 36 + '
-    #     f'("{exp_name}@1" = 2008) * 40 + '
-    #     f'("{exp_name}@1" = 2009) * 45 + '
-    #     f'("{exp_name}@1" = 2010) * 49 + '
-    #     f'("{exp_name}@1" = 2015) * 70 + '
-    #     f'("{exp_name}@1" = 2016) * 75 + '
-    #     f'("{exp_name}@1" = 2017) * 79 + '
-    #     f'("{exp_name}@1" = 2018) * 83 + '
-    #     f'("{exp_name}@1" = 2019) * 87 + '
-    #     f'("{exp_name}@1" = 2020) * 100) / 100'
-    # )
-    expr_terms = [
-        f'("{exp_name}@1" = {year}) * {multiplier}'
-        for year, multiplier in multipliers.items()
-    ]
-    expression = f'({" + ".join(expr_terms)}) / 100'
-    input_rasters = [exp_raster]
-    raster_calculator(expression, input_rasters, cal_raster)
-
-    # Compress raster
-    compress_raster(cal_raster, nor_raster)
+    # GMW bands in the order of gmw_years (one band per year when using the GMS stack of step 10)
+    if gmw_stack:
+        gmw_bands = [(os.path.join(gmw_dir, f"GMS_{tile_id}.tif"), all_gmw_years.index(year) + 1) for year in gmw_years]
+    else:
+        gmw_bands = [(os.path.join(gmw_dir, f"GMW_{tile_id}_{year}.tif"), 1) for year in gmw_years]
+    gmw_rasters = list(dict.fromkeys(raster for raster, _ in gmw_bands))
+
+    # Skip tile if REC is up to date
+    manifest_entry = get_manifest_entry([__file__] + gmw_rasters, {"recruitment_gmw_years": gmw_years, "recruitment_gmw_multipliers": multipliers})
+    if incremental and is_up_to_date(manifest_dir, "REC", tile_id, [nor_raster], manifest_entry):
+        print(f"✔ Up to date: {nor_raster}")
+        return
+
+    # Last year in gmw_years order (the first one, as the years are in descending order) where the
+    # pixel is mangrove, normalized with the multipliers, in one pass over the year stack
+    gmw_stack_array, grid = read_raster_bands(gmw_bands)
+    score = get_presence_score(gmw_stack_array, gmw_years, multipliers)
+    write_raster(score, grid, nor_raster)
+    write_manifest(manifest_dir, "REC", tile_id, [nor_raster], manifest_entry)
 
     # Remove intermediate files
     rasters_to_remove = []
@@ -119,14 +72,18 @@ for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
             fil_raster = os.path.join(gmw_dir, f"GMW_{tile_id}_{year}.tif")
             rasters_to_remove.append(fil_raster)
 
-    remove_temp_files([exp_raster, cal_raster] + rasters_to_remove)
+    # Keep the outputs of step 10 in incremental mode, so it can skip this tile on re-runs
+    # The GMS stack is always kept, steps 23 and 24 read the 2020 band from it
+    if not incremental and not gmw_stack:
+        remove_temp_files(rasters_to_remove)
 
-# Remove .xml files created by qgis when a files is opened
-delete_xml_files(gmw_dir)
+if __name__ == "__main__":
+    # ------ Processing data -----------
+    start_time = time.time()
 
-# Close qgis
-# qgs.exitQgis()
+    tile_paths = get_tile_paths(tiles_dir, '_0.geojson')
+    process_tiles(process_tile, tile_paths, n_workers)
 
-end_time = time.time()
+    end_time = time.time()
 
-get_processing_time(start_time, end_time, time_logfile)
\ No newline at end of file
+    get_processing_time(start_time, end_time, time_logfile)
\ No newline at end of file
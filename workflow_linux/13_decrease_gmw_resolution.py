@@ -1,19 +1,27 @@
 import os
 import json
-import glob
 import time
 from qgis_utilities import (
-    initialize_qgis, 
-    initialize_processing, 
-    get_projwin,
-    reproject_raster,
-    fill_and_compress
+    initialize_qgis_worker,
+    reproject_raster
 )
 from general_utilities import (
     get_processing_time,
+    get_tile_paths,
+    process_tiles,
+    get_tile_id,
+    get_tile_bounds,
+    get_snapped_bounds,
+    get_manifest_entry,
+    is_up_to_date,
+    write_manifest,
     remove_temp_files,
     delete_xml_files
 )
+from ras_utilities import (
+    warp_raster,
+    fill_and_write
+)
 
 # Load config from external file
 with open("config.json", "r") as f:
@@ -23,54 +31,81 @@ with open("config.json", "r") as f:
 qgis_env_path = config["qgis_env_path"]
 country_name = config["country_name"]
 data_dir = config["data_dir"]
+n_workers = config["n_workers"]
+incremental = config["incremental"]
+raster_write_options = config["raster_write_options"]  # compress, predictor, tiled and blocksize of fill_and_write
+warp_engine = config["warp_engine"]  # "rasterio" or "qgis"
 gmw_last_year = config["gmw_last_year"]
 target_res_deg_for_seed_dispersal = config["target_res_deg_for_seed_dispersal"] # resolution fo approx 100 m
-
-# Initialize qgis
-qgs = initialize_qgis(qgis_env_path)
-initialize_processing()
+proximity_halo_mode = config["proximity_halo_mode"]  # "vrt" or "buffer"
 
 # Define tiles and output directory and logfile
 tiles_dir = os.path.join(data_dir, '1_Tiles', country_name)
 gmw_vrt =  os.path.join(data_dir, '4_GMW', country_name, fr"gmw_v3_{gmw_last_year}_gtiff.vrt")
 output_dir = os.path.join(data_dir , '4_GMW', country_name)
+manifest_dir = os.path.join(data_dir, '0_Manifest', country_name)
 time_logfile = data_dir
 
 os.makedirs(output_dir, exist_ok=True)
+os.makedirs(manifest_dir, exist_ok=True)
 
-# ------ Processing data -----------
-start_time = time.time()
+# With neighbour halos (step 14) only the tile itself is warped, otherwise its 10 km buffer
+tile_suffix = "_0.geojson" if proximity_halo_mode == "vrt" else "_10000.geojson"
 
-for tile_path in glob.glob(os.path.join(tiles_dir, '*_10000.geojson')):
+def process_tile(tile_path):
     # Get tile id
-    tile_id = os.path.basename(tile_path).replace("TIL_", "").replace("_10000.geojson", "")
+    tile_id = get_tile_id(tile_path, tile_suffix)
     print(f"\n>>> Processing tile: {tile_id}")
 
     # Define intermediate and output file paths
     cli_raster = os.path.join(output_dir, f"CLI_{tile_id}.tif")
-    fil_raster = os.path.join(output_dir, f"FIL_{tile_id}.tif")
     rep_raster = os.path.join(output_dir, f"REP_{tile_id}.tif")
 
-    # Get bounding box of tile
-    projwin = get_projwin(tile_path, rounding=False)
-
-    # Clip and reproject raster
-    reproject_raster(gmw_vrt, cli_raster, target_res_deg_for_seed_dispersal, projwin)
+    # Skip tile if REP is up to date
+    manifest_entry = get_manifest_entry([__file__, tile_path, gmw_vrt], {"target_res_deg_for_seed_dispersal": target_res_deg_for_seed_dispersal, "proximity_halo_mode": proximity_halo_mode})
+    if incremental and is_up_to_date(manifest_dir, "REP", tile_id, [rep_raster], manifest_entry):
+        print(f"✔ Up to date: {rep_raster}")
+        return
+
+    # Get bounding box of tile, snapped to a global grid so that neighbouring tiles line up in the mosaic of step 14
+    bounds = get_tile_bounds(tile_path, rounding=False)
+    if proximity_halo_mode == "vrt":
+        bounds = get_snapped_bounds(bounds, target_res_deg_for_seed_dispersal)
+
+    # Clip and reproject raster, through the mosaic kept open in this worker with the rasterio engine
+    if warp_engine == "rasterio":
+        warp_raster(gmw_vrt, cli_raster, target_res_deg_for_seed_dispersal, bounds)
+    else:
+        xmin, ymin, xmax, ymax = bounds
+        projwin = f"{xmin},{xmax},{ymax},{ymin} [EPSG:4326]"
+        reproject_raster(gmw_vrt, cli_raster, target_res_deg_for_seed_dispersal, projwin)
 
     # Fill and compress raster
-    fill_and_compress(cli_raster, fil_raster, rep_raster,'')
+    fill_and_write(cli_raster, rep_raster, **raster_write_options)
 
     print(f"✔ Saved outputs: {rep_raster}")
+    write_manifest(manifest_dir, "REP", tile_id, [rep_raster], manifest_entry)
 
     # Remove intermediate files
-    remove_temp_files([cli_raster, fil_raster])
+    remove_temp_files([cli_raster])
+
+if __name__ == "__main__":
+    # ------ Processing data -----------
+    start_time = time.time()
+
+    tile_paths = get_tile_paths(tiles_dir, tile_suffix)
+    # QGIS is only needed for the gdalwarp engine
+    if warp_engine == "rasterio":
+        process_tiles(process_tile, tile_paths, n_workers)
+    else:
+        process_tiles(process_tile, tile_paths, n_workers, initialize_qgis_worker, (qgis_env_path,))
 
-# Remove .xml files created by qgis when a files is opened
-delete_xml_files(output_dir)
+    # Remove .xml files created by qgis when a files is opened
+    delete_xml_files(output_dir)
 
-# Close qgis
-# qgs.exitQgis()
+    # Close qgis
+    # qgs.exitQgis()
 
-end_time = time.time()
+    end_time = time.time()
 
-get_processing_time(start_time, end_time, time_logfile)
\ No newline at end of file
+    get_processing_time(start_time, end_time, time_logfile)
\ No newline at end of file
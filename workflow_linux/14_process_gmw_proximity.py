@@ -1,16 +1,27 @@
 import os
 import json
-import glob
 import time
+import math
 import rasterio 
 from general_utilities import (
     get_processing_time,
+    get_tile_paths,
+    process_tiles,
+    get_tile_id,
+    get_manifest_entry,
+    is_up_to_date,
+    write_manifest,
     remove_temp_files,
 
 )
 from ras_utilities import (
-    apply_dilation,
-
+    TileGrid,
+    get_dilation,
+    get_proximity_bands,
+    get_halo_grid,
+    build_mosaic_vrt,
+    get_vrt_sources,
+    read_raster_with_halo
 )
 
 # Load config from external file
@@ -20,42 +31,108 @@ with open("config.json", "r") as f:
 # Define inputs from config
 country_name = config["country_name"]
 data_dir = config["data_dir"]
+n_workers = config["n_workers"]
+incremental = config["incremental"]
 proximity_distances = config["proximity_distances"]
+proximity_mode = config["proximity_mode"]  # "distance_transform" or "dilation"
+proximity_write_dilations = config["proximity_write_dilations"]
+proximity_halo_mode = config["proximity_halo_mode"]  # "vrt" or "buffer"
+gmw_last_year = config["gmw_last_year"]
 meters_per_pixel = config["target_res_deg_for_seed_dispersal"] * 111320  # Convert degrees to meters
 
 # Define tiles and output directory and logfile
 tiles_dir = os.path.join(data_dir, '1_Tiles', country_name)
 output_dir = os.path.join(data_dir, '4_GMW', country_name)
+gmw_vrt = os.path.join(output_dir, f"gmw_v3_{gmw_last_year}_gtiff.vrt")
+rep_vrt = os.path.join(output_dir, "REP_mosaic.vrt")
+manifest_dir = os.path.join(data_dir, '0_Manifest', country_name)
 time_logfile = data_dir
 
 os.makedirs(output_dir, exist_ok=True)
+os.makedirs(manifest_dir, exist_ok=True)
 
-# ------ Processing data -----------
-start_time = time.time()
+# The REP_ rasters of step 13 cover only the tile, the halo up to the largest distance is read from the
+# neighbouring tiles through a mosaic VRT. With "buffer" they already cover the 10 km buffered tile.
+halo = math.ceil(max(proximity_distances) / meters_per_pixel) if proximity_halo_mode == "vrt" else 0
 
-for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
+def process_tile(tile_path):
     # Get tile id
-    tile_id = os.path.basename(tile_path).replace("TIL_", "").replace("_0.geojson", "")
+    tile_id = get_tile_id(tile_path)
     print(f"\n>>> Processing tile: {tile_id}")
 
     fil_raster_path = os.path.join(output_dir, f"REP_{tile_id}.tif")
 
-    dil_raster_check = os.path.join(output_dir, f"DIL_{tile_id}_{proximity_distances[-1]}.tif")
-    if os.path.exists(dil_raster_check):
-        print(f"Skipping {tile_id}, {dil_raster_check} already exists.")
-        continue  
+    dil_rasters = [os.path.join(output_dir, f"DIL_{tile_id}_{d}.tif") for d in proximity_distances]
+    add_raster = os.path.join(output_dir, f"ADD_{tile_id}.tif")
+
+    # The distance transform writes the ADD_ raster used by step 15, the DIL_ rasters are optional
+    if proximity_mode == "distance_transform":
+        outputs = [add_raster] + (dil_rasters if proximity_write_dilations else [])
+    else:
+        outputs = dil_rasters
 
     with rasterio.open(fil_raster_path) as src:
-        raster_data = src.read(1)
         profile = src.profile
+        grid = TileGrid(src.transform, src.width, src.height, src.crs)
+
+    # The neighbouring REP_ rasters in the halo are inputs too
+    if proximity_halo_mode == "vrt":
+        inputs = list(get_vrt_sources(rep_vrt, get_halo_grid(grid, halo))) + [gmw_vrt]
+    else:
+        inputs = [fil_raster_path]
+
+    # Skip tile if DIL is up to date
+    manifest_entry = get_manifest_entry([__file__] + inputs, {"proximity_distances": proximity_distances, "meters_per_pixel": meters_per_pixel, "proximity_mode": proximity_mode, "proximity_halo_mode": proximity_halo_mode})
+    if incremental and is_up_to_date(manifest_dir, "DIL", tile_id, outputs, manifest_entry):
+        print(f"✔ Up to date: {outputs[0]}")
+        return
+
+    if proximity_halo_mode == "vrt":
+        raster_data, _ = read_raster_with_halo(rep_vrt, grid, halo, gmw_vrt)
+    else:
+        with rasterio.open(fil_raster_path) as src:
+            raster_data = src.read(1)
+
+    # Bands are computed with the halo and cropped to the tile
+    tile_window = (slice(halo, halo + grid.height), slice(halo, halo + grid.width))
+
+    if proximity_mode == "distance_transform":
+        bands, count = get_proximity_bands(raster_data, proximity_distances, meters_per_pixel)
+        profile.update(dtype="uint8", nodata=None, compress="lzw")
+        with rasterio.open(add_raster, "w", **profile) as dst:
+            dst.write(count[tile_window], 1)
+        print(f"✔ Saved: {add_raster}")
+        if proximity_write_dilations:
+            for d, dil_raster_path in zip(proximity_distances, dil_rasters):
+                with rasterio.open(dil_raster_path, "w", **profile) as dst:
+                    dst.write(bands[d][tile_window], 1)
+                print(f"✔ Dilation ({d}m) saved to: {dil_raster_path}")
+    else:
+        for d, dil_raster_path in zip(proximity_distances, dil_rasters):
+            with rasterio.open(dil_raster_path, "w", **profile) as dst:
+                dst.write(get_dilation(raster_data, d, meters_per_pixel)[tile_window], 1)
+            print(f"✔ Dilation ({d}m) saved to: {dil_raster_path}")
+    write_manifest(manifest_dir, "DIL", tile_id, outputs, manifest_entry)
+
+if __name__ == "__main__":
+    # ------ Processing data -----------
+    start_time = time.time()
+
+    tile_paths = get_tile_paths(tiles_dir, '_0.geojson')
+    rep_rasters = [os.path.join(output_dir, f"REP_{get_tile_id(tile_path)}.tif") for tile_path in tile_paths]
+
+    # Mosaic of all REP_ rasters, the tiles read their halo from it
+    if proximity_halo_mode == "vrt":
+        build_mosaic_vrt([r for r in rep_rasters if os.path.exists(r)], rep_vrt)
+        print(f"VRT created at: {rep_vrt}")
 
-    for d in proximity_distances:
-        dil_raster_path = os.path.join(output_dir, f"DIL_{tile_id}_{d}.tif")
-        apply_dilation(raster_data, dil_raster_path, d, meters_per_pixel, profile)
+    process_tiles(process_tile, tile_paths, n_workers)
 
-    # Remove intermediate files
-    remove_temp_files([fil_raster_path])
+    # Keep the outputs of step 13 in incremental mode, so it can skip the tiles on re-runs.
+    # They are removed only after all tiles, as the neighbours read their halo from them.
+    if not incremental:
+        remove_temp_files([r for r in rep_rasters + [rep_vrt] if os.path.exists(r)])
 
-end_time = time.time()
+    end_time = time.time()
 
-get_processing_time(start_time, end_time, time_logfile)
\ No newline at end of file
+    get_processing_time(start_time, end_time, time_logfile)
\ No newline at end of file
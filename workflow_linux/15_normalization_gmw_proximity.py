@@ -1,21 +1,27 @@
 import os
 import json
-import glob
 import time
 from qgis_utilities import (
-    initialize_qgis, 
-    initialize_processing, 
-    get_projwin,
+    initialize_qgis_worker,
     get_qgis_layer,
-    raster_calculator,
     reproject_raster,
     compress_raster
 )
 from general_utilities import (
     get_processing_time,
+    get_tile_projwin,
+    get_tile_paths,
+    process_tiles,
+    get_manifest_entry,
+    is_up_to_date,
+    write_manifest,
     remove_temp_files,
     delete_xml_files
 )
+from ras_utilities import (
+    raster_calculator,
+    reclassify
+)
 
 # Load config from external file
 with open("config.json", "r") as f:
@@ -25,22 +31,21 @@ with open("config.json", "r") as f:
 qgis_env_path = config["qgis_env_path"]
 country_name = config["country_name"]
 data_dir = config["data_dir"]
+n_workers = config["n_workers"]
+incremental = config["incremental"]
 target_res_deg = config["target_res_deg"]
 multipliers = config["proximity_gmw_multipliers"]
-
-# Initialize qgis
-qgs = initialize_qgis(qgis_env_path)
-initialize_processing()
+proximity_mode = config["proximity_mode"]
 
 # Define tiles and output directory and logfile
 tiles_dir = os.path.join(data_dir, '1_Tiles', country_name)
 gmw_dir = os.path.join(data_dir, '4_GMW', country_name)
+manifest_dir = os.path.join(data_dir, '0_Manifest', country_name)
 time_logfile = data_dir
 
-# ------ Processing data -----------
-start_time = time.time()
+os.makedirs(manifest_dir, exist_ok=True)
 
-for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
+def process_tile(tile_path):
     tile_id = os.path.basename(tile_path).replace("TIL_", "").replace("_0.geojson", "")
     print(f"\n>>> Processing tile: {tile_id}")
     
@@ -53,27 +58,41 @@ for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
     cli_raster = os.path.join(gmw_dir, f"CLI_{tile_id}.tif")
     com_raster = os.path.join(gmw_dir, f"SEE_{tile_id}.tif")
 
-    # Layer names
-    dil_500_name = f"DIL_{tile_id}_500"
-    dil_2500_name = f"DIL_{tile_id}_2500"
-    dil_10000_name = f"DIL_{tile_id}_10000"
-    add_name = f"ADD_{tile_id}"
-
-    # Load layers
-    dil_500_layer = get_qgis_layer(dil_500_raster, dil_500_name)
-    dil_2500_layer = get_qgis_layer(dil_2500_raster, dil_2500_name)
-    dil_10000_layer = get_qgis_layer(dil_10000_raster, dil_10000_name)
+    # With the distance transform of step 14 the ADD_ raster already exists
+    if proximity_mode == "distance_transform":
+        inputs = [add_raster]
+    else:
+        inputs = [dil_500_raster, dil_2500_raster, dil_10000_raster]
+
+    # Skip tile if SEE is up to date
+    manifest_entry = get_manifest_entry([__file__, tile_path] + inputs, {"proximity_gmw_multipliers": multipliers, "target_res_deg": target_res_deg})
+    if incremental and is_up_to_date(manifest_dir, "SEE", tile_id, [com_raster], manifest_entry):
+        print(f"✔ Up to date: {com_raster}")
+        return
+
+    if proximity_mode != "distance_transform":
+        # Layer names
+        dil_500_name = f"DIL_{tile_id}_500"
+        dil_2500_name = f"DIL_{tile_id}_2500"
+        dil_10000_name = f"DIL_{tile_id}_10000"
+
+        # Load layers
+        dil_500_layer = get_qgis_layer(dil_500_raster, dil_500_name)
+        dil_2500_layer = get_qgis_layer(dil_2500_raster, dil_2500_name)
+        dil_10000_layer = get_qgis_layer(dil_10000_raster, dil_10000_name)
+
+        print("✅ All raster layers loaded successfully.")
+
+        # Adding layers
+        expression = (
+            f'"{dil_500_name}@1" + '
+            f'"{dil_2500_name}@1" + '
+            f'"{dil_10000_name}@1"'
+        )
+        input_rasters =  [dil_500_layer, dil_2500_layer, dil_10000_layer]
+        raster_calculator(expression, input_rasters, add_raster)
 
-    print("✅ All raster layers loaded successfully.")
-
-    # Adding layers
-    expression = (
-        f'"{dil_500_name}@1" + '
-        f'"{dil_2500_name}@1" + '
-        f'"{dil_10000_name}@1"'
-    )
-    input_rasters =  [dil_500_layer, dil_2500_layer, dil_10000_layer]
-    raster_calculator(expression, input_rasters, add_raster)
+    add_name = f"ADD_{tile_id}"
 
     # Normalizing layer
     # expression = (
@@ -81,33 +100,41 @@ for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
     #     f'("{add_name}@1" = 2) * 89 + '
     #     f'("{add_name}@1" = 3) * 100) / 100'
     # )
-    expr_terms = [
-        f'("{add_name}@1" = {k}) * {v}'
-        for k, v in multipliers.items()
-    ]
-    expression = f'({" + ".join(expr_terms)}) / 100'
-
-    input_rasters = [add_raster]
-    raster_calculator(expression, input_rasters, cal_raster)
+    reclassify(add_raster, multipliers, cal_raster)
 
     # Get bounding box of tile
-    projwin = get_projwin(tile_path)
+    projwin = get_tile_projwin(tile_path)
 
     # Reproject raster
     reproject_raster(cal_raster, cli_raster, target_res_deg, projwin)
 
     # Compress raster
     compress_raster(cli_raster, com_raster)
+    write_manifest(manifest_dir, "SEE", tile_id, [com_raster], manifest_entry)
 
     # Remove intermediate files
-    remove_temp_files([dil_500_raster, dil_2500_raster, dil_10000_raster, add_raster, cal_raster, cli_raster])
+    remove_temp_files([cal_raster, cli_raster])
+    if proximity_mode != "distance_transform":
+        remove_temp_files([add_raster])
+
+    # Keep the outputs of step 14 in incremental mode, so it can skip this tile on re-runs
+    if not incremental:
+        step14_rasters = [add_raster, dil_500_raster, dil_2500_raster, dil_10000_raster]
+        remove_temp_files([r for r in step14_rasters if os.path.exists(r)])
+
+if __name__ == "__main__":
+    # ------ Processing data -----------
+    start_time = time.time()
+
+    tile_paths = get_tile_paths(tiles_dir, '_0.geojson')
+    process_tiles(process_tile, tile_paths, n_workers, initialize_qgis_worker, (qgis_env_path,))
 
-# Remove .xml files created by qgis when a files is opened
-delete_xml_files(gmw_dir)
+    # Remove .xml files created by qgis when a files is opened
+    delete_xml_files(gmw_dir)
 
-# Close qgis
-# qgs.exitQgis()
+    # Close qgis
+    # qgs.exitQgis()
 
-end_time = time.time()
+    end_time = time.time()
 
-get_processing_time(start_time, end_time, time_logfile)
\ No newline at end of file
+    get_processing_time(start_time, end_time, time_logfile)
\ No newline at end of file
@@ -3,13 +3,15 @@ import json
 import time
 from general_utilities import (
     get_processing_time,
+    get_feature_parquet,
     delete_xml_files,
-    delete_geojson_files
+    delete_fgb_files
 )
 from ras_utilities import (
     process_tiles_clips,
     process_tiles_overlay,
     rasterize_tiles,
+    rasterize_distance_bands,
 )
 
 # Load config from external file
@@ -19,46 +21,60 @@ with open("config.json", "r") as f:
 # Define inputs from config
 country_name = config["country_name"]
 data_dir = config["data_dir"]
+n_workers = config["n_workers"]
 rivers_geometries = config["rivers_geometries"]
 coastline_geometries = config["coastline_geometries"]
+distance_bands_mode = config["distance_bands_mode"]  # "raster" or "vector"
+feature_parquet = config["feature_parquet"]
 
 # Define the paths
 tiles_dir = os.path.join(data_dir, '1_Tiles', country_name)
 tides_dir = os.path.join(data_dir, '8_Tides', country_name)
 riv_dir = os.path.join(data_dir, '6_Rivers', country_name)
 coa_dir = os.path.join(data_dir, '13_Coastline', country_name)
+features_dir = os.path.join(data_dir, '0_Features')
 time_logfile = data_dir
 
 os.makedirs(riv_dir, exist_ok=True)
 os.makedirs(coa_dir, exist_ok=True)
 
-# ------ Processing data -----------
-start_time = time.time()
+if __name__ == "__main__":
+    # ------ Processing data -----------
+    start_time = time.time()
 
-process_tiles_clips(tiles_dir, coastline_geometries, 500, "COA", coa_dir)
-process_tiles_clips(tiles_dir, coastline_geometries, 2500, "COA", coa_dir)
-process_tiles_clips(tiles_dir, coastline_geometries, 5000, "COA", coa_dir)
-process_tiles_clips(tiles_dir, coastline_geometries, 7500, "COA", coa_dir)
-rasterize_tiles(500, "COA", tiles_dir, tides_dir, coa_dir, coa_dir)
-rasterize_tiles(2500, "COA", tiles_dir, tides_dir, coa_dir, coa_dir)
-rasterize_tiles(5000, "COA", tiles_dir, tides_dir, coa_dir, coa_dir)
-rasterize_tiles(7500, "COA", tiles_dir, tides_dir, coa_dir, coa_dir)
+    # GeoParquet copies of the global layers load much faster in every worker than the shapefile/GeoJSON
+    if feature_parquet:
+        os.makedirs(features_dir, exist_ok=True)
+        coastline_geometries = get_feature_parquet(coastline_geometries, features_dir)
+        rivers_geometries = get_feature_parquet(rivers_geometries, features_dir)
 
-process_tiles_clips(tiles_dir, coastline_geometries, 30000, "COA", riv_dir)
-process_tiles_clips(tiles_dir, rivers_geometries, 250, "RIV", riv_dir)
-process_tiles_clips(tiles_dir, rivers_geometries, 500, "RIV", riv_dir)
-process_tiles_clips(tiles_dir, rivers_geometries, 2500, "RIV", riv_dir)
-process_tiles_overlay(tiles_dir, riv_dir, [250, 500, 2500])
-rasterize_tiles(250, "OVE", tiles_dir, tides_dir, riv_dir, riv_dir)
-rasterize_tiles(500, "OVE", tiles_dir, tides_dir, riv_dir, riv_dir)
-rasterize_tiles(2500, "OVE", tiles_dir, tides_dir, riv_dir, riv_dir)
+    # One distance transform per tile for all the buffers, written as the ADC_ and ADR_ rasters of steps 17 and 18
+    if distance_bands_mode == "raster":
+        rasterize_distance_bands(tiles_dir, coastline_geometries, rivers_geometries, [500, 2500, 5000, 7500],
+                                 [250, 500, 2500], 30000, tides_dir, coa_dir, riv_dir, n_workers)
+    else:
+        process_tiles_clips(tiles_dir, coastline_geometries, 500, "COA", coa_dir, n_workers)
+        process_tiles_clips(tiles_dir, coastline_geometries, 2500, "COA", coa_dir, n_workers)
+        process_tiles_clips(tiles_dir, coastline_geometries, 5000, "COA", coa_dir, n_workers)
+        process_tiles_clips(tiles_dir, coastline_geometries, 7500, "COA", coa_dir, n_workers)
+        rasterize_tiles(500, "COA", tiles_dir, tides_dir, coa_dir, coa_dir, n_workers)
+        rasterize_tiles(2500, "COA", tiles_dir, tides_dir, coa_dir, coa_dir, n_workers)
+        rasterize_tiles(5000, "COA", tiles_dir, tides_dir, coa_dir, coa_dir, n_workers)
+        rasterize_tiles(7500, "COA", tiles_dir, tides_dir, coa_dir, coa_dir, n_workers)
 
-delete_xml_files(tides_dir)
-delete_geojson_files(riv_dir)
-delete_geojson_files(coa_dir)
+        process_tiles_clips(tiles_dir, coastline_geometries, 30000, "COA", riv_dir, n_workers)
+        process_tiles_clips(tiles_dir, rivers_geometries, 250, "RIV", riv_dir, n_workers)
+        process_tiles_clips(tiles_dir, rivers_geometries, 500, "RIV", riv_dir, n_workers)
+        process_tiles_clips(tiles_dir, rivers_geometries, 2500, "RIV", riv_dir, n_workers)
+        process_tiles_overlay(tiles_dir, riv_dir, [250, 500, 2500], n_workers)
+        rasterize_tiles(250, "OVE", tiles_dir, tides_dir, riv_dir, riv_dir, n_workers)
+        rasterize_tiles(500, "OVE", tiles_dir, tides_dir, riv_dir, riv_dir, n_workers)
+        rasterize_tiles(2500, "OVE", tiles_dir, tides_dir, riv_dir, riv_dir, n_workers)
 
-end_time = time.time()
-
-get_processing_time(start_time, end_time, time_logfile)
+        delete_xml_files(tides_dir)
+        delete_fgb_files(riv_dir)
+        delete_fgb_files(coa_dir)
 
+    end_time = time.time()
 
+    get_processing_time(start_time, end_time, time_logfile)
\ No newline at end of file
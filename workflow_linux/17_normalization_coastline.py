@@ -1,23 +1,29 @@
 import os
 import json
-import glob
 import time
 import pandas as pd
 from qgis_utilities import (
-    initialize_qgis, 
-    initialize_processing, 
+    initialize_qgis_worker,
     fill_raster,
     get_qgis_layer,
-    raster_calculator,
-    get_projwin,
-    reproject_raster,
-    compress_raster
+    reproject_raster
 )
 from general_utilities import (
     get_processing_time,
+    get_tile_projwin,
+    get_tile_paths,
+    process_tiles,
+    get_manifest_entry,
+    is_up_to_date,
+    write_manifest,
     remove_temp_files,
     delete_xml_files
 )
+from ras_utilities import (
+    raster_calculator,
+    reclassify,
+    fill_and_write
+)
 
 # Load config from external file
 with open("config.json", "r") as f:
@@ -27,26 +33,24 @@ with open("config.json", "r") as f:
 qgis_env_path = config["qgis_env_path"]
 country_name = config["country_name"]
 data_dir = config["data_dir"]
+n_workers = config["n_workers"]
+incremental = config["incremental"]
+raster_write_options = config["raster_write_options"]  # compress, predictor, tiled and blocksize of fill_and_write
 target_res_deg = config["target_res_deg"]
 multipliers = config["proximity_coastline_multipliers"]
-
-# Initialize qgis
-qgs = initialize_qgis(qgis_env_path)
-initialize_processing()
+distance_bands_mode = config["distance_bands_mode"]  # "raster" or "vector"
 
 # Define tiles and output directory and logfile
 tiles_dir = os.path.join(data_dir, '1_Tiles', country_name)
 coastline_dir = os.path.join(data_dir, "13_Coastline", country_name)
 output_dir = coastline_dir
+manifest_dir = os.path.join(data_dir, '0_Manifest', country_name)
 time_logfile = data_dir
 
 os.makedirs(output_dir, exist_ok=True)
+os.makedirs(manifest_dir, exist_ok=True)
 
-# ------ Processing data -----------
-start_time = time.time()
-
-log = []
-for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
+def process_tile(tile_path):
     # Get tile id
     tile_id = os.path.basename(tile_path).replace("TIL_", "").replace("_0.geojson", "")
     print(f"\n>>> Processing tile: {tile_id}")
@@ -88,7 +92,7 @@ for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
     # ---- Determine which case applies ----
     if not os.path.exists(coa_7500):
         print(f"Skipping tile {tile_id}, COA_7500 missing (mandatory).")
-        log.append({"tile_id": tile_id, "coa_7500": coa_7500_exists, "coa_5000": coa_5000_exists, "coa_2500": coa_2500_exists, "coa_500": coa_500_exists, "add_raster": False})
+        tile_log = {"tile_id": tile_id, "coa_7500": coa_7500_exists, "coa_5000": coa_5000_exists, "coa_2500": coa_2500_exists, "coa_500": coa_500_exists, "add_raster": False}
     else:
         # Always include coa_7500
         to_process = [coa_files[0]]
@@ -102,10 +106,16 @@ for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
                     to_process.append(coa_files[3])
 
         print(f"Tile {tile_id}: processing {[f[0] for f in to_process]}")
-        log.append({"tile_id": tile_id, "coa_7500": coa_7500_exists, "coa_5000": coa_5000_exists, "coa_2500": coa_2500_exists, "coa_500": coa_500_exists, "add_raster": True})
+        tile_log = {"tile_id": tile_id, "coa_7500": coa_7500_exists, "coa_5000": coa_5000_exists, "coa_2500": coa_2500_exists, "coa_500": coa_500_exists, "add_raster": True}
+
+        # Skip tile if PRC is up to date
+        manifest_entry = get_manifest_entry([__file__, tile_path] + [f[0] for f in to_process], {"proximity_coastline_multipliers": multipliers, "target_res_deg": target_res_deg})
+        if incremental and is_up_to_date(manifest_dir, "PRC", tile_id, [com_raster], manifest_entry):
+            print(f"✔ Up to date: {com_raster}")
+            return tile_log
 
         # ---- Process selected files ----
-        projwin = get_projwin(tile_path)
+        projwin = get_tile_projwin(tile_path)
 
         input_rasters = []
         expr_terms = []
@@ -134,35 +144,73 @@ for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
         #     f'({add_name}@1 = 3) * 85 + '
         #     f'({add_name}@1 = 4) * 100) /100'
         # )
-        expr_terms = [
-            f'("{add_name}@1" = {k}) * {v}'
-            for k, v in multipliers.items()
-        ]
-        expression = f'({" + ".join(expr_terms)}) / 100'
-
-        input_rasters = [add_raster]
-        raster_calculator(expression, input_rasters, nor_raster)
+        reclassify(add_raster, multipliers, nor_raster)
 
         # Compress raster
-        compress_raster(nor_raster, com_raster)
+        fill_and_write(nor_raster, com_raster, fill_value=None, **raster_write_options)
 
         print(f"✔ Saved: {com_raster}")
+        write_manifest(manifest_dir, "PRC", tile_id, [com_raster], manifest_entry)
 
         # Remove intermediate files
         remove_temp_files(rasters_to_remove + [add_raster, nor_raster])
 
-# Save log  
-log_df = pd.DataFrame(log)
-log_csv_path = os.path.join(output_dir, f"COA_ADD.csv")
-log_df.to_csv(log_csv_path, index=False)
-print(f"Processing finished. Log saved to {log_csv_path}")
+    return tile_log
+
+def process_tile_bands(tile_path):
+    # Get tile id
+    tile_id = os.path.basename(tile_path).replace("TIL_", "").replace("_0.geojson", "")
+    print(f"\n>>> Processing tile: {tile_id}")
+
+    # The ADC_ raster of step 16 already counts the buffers of every pixel on the tile grid
+    add_raster = os.path.join(output_dir, f"ADC_{tile_id}.tif")
+    nor_raster = os.path.join(output_dir, f"NOC_{tile_id}.tif")
+    com_raster = os.path.join(output_dir, f"PRC_{tile_id}.tif")
+
+    tile_log = {"tile_id": tile_id, "add_raster": os.path.exists(add_raster)}
+    if not tile_log["add_raster"]:
+        print(f"Skipping tile {tile_id}, ADC missing (no coastline features).")
+        return tile_log
+
+    # Skip tile if PRC is up to date
+    manifest_entry = get_manifest_entry([__file__, tile_path, add_raster], {"proximity_coastline_multipliers": multipliers})
+    if incremental and is_up_to_date(manifest_dir, "PRC", tile_id, [com_raster], manifest_entry):
+        print(f"✔ Up to date: {com_raster}")
+        return tile_log
+
+    # Normalize and compress raster with the same profile as the vector mode
+    reclassify(add_raster, multipliers, nor_raster)
+    fill_and_write(nor_raster, com_raster, fill_value=None, **raster_write_options)
+    write_manifest(manifest_dir, "PRC", tile_id, [com_raster], manifest_entry)
+
+    # Keep the output of step 16 in incremental mode, so it can be reused on re-runs
+    remove_temp_files([nor_raster] if incremental else [add_raster, nor_raster])
+
+    return tile_log
+
+if __name__ == "__main__":
+    # ------ Processing data -----------
+    start_time = time.time()
+
+    tile_paths = get_tile_paths(tiles_dir, '_0.geojson')
+    # The raster mode of step 16 writes the added bands directly
+    if distance_bands_mode == "raster":
+        log = process_tiles(process_tile_bands, tile_paths, n_workers)
+    else:
+        log = process_tiles(process_tile, tile_paths, n_workers, initialize_qgis_worker, (qgis_env_path,))
+
+    # Save log  
+    log_df = pd.DataFrame(log)
+    log_csv_path = os.path.join(output_dir, f"COA_ADD.csv")
+    log_df.to_csv(log_csv_path, index=False)
+    print(f"Processing finished. Log saved to {log_csv_path}")
 
-# Remove .xml files created by qgis when a files is opened
-delete_xml_files(output_dir)
+    # Remove .xml files created by qgis when a files is opened
+    delete_xml_files(output_dir)
 
-# Close qgis
-# qgs.exitQgis()
+    # Close qgis
+    # qgs.exitQgis()
 
-end_time = time.time()
+    end_time = time.time()
 
-get_processing_time(start_time, end_time, time_logfile)
\ No newline at end of file
+    get_processing_time(start_time, end_time, time_logfile)
\ No newline at end of file
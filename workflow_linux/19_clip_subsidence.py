@@ -17,8 +17,9 @@ with open("config.json", "r") as f:
 # Define inputs from config
 country_name = config["country_name"]
 data_dir = config["data_dir"]
+n_workers = config["n_workers"]
 subsidence_data_2010 = config["subsidence_data_2010"]
-subsidence_data_2010 = config["subsidence_data_2040"]
+subsidence_data_2040 = config["subsidence_data_2040"]
 
 # Define tiles and output directory and logfile
 tiles_dir = os.path.join(data_dir, '1_Tiles', country_name)
@@ -27,13 +28,13 @@ time_logfile = data_dir
 
 os.makedirs(output_dir, exist_ok=True)
 
-# ------ Processing data -----------
-start_time = time.time()
+if __name__ == "__main__":
+    # ------ Processing data -----------
+    start_time = time.time()
 
-subsidence_log = clip_subsidence(tiles_dir, subsidence_data_2010, output_dir, "2010")
-subsidence_log = clip_subsidence(tiles_dir, subsidence_data_2010, output_dir, "2040")
+    subsidence_log = clip_subsidence(tiles_dir, subsidence_data_2010, output_dir, "2010", n_workers)
+    subsidence_log = clip_subsidence(tiles_dir, subsidence_data_2040, output_dir, "2040", n_workers)
 
-end_time = time.time()
-
-get_processing_time(start_time, end_time, time_logfile)
+    end_time = time.time()
 
+    get_processing_time(start_time, end_time, time_logfile)
@@ -1,22 +1,28 @@
 import os
 import json
-import glob
 import time
 from qgis_utilities import (
-    initialize_qgis, 
-    initialize_processing, 
+    initialize_qgis_worker,
     get_qgis_layer,
-    raster_calculator,
-    get_projwin,
     reproject_raster,
     fill_extrapolation,
     compress_raster
 )
 from general_utilities import (
     get_processing_time,
+    get_tile_projwin,
+    get_tile_paths,
+    process_tiles,
+    get_manifest_entry,
+    is_up_to_date,
+    write_manifest,
     remove_temp_files,
     delete_xml_files
 )
+from ras_utilities import (
+    raster_calculator,
+    reclassify
+)
 
 # Load config from external file
 with open("config.json", "r") as f:
@@ -26,26 +32,23 @@ with open("config.json", "r") as f:
 qgis_env_path = config["qgis_env_path"]
 country_name = config["country_name"]
 data_dir = config["data_dir"]
+n_workers = config["n_workers"]
+incremental = config["incremental"]
 target_res_deg = config["target_res_deg"]
 multipliers_2010 = config["subsidence_multipliers_2010"]
 multipliers_2040 = config["subsidence_multipliers_2040"]
 
-# Initialize qgis
-qgs = initialize_qgis(qgis_env_path)
-initialize_processing()
-
 # Define tiles and output directory and logfile
 tiles_dir = os.path.join(data_dir, '1_Tiles', country_name)
 subsidence_dir = os.path.join(data_dir, "12_Subsidence", country_name)
 output_dir = subsidence_dir
+manifest_dir = os.path.join(data_dir, '0_Manifest', country_name)
 time_logfile = data_dir
 
 os.makedirs(output_dir, exist_ok=True)
+os.makedirs(manifest_dir, exist_ok=True)
 
-# ------ Processing data -----------
-start_time = time.time()
-
-for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
+def process_tile(tile_path):
     # Get tile id
     tile_id = os.path.basename(tile_path).replace("TIL_", "").replace("_0.geojson", "")
     print(f"\n>>> Processing tile: {tile_id}")
@@ -61,6 +64,12 @@ for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
     rep_raster = os.path.join(output_dir, f"REP_{tile_id}.tif")
     com_raster = os.path.join(output_dir, f"SUB_{tile_id}.tif")
 
+    # Skip tile if SUB is up to date
+    manifest_entry = get_manifest_entry([__file__, tile_path, sub10_raster, sub40_raster], {"subsidence_multipliers_2010": multipliers_2010, "subsidence_multipliers_2040": multipliers_2040, "target_res_deg": target_res_deg})
+    if incremental and is_up_to_date(manifest_dir, "SUB", tile_id, [com_raster], manifest_entry):
+        print(f"✔ Up to date: {com_raster}")
+        return
+
     fill_extrapolation(sub10_raster, fil10_raster, 50)
     fill_extrapolation(sub40_raster, fil40_raster, 50)
 
@@ -80,13 +89,7 @@ for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
     #     f'({fil10_name}@1 = 5) * 20 + '
     #     f'({fil10_name}@1 = 6) * 0)'
     # )
-    expr_terms = [
-        f'("{fil10_name}@1" = {k}) * {v}'
-        for k, v in multipliers_2010.items()
-    ]
-    expression = f'({" + ".join(expr_terms)})'
-    input_rasters = [fil10_raster]
-    raster_calculator(expression, input_rasters, nor10_raster)
+    reclassify(fil10_raster, multipliers_2010, nor10_raster, scale=1)
 
     # expression = (
     #     f'(({fil40_name}@1 = 1) * 100 + '
@@ -96,13 +99,7 @@ for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
     #     f'({fil40_name}@1 = 5) * 20 + '
     #     f'({fil40_name}@1 = 6) * 0)'
     # )
-    expr_terms = [
-        f'("{fil40_name}@1" = {k}) * {v}'
-        for k, v in multipliers_2010.items()
-    ]
-    expression = f'({" + ".join(expr_terms)})'
-    input_rasters = [fil40_raster]
-    raster_calculator(expression, input_rasters, nor40_raster)
+    reclassify(fil40_raster, multipliers_2040, nor40_raster, scale=1)
 
     expression = (
         f'(((("NOR_{tile_id}_2010@1")  + '
@@ -114,7 +111,7 @@ for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
     raster_calculator(expression, input_rasters, cal_raster)
 
     # Get bounding box of tile
-    projwin = get_projwin(tile_path)
+    projwin = get_tile_projwin(tile_path)
 
     # Clip and reproject raster
     reproject_raster(cal_raster, rep_raster, target_res_deg, projwin)
@@ -123,16 +120,24 @@ for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
     compress_raster(rep_raster, com_raster)
 
     print(f"✔ Saved: {com_raster}")
+    write_manifest(manifest_dir, "SUB", tile_id, [com_raster], manifest_entry)
 
     # Remove intermediate files
     remove_temp_files([sub10_raster, sub40_raster, fil10_raster, fil40_raster, nor10_raster, nor40_raster, cal_raster, rep_raster])
 
-# Remove .xml files created by qgis when a files is opened
-delete_xml_files(output_dir)
+if __name__ == "__main__":
+    # ------ Processing data -----------
+    start_time = time.time()
+
+    tile_paths = get_tile_paths(tiles_dir, '_0.geojson')
+    process_tiles(process_tile, tile_paths, n_workers, initialize_qgis_worker, (qgis_env_path,))
+
+    # Remove .xml files created by qgis when a files is opened
+    delete_xml_files(output_dir)
 
-# Close qgis
-qgs.exitQgis()
+    # Close qgis
+    # qgs.exitQgis()
 
-end_time = time.time()
+    end_time = time.time()
 
-get_processing_time(start_time, end_time, time_logfile)
\ No newline at end of file
+    get_processing_time(start_time, end_time, time_logfile)
\ No newline at end of file
@@ -1,14 +1,22 @@
 import os
 import json
-import glob
 import time
 import pandas as pd
 import geopandas as gpd
 import pystac_client
 import planetary_computer
 import odc.stac
+from odc.geo.geobox import GeoBox
 from general_utilities import (
-    get_processing_time
+    get_processing_time,
+    get_tile_paths,
+    process_tiles,
+    get_manifest_entry,
+    is_up_to_date,
+    write_manifest
+)
+from ras_utilities import (
+    get_catalog_tile_grid
 )
 
 # Load config from external file
@@ -18,20 +26,20 @@ with open("config.json", "r") as f:
 # Define inputs from config
 country_name = config["country_name"]
 data_dir = config["data_dir"]
+n_workers = config["n_workers"]
+incremental = config["incremental"]
 target_res_deg = config["target_res_deg"]
 
 # Define tiles and output directory and logfile
 tiles_dir = os.path.join(data_dir, '1_Tiles', country_name)
 output_dir = os.path.join(data_dir, '11_Landcover', country_name)
+manifest_dir = os.path.join(data_dir, '0_Manifest', country_name)
 time_logfile = data_dir
 
 os.makedirs(output_dir, exist_ok=True)
+os.makedirs(manifest_dir, exist_ok=True)
 
-# ------ Processing data -----------
-start_time = time.time()
-
-log = []
-for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
+def process_tile(tile_path):
     # Get tile id
 
     tile_id = os.path.basename(tile_path).replace("TIL_", "").replace("_0.geojson", "")
@@ -41,15 +49,16 @@ for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
     til_vector = os.path.join(tiles_dir, f"TIL_{tile_id}_0.geojson")
     land_raster = os.path.join(output_dir, f"LAN_{tile_id}.tif")
 
-    if os.path.exists(land_raster):
-        print(f"Skipping {tile_id}, {land_raster} already exists.")
-        continue  
+    # Skip tile if LAN is up to date
+    manifest_entry = get_manifest_entry([__file__, til_vector], {"target_res_deg": target_res_deg})
+    if incremental and is_up_to_date(manifest_dir, "LAN", tile_id, [land_raster], manifest_entry):
+        print(f"✔ Up to date: {land_raster}")
+        return
         
     try:
-        # Get bbox til vector
+        # Get grid of the tile from the catalog, shared by all the products of the tile
+        grid = get_catalog_tile_grid(til_vector, target_res_deg)
         gdf = gpd.read_file(til_vector)
-        minx, miny, maxx, maxy = gdf.total_bounds
-        bbox_of_interest_original = [minx, miny, maxx, maxy]
 
         # Get buffered bbox (reduced to avoid getting data form other regions)
         gdf_proj = gdf.to_crs(epsg=3857)
@@ -76,7 +85,8 @@ for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
         print(items_filtered)
 
         # Load in memory products
-        ds = odc.stac.load(items_filtered, crs="EPSG:4326", resolution=target_res_deg, bbox=bbox_of_interest_original)
+        geobox = GeoBox((grid.height, grid.width), grid.transform, grid.crs.to_string())
+        ds = odc.stac.load(items_filtered, geobox=geobox)
         map_data = ds["map"].isel(time=0).load()
         
         # Get only urban areas '50'
@@ -95,17 +105,25 @@ for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
         )
 
         print(f"Binary mask saved to {land_raster}")
+        write_manifest(manifest_dir, "LAN", tile_id, [land_raster], manifest_entry)
     
     except:
         print(f"The file {tile_id} could not be created")
-        log.append({"tile_id": tile_id, "tile_exist": False})
+        return {"tile_id": tile_id, "tile_exist": False}
+
+if __name__ == "__main__":
+    # ------ Processing data -----------
+    start_time = time.time()
+
+    tile_paths = get_tile_paths(tiles_dir, '_0.geojson')
+    log = process_tiles(process_tile, tile_paths, n_workers)
 
-# Save log  
-log_df = pd.DataFrame(log)
-log_csv_path = os.path.join(output_dir, f"LAN.csv")
-log_df.to_csv(log_csv_path, index=False)
-print(f"Processing finished. Log saved to {log_csv_path}")
+    # Save log  
+    log_df = pd.DataFrame(log)
+    log_csv_path = os.path.join(output_dir, f"LAN.csv")
+    log_df.to_csv(log_csv_path, index=False)
+    print(f"Processing finished. Log saved to {log_csv_path}")
 
-end_time = time.time()
+    end_time = time.time()
 
-get_processing_time(start_time, end_time, time_logfile)
\ No newline at end of file
+    get_processing_time(start_time, end_time, time_logfile)
\ No newline at end of file
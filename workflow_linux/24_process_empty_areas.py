@@ -1,31 +1,33 @@
 import os
 import json
-import glob
 import time
-from qgis_utilities import (
-    initialize_qgis, 
-    initialize_processing, 
-    raster_calculator,
-    fill_and_compress
-)
 from general_utilities import (
     get_processing_time,
+    get_tile_paths,
+    process_tiles,
+    get_manifest_entry,
+    is_up_to_date,
+    write_manifest,
     remove_temp_files,
     delete_xml_files
 )
+from ras_utilities import (
+    raster_calculator,
+    fill_and_write
+)
 
 # Load config from external file
 with open("config.json", "r") as f:
     config = json.load(f)
 
 # Define inputs from config
-qgis_env_path = config["qgis_env_path"]
 country_name = config["country_name"]
 data_dir = config["data_dir"]
-
-# Initialize qgis
-qgs = initialize_qgis(qgis_env_path)
-initialize_processing()
+n_workers = config["n_workers"]
+incremental = config["incremental"]
+raster_write_options = config["raster_write_options"]  # compress, predictor, tiled and blocksize of fill_and_write
+gmw_years = config["gmw_years"]
+gmw_stack = config["gmw_stack"]
 
 # Define tiles and output directory and logfile
 tiles_dir = os.path.join(data_dir, '1_Tiles', country_name)
@@ -33,47 +35,64 @@ gmw_dir = os.path.join(data_dir, '4_GMW', country_name)
 urban_dir = os.path.join(data_dir, '11_Landcover', country_name)
 water_dir = os.path.join(data_dir, '14_Permanent_water', country_name)
 output_dir = os.path.join(data_dir, '15_Mask', country_name)
+manifest_dir = os.path.join(data_dir, '0_Manifest', country_name)
 time_logfile = data_dir
 
 os.makedirs(output_dir, exist_ok=True)
+os.makedirs(manifest_dir, exist_ok=True)
 
-# ------ Processing data -----------
-start_time = time.time()
-
-for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
+def process_tile(tile_path):
     # Get tile id
     tile_id = os.path.basename(tile_path).replace("TIL_", "").replace("_0.geojson", "")
     print(f"\n>>> Processing tile: {tile_id}")
 
     # Define intermediate and output file paths
-    gmw_raster = os.path.join(gmw_dir, f"GMW_{tile_id}_2020.tif")
+    if gmw_stack:
+        gmw_raster = os.path.join(gmw_dir, f"GMS_{tile_id}.tif")
+        gmw_ref = f"GMS_{tile_id}@{gmw_years.index(2020) + 1}"
+    else:
+        gmw_raster = os.path.join(gmw_dir, f"GMW_{tile_id}_2020.tif")
+        gmw_ref = f"GMW_{tile_id}_2020@1"
     urb_raster = os.path.join(urban_dir, f"LAN_{tile_id}.tif")
     wat_raster = os.path.join(water_dir, f"WAT_{tile_id}.tif")
     bin_raster = os.path.join(output_dir, f"BIN_{tile_id}.tif")
-    fil_raster = os.path.join(output_dir, f"FIL_{tile_id}.tif")
     com_raster = os.path.join(output_dir, f"EMA_{tile_id}.tif")
 
+    # Skip tile if EMA is up to date
+    manifest_entry = get_manifest_entry([__file__, gmw_raster, urb_raster, wat_raster], {})
+    if incremental and is_up_to_date(manifest_dir, "EMA", tile_id, [com_raster], manifest_entry):
+        print(f"✔ Up to date: {com_raster}")
+        return
+
     # Normalize raster
     expression = (
-        f'("GMW_{tile_id}_2020@1" + "LAN_{tile_id}@1" + "WAT_{tile_id}@1") < 0' # There is a mismatch in the years of Clark dataset and GMW so it would be better to not remove mangrove areas from 2020
+        f'("{gmw_ref}" + "LAN_{tile_id}@1" + "WAT_{tile_id}@1") < 0' # There is a mismatch in the years of Clark dataset and GMW so it would be better to not remove mangrove areas from 2020
     )
     input_rasters = [gmw_raster, urb_raster, wat_raster]
     raster_calculator(expression, input_rasters, bin_raster)
 
     # Fill no data and compress raster
-    fill_and_compress(bin_raster, fil_raster, com_raster, '')
+    fill_and_write(bin_raster, com_raster, **raster_write_options)
 
     print(f"✔ Saved: {com_raster}")
+    write_manifest(manifest_dir, "EMA", tile_id, [com_raster], manifest_entry)
 
     # Remove intermediate files
-    remove_temp_files([bin_raster, fil_raster])
+    remove_temp_files([bin_raster])
+
+if __name__ == "__main__":
+    # ------ Processing data -----------
+    start_time = time.time()
+
+    tile_paths = get_tile_paths(tiles_dir, '_0.geojson')
+    process_tiles(process_tile, tile_paths, n_workers)
 
-# Remove .xml files created by qgis when a files is opened
-delete_xml_files(output_dir)
+    # Remove .xml files created by qgis when a files is opened
+    delete_xml_files(output_dir)
 
-# Close qgis
-# qgs.exitQgis()
+    # Close qgis
+    # qgs.exitQgis()
 
-end_time = time.time()
+    end_time = time.time()
 
-get_processing_time(start_time, end_time, time_logfile)
\ No newline at end of file
+    get_processing_time(start_time, end_time, time_logfile)
\ No newline at end of file
@@ -1,33 +1,33 @@
 import os
 import json
-import glob
 import time
 import shutil
 import pandas as pd
-from qgis_utilities import (
-    initialize_qgis, 
-    initialize_processing, 
-    raster_calculator,
-    fill_and_compress
-)
 from general_utilities import (
     get_processing_time,
+    get_tile_paths,
+    process_tiles,
+    get_manifest_entry,
+    is_up_to_date,
+    write_manifest,
     remove_temp_files,
     delete_xml_files
 )
+from ras_utilities import (
+    raster_calculator,
+    fill_and_write
+)
 
 # Load config from external file
 with open("config.json", "r") as f:
     config = json.load(f)
 
 # Define inputs from config
-qgis_env_path = config["qgis_env_path"]
 country_name = config["country_name"]
 data_dir = config["data_dir"]
-
-# Initialize qgis
-qgs = initialize_qgis(qgis_env_path)
-initialize_processing()
+n_workers = config["n_workers"]
+incremental = config["incremental"]
+raster_write_options = config["raster_write_options"]  # compress, predictor, tiled and blocksize of fill_and_write
 
 # Define tiles and output directory and logfile
 tiles_dir = os.path.join(data_dir, '1_Tiles', country_name)
@@ -40,15 +40,13 @@ subsidence_dir = os.path.join(data_dir, "12_Subsidence", country_name)
 coastline_dir = os.path.join(data_dir, "13_Coastline", country_name)
 mask_dir = os.path.join(data_dir, '15_Mask', country_name)
 output_dir = os.path.join(data_dir, '16_Mangrove_potential', country_name)
+manifest_dir = os.path.join(data_dir, '0_Manifest', country_name)
 time_logfile = data_dir
 
 os.makedirs(output_dir, exist_ok=True)
+os.makedirs(manifest_dir, exist_ok=True)
 
-# ------ Processing data -----------
-start_time = time.time()
-
-log = []
-for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
+def process_tile(tile_path):
     # Get tile id
     tile_id = os.path.basename(tile_path).replace("TIL_", "").replace("_0.geojson", "")
     print(f"\n>>> Processing tile: {tile_id}")
@@ -65,7 +63,6 @@ for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
 
     # Define output rasters
     bin_raster = os.path.join(output_dir, f"BIN_{tile_id}.tif")
-    fil_raster = os.path.join(output_dir, f"FIL_{tile_id}.tif")
     com_raster = os.path.join(output_dir, f"MPM_{tile_id}.tif")
 
     # Check if all input rasters exist
@@ -73,11 +70,12 @@ for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
                    rivers_raster, coastline_raster, subsidence_raster]
         
     # Check for missing rasters
+    tile_log = []
     for raster in input_rasters:
         if not os.path.exists(raster):
             # Record missing raster in log
             print(f"⚠️ Raster missing for tile {tile_id}: {raster}")
-            log.append({"tile_id": tile_id, "missing_file": raster})
+            tile_log.append({"tile_id": tile_id, "missing_file": raster})
 
             # Copy EMA template to the missing raster path
             try:
@@ -89,7 +87,13 @@ for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
     missing = [r for r in input_rasters if not os.path.exists(r)]
     if missing:
         print(f"⚠️ Missing raster(s) for tile {tile_id}: {missing}")
-        continue
+        return tile_log
+
+    # Skip tile if MPM is up to date
+    manifest_entry = get_manifest_entry([__file__] + input_rasters, {})
+    if incremental and is_up_to_date(manifest_dir, "MPM", tile_id, [com_raster], manifest_entry):
+        print(f"✔ Up to date: {com_raster}")
+        return tile_log
 
     # Add rasters
     expression = (
@@ -106,25 +110,35 @@ for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
     raster_calculator(expression, input_rasters, bin_raster)
 
     # Fill no data and compress raster
-    fill_and_compress(bin_raster, fil_raster, com_raster, '')
+    fill_and_write(bin_raster, com_raster, **raster_write_options)
 
     print(f"✔ Saved: {com_raster}")
+    write_manifest(manifest_dir, "MPM", tile_id, [com_raster], manifest_entry)
 
     # Remove intermediate files
-    remove_temp_files([bin_raster, fil_raster])
+    remove_temp_files([bin_raster])
+
+    return tile_log
+
+if __name__ == "__main__":
+    # ------ Processing data -----------
+    start_time = time.time()
+
+    tile_paths = get_tile_paths(tiles_dir, '_0.geojson')
+    log = process_tiles(process_tile, tile_paths, n_workers)
 
-# Save log  
-log_df = pd.DataFrame(log)
-log_csv_path = os.path.join(output_dir, f"MPM.csv")
-log_df.to_csv(log_csv_path, index=False)
-print(f"Processing finished. Log saved to {log_csv_path}")
+    # Save log  
+    log_df = pd.DataFrame(log)
+    log_csv_path = os.path.join(output_dir, f"MPM.csv")
+    log_df.to_csv(log_csv_path, index=False)
+    print(f"Processing finished. Log saved to {log_csv_path}")
 
-# Remove .xml files created by qgis when a files is opened
-delete_xml_files(output_dir)
+    # Remove .xml files created by qgis when a files is opened
+    delete_xml_files(output_dir)
 
-# Close qgis
-# qgs.exitQgis()
+    # Close qgis
+    # qgs.exitQgis()
 
-end_time = time.time()
+    end_time = time.time()
 
-get_processing_time(start_time, end_time, time_logfile)
\ No newline at end of file
+    get_processing_time(start_time, end_time, time_logfile)
\ No newline at end of file
@@ -1,9 +1,15 @@
 import os
 import re
+import math
 import glob
+import json
+import hashlib
 import inspect
+import multiprocessing
+import xml.etree.ElementTree as ET
+import pandas as pd
+import shapely
 import geopandas as gpd
-from shapely.geometry import Polygon, MultiPolygon
 
 def get_processing_time(start_time, end_time, time_logfile): 
     elapsed_seconds = end_time - start_time
@@ -41,6 +47,231 @@ def delete_geojson_files(directory):
         except OSError as e:
             print(f"⚠️ Could not delete {tide_path}: {e}")
 
+def delete_fgb_files(directory):
+    for vector_path in glob.glob(os.path.join(directory, "*.fgb")):
+        try:
+            os.remove(vector_path)
+            print(f"🗑️ Deleted .fgb file: {vector_path}")
+        except OSError as e:
+            print(f"⚠️ Could not delete {vector_path}: {e}")
+
+def get_tile_paths(tiles_dir, suffix="_0.geojson"):
+    return sorted(glob.glob(os.path.join(tiles_dir, f'*{suffix}')))
+
+def set_gdal_cache(cachemax_mb=1024, vsi_cache_mb=256):
+    """
+    Block cache for the rasters read in this process and in the gdal subprocesses started by QGIS,
+    so decompressed blocks of the global mosaics are reused by neighbouring tiles.
+    Values already set in the environment are kept.
+    """
+    os.environ.setdefault("GDAL_CACHEMAX", str(cachemax_mb))
+    os.environ.setdefault("VSI_CACHE", "TRUE")
+    os.environ.setdefault("VSI_CACHE_SIZE", str(vsi_cache_mb * 1024 * 1024))
+
+def initialize_worker(initializer=None, initargs=()):
+    set_gdal_cache()
+    if initializer is not None:
+        initializer(*initargs)
+
+def process_tiles(process_tile, tile_paths, n_workers=1, initializer=None, initargs=()):
+    """
+    Runs process_tile(tile_path) for every tile, in a pool of n_workers processes when n_workers > 1.
+    The initializer (e.g. qgis_utilities.initialize_qgis_worker) is called once per worker process.
+    Returns the per-tile logs: dicts (or lists of dicts) returned by process_tile, None values are skipped.
+    """
+    if n_workers is None or n_workers <= 1 or len(tile_paths) <= 1:
+        initialize_worker(initializer, initargs)
+        results = [process_tile(tile_path) for tile_path in tile_paths]
+    else:
+        n_workers = min(n_workers, len(tile_paths))
+        print(f">>> Processing {len(tile_paths)} tiles with {n_workers} workers")
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(n_workers, initializer=initialize_worker, initargs=(initializer, initargs)) as pool:
+            results = list(pool.imap(process_tile, tile_paths, chunksize=1))
+
+    log = []
+    for result in results:
+        if isinstance(result, list):
+            log.extend(result)
+        elif result is not None:
+            log.append(result)
+    return log
+
+def get_tile_id(tile_path, suffix="_0.geojson"):
+    return os.path.basename(tile_path).replace("TIL_", "").replace(suffix, "")
+
+tiles_bounds = {}  # Bounds indexes already read in this process, keyed by tiles directory
+
+def lookup_tile_bounds(tile_path):
+    # Bounds of a TIL_{id}_{buffer} vector in the index written by 01_processing_tiles.py, None if not indexed
+    tiles_dir = os.path.dirname(os.path.abspath(tile_path))
+    if tiles_dir not in tiles_bounds:
+        index_path = get_tiles_bounds_path(tiles_dir)
+        tiles_bounds[tiles_dir] = {}
+        if os.path.exists(index_path):
+            with open(index_path, "r") as f:
+                tiles_bounds[tiles_dir] = json.load(f)
+    name = os.path.splitext(os.path.basename(tile_path))[0].replace("TIL_", "")
+    tile_id, _, buffer_meters = name.rpartition("_")
+    return tiles_bounds[tiles_dir].get(tile_id, {}).get(buffer_meters)
+
+def get_tile_bounds(tile_path, rounding=True):
+    # Same extent as qgis_utilities.get_projwin, returned as (xmin, ymin, xmax, ymax)
+    # The vector is read only for tiles missing from the bounds index
+    bounds = lookup_tile_bounds(tile_path)
+    if bounds is None:
+        bounds = gpd.read_file(tile_path).total_bounds
+    xmin, ymin, xmax, ymax = bounds
+    if rounding:
+        return (round(xmin), round(ymin), round(xmax), round(ymax))
+    return (xmin, ymin, xmax, ymax)
+
+def get_tile_projwin(tile_path, rounding=True):
+    # Same string as qgis_utilities.get_projwin without opening a QgsVectorLayer
+    xmin, ymin, xmax, ymax = get_tile_bounds(tile_path, rounding)
+    projwin = f"{xmin},{xmax},{ymax},{ymin} [EPSG:4326]"
+    print(projwin)
+    return projwin
+
+def get_snapped_bounds(bounds, resolution):
+    # Expand bounds to multiples of resolution, so every tile warped with them is on the same global pixel grid
+    xmin, ymin, xmax, ymax = bounds
+    return (
+        math.floor(xmin / resolution) * resolution,
+        math.floor(ymin / resolution) * resolution,
+        math.ceil(xmax / resolution) * resolution,
+        math.ceil(ymax / resolution) * resolution
+    )
+
+# ------ Incremental rebuild manifest -----------
+# Every tile product gets a sidecar JSON in the manifest directory with the stamps of the
+# inputs and the config values that produced it. A product is recomputed only when one of
+# them changed or when the output is missing or was overwritten.
+
+file_hashes = {}  # Hashes of the files already read in this process, keyed by (path, size, mtime)
+vrt_source_files = {}  # Source files of the VRTs already parsed in this process, keyed by (path, size, mtime)
+large_file_size = 64 << 20  # Inputs above this size (the global rasters) are stamped by size and mtime, not hashed
+
+# The shared modules are inputs of every product, so a fix in them rebuilds the old outputs
+utility_modules = [os.path.join(os.path.dirname(os.path.abspath(__file__)), f"{name}.py")
+                   for name in ["general_utilities", "ras_utilities", "qgis_utilities"]]
+
+def get_file_hash(file_path):
+    if not os.path.exists(file_path):
+        return None
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    if key not in file_hashes:
+        sha1 = hashlib.sha1()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha1.update(chunk)
+        file_hashes[key] = sha1.hexdigest()
+    return file_hashes[key]
+
+def get_size_stamp(file_path):
+    # Changes whenever the file is rewritten, without reading it
+    if not os.path.exists(file_path):
+        return None
+    stat = os.stat(file_path)
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+def get_vrt_source_files(vrt_path):
+    # Source files of a VRT, resolved relative to it when needed. A file that is not VRT XML has none.
+    stat = os.stat(vrt_path)
+    key = (os.path.abspath(vrt_path), stat.st_size, stat.st_mtime_ns)
+    if key not in vrt_source_files:
+        try:
+            source_elements = list(ET.parse(vrt_path).getroot().iter("SourceFilename"))
+        except ET.ParseError:
+            source_elements = []
+        sources = []
+        for source_file in source_elements:
+            path = source_file.text
+            if source_file.get("relativeToVRT") == "1":
+                path = os.path.join(os.path.dirname(vrt_path), path)
+            sources.append(path)
+        vrt_source_files[key] = list(dict.fromkeys(sources))
+    return vrt_source_files[key]
+
+def get_input_stamp(file_path):
+    """
+    Manifest stamp of an input: the hash of small files (per tile rasters and vectors, scripts), the size
+    and mtime of large ones (the global rasters) and, for a VRT, the hash of its XML together with the
+    size and mtime of every source file, so that a rewritten source tile is detected too.
+    """
+    if not os.path.exists(file_path):
+        return None
+    if file_path.endswith(".vrt"):
+        stamps = [get_file_hash(file_path)] + [get_size_stamp(p) for p in get_vrt_source_files(file_path)]
+        return hashlib.sha1(json.dumps(stamps).encode()).hexdigest()
+    if os.path.getsize(file_path) > large_file_size:
+        return get_size_stamp(file_path)
+    return get_file_hash(file_path)
+
+def get_manifest_entry(inputs, params):
+    # Round trip through json so entries compare equal to the ones read from disk
+    entry = {
+        "inputs": {os.path.basename(p): get_input_stamp(p) for p in list(inputs) + utility_modules},
+        "params": params,
+    }
+    return json.loads(json.dumps(entry, sort_keys=True))
+
+def get_manifest_path(manifest_dir, product, tile_id):
+    return os.path.join(manifest_dir, f"{product}_{tile_id}.json")
+
+def is_up_to_date(manifest_dir, product, tile_id, outputs, entry):
+    manifest_path = get_manifest_path(manifest_dir, product, tile_id)
+    if not os.path.exists(manifest_path) or not all(os.path.exists(p) for p in outputs):
+        return False
+    with open(manifest_path, "r") as f:
+        manifest = json.load(f)
+    if manifest.get("inputs") != entry["inputs"] or manifest.get("params") != entry["params"]:
+        return False
+    # Outputs are only stamped, a product overwritten by another run changes its size or mtime
+    return manifest.get("outputs") == {os.path.basename(p): get_size_stamp(p) for p in outputs}
+
+def write_manifest(manifest_dir, product, tile_id, outputs, entry):
+    manifest = dict(entry, outputs={os.path.basename(p): get_size_stamp(p) for p in outputs})
+    with open(get_manifest_path(manifest_dir, product, tile_id), "w") as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+
+# ------ Feature store -----------
+# Global vector layers (coastline, rivers) are read once per process and every tile gets only
+# the candidate features of the spatial index, instead of parsing the whole layer per tile.
+
+feature_layers = {}  # Layers already read in this process, keyed by (path, columns)
+
+def get_feature_parquet(features_path, output_dir):
+    # GeoParquet copy of a vector layer, rewritten only when the source is newer
+    parquet_path = os.path.join(output_dir, os.path.splitext(os.path.basename(features_path))[0] + ".parquet")
+    if os.path.exists(parquet_path) and os.path.getmtime(parquet_path) >= os.path.getmtime(features_path):
+        return parquet_path
+    try:
+        gpd.read_file(features_path).to_parquet(parquet_path)
+    except ImportError as e:
+        print(f"⚠️ Could not write GeoParquet copy of {features_path}, reading the source instead: {e}")
+        return features_path
+    print(f"✔ Saved: {parquet_path}")
+    return parquet_path
+
+def get_feature_layer(features_path, columns=None):
+    key = (features_path, tuple(columns) if columns else None)
+    if key not in feature_layers:
+        if features_path.endswith(".parquet"):
+            layer = gpd.read_parquet(features_path, columns=columns)
+        else:
+            layer = gpd.read_file(features_path, columns=columns)
+        layer.sindex  # Build the STRtree once
+        feature_layers[key] = layer
+    return feature_layers[key]
+
+def get_candidate_features(features_path, geometry, crs, columns=None):
+    # Features of the layer whose bounding box intersects the geometry (given in crs)
+    layer = get_feature_layer(features_path, columns)
+    query = gpd.GeoSeries([geometry], crs=crs).to_crs(layer.crs).iloc[0]
+    return layer.iloc[sorted(layer.sindex.query(query))]
+
 def normalize_id_name(tile_id):
     lon, lat = tile_id.split("_")  # e.g., W117, N32
     lat_dir = lat[0]
@@ -52,6 +283,12 @@ def normalize_id_name(tile_id):
     return f"{lat_fmt}{lon_fmt}"
 
 def normalize_id_gdf(lat, lon):
+    # Whole lat/lon columns at once, with the same format as below
+    if isinstance(lat, pd.Series):
+        lat_fmt = lat.ge(0).map({True: 'N', False: 'S'}) + lat.astype(int).abs().astype(str).str.zfill(2)
+        lon_fmt = lon.ge(0).map({True: 'E', False: 'W'}) + lon.astype(int).abs().astype(str).str.zfill(3)
+        return lat_fmt + lon_fmt
+
     # Latitude
     lat_dir = 'N' if lat >= 0 else 'S'
     lat_num = abs(int(lat))
@@ -72,7 +309,7 @@ def get_clark_tiles_ids(clark_dir):
 
 def get_clark_geometries(tiles_geometries, normalized_ids, output_dir):
     gdf = gpd.read_file(tiles_geometries)
-    gdf['id'] = gdf.apply(lambda row: normalize_id_gdf(row['lat'], row['lon']), axis=1)
+    gdf['id'] = normalize_id_gdf(gdf['lat'], gdf['lon'])
     selected = gdf[gdf["id"].isin(normalized_ids)]
 
     # Rise message in case there are tiles not found
@@ -131,6 +368,14 @@ def get_gmw_geometries_by_latitude(gmw_tiles, clark_tiles, output_dir):
 
     return filtered_clark_tiles
 
+def get_overlapping_names(geometries, features, name_col):
+    # Unique names of the features intersecting every geometry, ['any'] if none, from one bulk STRtree query
+    geometry_idx, feature_idx = features.sindex.query(geometries, predicate="intersects")
+    pairs = pd.DataFrame({"geometry": geometry_idx, "feature": feature_idx}).sort_values(["geometry", "feature"])
+    pairs["name"] = features[name_col].values[pairs["feature"]]
+    names = pairs.drop_duplicates(["geometry", "name"]).groupby("geometry")["name"].agg(list)
+    return [names.get(i, ['any']) for i in range(len(geometries))]
+
 def add_strm_and_country_info(gmw_tiles, srtm_zip_path, countries_path, list_countries, output_dir):
 
     # Load data
@@ -138,7 +383,7 @@ def add_strm_and_country_info(gmw_tiles, srtm_zip_path, countries_path, list_cou
     countries = gpd.read_file(countries_path)
 
     # Drop Z from geometry
-    gmw_tiles['geometry'] = gmw_tiles['geometry'].apply(drop_z)
+    gmw_tiles['geometry'] = drop_z(gmw_tiles['geometry'])
 
     # Add SRTM ID to tiles
     gmw_tiles = add_overlapping_id_with_buffer(
@@ -149,23 +394,8 @@ def add_strm_and_country_info(gmw_tiles, srtm_zip_path, countries_path, list_cou
     if countries.crs != gmw_tiles.crs:
         countries = countries.to_crs(gmw_tiles.crs)
 
-    # Build spatial index for countries
-    countries_sindex = countries.sindex
-
     # Store overlapping country names
-    country_names_list = []
-
-    for tile_geom in gmw_tiles.geometry:
-        possible_matches_idx = list(countries_sindex.intersection(tile_geom.bounds))
-        possible_matches = countries.iloc[possible_matches_idx]
-        overlapping = possible_matches[possible_matches.intersects(tile_geom)]
-
-        if not overlapping.empty:
-            country_names = overlapping['name'].unique().tolist()
-        else:
-            country_names = ['any']
-
-        country_names_list.append(country_names)
+    country_names_list = get_overlapping_names(gmw_tiles.geometry, countries, 'name')
 
     # Add new columns to tiles
     gmw_tiles['countries'] = country_names_list
@@ -194,29 +424,14 @@ def add_country_info(gmw_tiles, countries_path, list_countries, output_dir):
     countries = gpd.read_file(countries_path)
 
     # Drop Z from geometry
-    gmw_tiles['geometry'] = gmw_tiles['geometry'].apply(drop_z)
+    gmw_tiles['geometry'] = drop_z(gmw_tiles['geometry'])
 
     # Reproject countries if needed
     if countries.crs != gmw_tiles.crs:
         countries = countries.to_crs(gmw_tiles.crs)
 
-    # Build spatial index for countries
-    countries_sindex = countries.sindex
-
     # Store overlapping country names
-    country_names_list = []
-
-    for tile_geom in gmw_tiles.geometry:
-        possible_matches_idx = list(countries_sindex.intersection(tile_geom.bounds))
-        possible_matches = countries.iloc[possible_matches_idx]
-        overlapping = possible_matches[possible_matches.intersects(tile_geom)]
-
-        if not overlapping.empty:
-            country_names = overlapping['name'].unique().tolist()
-        else:
-            country_names = ['any']
-
-        country_names_list.append(country_names)
+    country_names_list = get_overlapping_names(gmw_tiles.geometry, countries, 'name')
 
     # Add new columns to tiles
     gmw_tiles['countries'] = country_names_list
@@ -238,88 +453,120 @@ def add_country_info(gmw_tiles, countries_path, list_countries, output_dir):
 
     return gmw_tiles
 
-def get_tiles_vector(output_dir, tiles_geometry):
-    for i, row in tiles_geometry.iterrows():
-        # Convert the row to a GeoDataFrame using .loc[[i]]
-        tile_geom = tiles_geometry.loc[[i]]
+def get_buffered_tiles(tiles_geometry, buffer_crs, buffers):
+    # Buffered geometries of all tiles for every distance, reprojecting the whole tile set to buffer_crs once
+    tiles_proj = tiles_geometry.geometry.to_crs(buffer_crs)
+    return {buffer_meters: tiles_proj.buffer(buffer_meters).to_crs(tiles_geometry.crs) for buffer_meters in buffers}
 
-        output_path = os.path.join(output_dir, f"TIL_{row['id']}_0.geojson")
-        tile_geom.to_file(output_path, driver="GeoJSON")
+def write_tiles_vector(output_dir, tiles_geometry, buffer_meters):
+    # One TIL_{id}_{buffer_meters}.geojson per tile
+    for i, tile_id in enumerate(tiles_geometry['id']):
+        output_path = os.path.join(output_dir, f"TIL_{tile_id}_{str(buffer_meters)}.geojson")
+        tiles_geometry.iloc[[i]].to_file(output_path, driver="GeoJSON")
 
         print(f"Saved: {output_path}")
 
     print("\n")
 
-def get_tiles_vector_with_buffer(output_folder, gmw_tiles_country, buffer_crs, buffer_meters):
-
-    original_crs = gmw_tiles_country.crs
-
-    for i, row in gmw_tiles_country.iterrows():
-        # Select row as GeoDataFrame
-        tile_geom = gmw_tiles_country.loc[[i]]
-
-        # Reproject to buffer CRS
-        tile_geom_proj = tile_geom.to_crs(buffer_crs)
-
-        # Apply buffer
-        tile_geom_proj['geometry'] = tile_geom_proj.buffer(buffer_meters)
-
-        # Reproject back to original CRS
-        tile_geom_buffered = tile_geom_proj.to_crs(original_crs)
-
-        # Output path
-        output_path = os.path.join(output_folder, f"TIL_{row['id']}_{str(buffer_meters)}.geojson")
-
-        # Save to GeoJSON
-        tile_geom_buffered.to_file(output_path, driver="GeoJSON")
-
-        print(f"Saved: {output_path}")
+def get_tiles_vector(output_dir, tiles_geometry):
+    write_tiles_vector(output_dir, tiles_geometry, 0)
 
-    print("\n")
+def get_tiles_vector_with_buffer(output_folder, gmw_tiles_country, buffer_crs, buffer_meters):
+    tiles_buffered = gmw_tiles_country.copy()
+    tiles_buffered['geometry'] = get_buffered_tiles(gmw_tiles_country, buffer_crs, [buffer_meters])[buffer_meters]
+    write_tiles_vector(output_folder, tiles_buffered, buffer_meters)
+
+def get_tiles_vectors(output_dir, tiles_geometry, buffer_crs, buffers):
+    """
+    Writes the TIL_{id}_0 vectors, the TIL_{id}_{buffer} vectors for every buffer and the tiles catalog
+    in one call. The buffers of all tiles are computed together, with a single reprojection of the tile set.
+    """
+    buffered = get_buffered_tiles(tiles_geometry, buffer_crs, buffers)
+    write_tiles_vector(output_dir, tiles_geometry, 0)
+    for buffer_meters in buffers:
+        tiles_buffered = tiles_geometry.copy()
+        tiles_buffered['geometry'] = buffered[buffer_meters]
+        write_tiles_vector(output_dir, tiles_buffered, buffer_meters)
+    get_tiles_catalog(output_dir, tiles_geometry, buffer_crs, buffers, buffered)
+
+def get_tiles_catalog(output_dir, tiles_geometry, buffer_crs, buffers, buffered=None):
+    # Single catalog of all tiles (id, countries, bounds and buffered geometries) instead of reading the per tile vectors
+    if buffered is None:
+        buffered = get_buffered_tiles(tiles_geometry, buffer_crs, buffers)
+    catalog = tiles_geometry.copy()
+    catalog[["xmin", "ymin", "xmax", "ymax"]] = catalog.geometry.bounds.values
+    for buffer_meters in buffers:
+        catalog[f"geometry_{buffer_meters}"] = buffered[buffer_meters]
+
+    catalog_path = get_tiles_catalog_path(output_dir)
+    try:
+        catalog.to_parquet(catalog_path, index=False)
+        print(f"Saved: {catalog_path}")
+    except ImportError as e:
+        # read_tiles_catalog falls back to the TIL_{id}_{buffer} vectors
+        print(f"⚠️ Could not write the tiles catalog, the tile vectors are read instead: {e}")
+
+    # Bounds index of every tile vector, read by get_tile_bounds without geopandas or QGIS layers
+    index = {tile_id: {} for tile_id in catalog["id"]}
+    for buffer_meters in [0] + buffers:
+        geometry = catalog.geometry if buffer_meters == 0 else catalog[f"geometry_{buffer_meters}"]
+        for tile_id, bounds in zip(catalog["id"], geometry.bounds.values.tolist()):
+            index[tile_id][str(buffer_meters)] = bounds
+    index_path = get_tiles_bounds_path(output_dir)
+    with open(index_path, "w") as f:
+        json.dump(index, f, indent=4)
+    print(f"Saved: {index_path}")
+
+def get_tiles_catalog_path(tiles_dir):
+    return os.path.join(tiles_dir, "TIL_catalog.parquet")
+
+def get_tiles_bounds_path(tiles_dir):
+    return os.path.join(tiles_dir, "TIL_bounds.json")
+
+def has_tiles_catalog(tiles_dir, buffer_meters=0):
+    # True when read_tiles_catalog can read the tiles, from the catalog or from the tile vectors
+    return os.path.exists(get_tiles_catalog_path(tiles_dir)) or bool(get_tile_paths(tiles_dir, f"_{buffer_meters}.geojson"))
+
+def read_tiles_catalog(tiles_dir, buffer_meters=0):
+    # Tiles catalog of 01_processing_tiles.py with the tile buffered by buffer_meters as active geometry
+    catalog_path = get_tiles_catalog_path(tiles_dir)
+    if os.path.exists(catalog_path):
+        try:
+            catalog = gpd.read_parquet(catalog_path)
+            if buffer_meters:
+                catalog = catalog.set_geometry(f"geometry_{buffer_meters}")
+            return catalog.set_index("id", drop=False)
+        except ImportError as e:
+            print(f"⚠️ Could not read {catalog_path}, reading the tile vectors instead: {e}")
+    # Without pyarrow, the same tiles from the TIL_{id}_{buffer_meters} vectors
+    tile_paths = get_tile_paths(tiles_dir, f"_{buffer_meters}.geojson")
+    catalog = pd.concat([gpd.read_file(tile_path) for tile_path in tile_paths], ignore_index=True)
+    return catalog.set_index("id", drop=False)
 
 def drop_z(geom):
-    if geom.has_z:
-        # Extract only XY coords, drop Z
-        if geom.geom_type == 'Polygon':
-            exterior = [(x, y) for x, y, z in geom.exterior.coords]
-            interiors = [[(x, y) for x, y, z in ring.coords] for ring in geom.interiors]
-            return Polygon(exterior, interiors)
-        elif geom.geom_type == 'MultiPolygon':
-            polygons = []
-            for poly in geom.geoms:
-                exterior = [(x, y) for x, y, z in poly.exterior.coords]
-                interiors = [[(x, y) for x, y, z in ring.coords] for ring in poly.interiors]
-                polygons.append(Polygon(exterior, interiors))
-            return MultiPolygon(polygons)
-    else:
-        return geom
-    
+    # Extract only XY coords, drop Z. A GeoSeries is converted at once with shapely 2
+    if isinstance(geom, gpd.GeoSeries):
+        return gpd.GeoSeries(shapely.force_2d(geom.array), index=geom.index, crs=geom.crs)
+    return shapely.force_2d(geom)
+
 def add_overlapping_id_with_buffer(gdf1, gdf2, id_col='id', new_col='srtm_id', crs_proj='EPSG:3857', buffer_m=500):
     # Reproject both GeoDataFrames to projected CRS for accurate distance calculations
     gdf1_proj = gdf1.to_crs(crs_proj).copy()
     gdf2_proj = gdf2.to_crs(crs_proj).copy()
 
-    gdf1_proj[new_col] = None
-    sindex = gdf2_proj.sindex
-
-    for idx1, geom1 in gdf1_proj.geometry.items():
-        possible_matches_index = list(sindex.intersection(geom1.bounds))
-        possible_matches = gdf2_proj.iloc[possible_matches_index]
-
-        precise_matches = possible_matches[possible_matches.intersects(geom1)]
-        if precise_matches.empty:
-            continue
-
-        centroid1 = geom1.centroid
-        # Create buffer of specified meters around centroid1
-        centroid_buffer = centroid1.buffer(buffer_m)
+    # All intersecting pairs from one bulk STRtree query
+    idx1, idx2 = gdf2_proj.sindex.query(gdf1_proj.geometry, predicate="intersects")
 
-        # Select geometries whose centroid intersects with the buffer zone
-        candidate_matches = precise_matches[precise_matches.geometry.centroid.intersects(centroid_buffer)]
+    # Select pairs whose centroids are within buffer_m of each other
+    centroids1 = gpd.GeoSeries(gdf1_proj.geometry.centroid.values[idx1])
+    centroids2 = gpd.GeoSeries(gdf2_proj.geometry.centroid.values[idx2])
+    within = (centroids1.distance(centroids2) <= buffer_m).values
 
-        if not candidate_matches.empty:
-            # Assign the id of the first matched geometry (you can modify to handle multiple)
-            gdf1_proj.at[idx1, new_col] = candidate_matches.iloc[0][id_col]
+    # Assign the id of the first matched geometry (you can modify to handle multiple)
+    matches = pd.DataFrame({"idx1": idx1[within], "idx2": idx2[within]}).sort_values(["idx1", "idx2"]).drop_duplicates("idx1")
+    ids = pd.Series(None, index=gdf1_proj.index, dtype=object)
+    ids.iloc[matches["idx1"].values] = gdf2_proj[id_col].values[matches["idx2"].values]
+    gdf1_proj[new_col] = ids
 
     # Optionally transform back to original CRS
     gdf1_final = gdf1_proj.to_crs(gdf1.crs)
@@ -337,7 +584,7 @@ def get_country_tiles(geojson_path, srtm_zip_path, countries_path, country_name)
     srtm_grid = gpd.read_file(f"zip://{srtm_zip_path}")
 
     # Correct tile data and add srtm id
-    gmw_tiles['geometry'] = gmw_tiles['geometry'].apply(drop_z)
+    gmw_tiles['geometry'] = drop_z(gmw_tiles['geometry'])
     gmw_tiles = add_overlapping_id_with_buffer(gmw_tiles, srtm_grid, id_col='id', new_col='id', crs_proj='EPSG:3857')
 
     # Filter to overlapping with country
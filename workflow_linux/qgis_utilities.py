@@ -60,6 +60,20 @@ def initialize_processing():
     QgsApplication.processingRegistry().addProvider(QgsNativeAlgorithms())
     print("Processing native algorithms initialized successfully.")
 
+# QGIS application of the current (worker) process, kept alive until the process exits
+qgs_worker = None
+
+def initialize_qgis_worker(qgis_env_path: str):
+    """
+    Initializes QGIS and the processing algorithms once per process.
+    Used as initializer of the tile scheduler (general_utilities.process_tiles).
+    """
+    global qgs_worker
+    if qgs_worker is None:
+        qgs_worker = initialize_qgis(qgis_env_path)
+        initialize_processing()
+    return qgs_worker
+
 def get_projwin(tile_path, rounding=True):
     vlayer = QgsVectorLayer(tile_path, "tile", "ogr")
     if not vlayer.isValid():
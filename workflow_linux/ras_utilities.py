@@ -1,26 +1,76 @@
 import os
-import glob
+import re
+import math
+import json
+import shutil
+import zipfile
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+from contextlib import contextmanager
+from functools import partial
 import numpy as np
 import geopandas as gpd
 import pandas as pd
 import rasterio
 import rasterio.mask
-from shapely.geometry import mapping
-import rasterio
-import numpy as np
-from scipy.ndimage import binary_dilation
+import rasterio.features
+import rasterio.fill
+import rasterio.warp
+import rasterio.shutil
+from shapely.geometry import mapping, box
+from scipy.ndimage import binary_dilation, distance_transform_edt
+from scipy.spatial import cKDTree
+from affine import Affine
+from rasterio.crs import CRS
+from rasterio.enums import Resampling
+from rasterio.transform import from_origin, from_bounds, array_bounds
+from rasterio.vrt import WarpedVRT
+from rasterio.windows import Window
+from general_utilities import (
+    get_tile_paths,
+    process_tiles,
+    get_candidate_features,
+    get_file_hash,
+    get_tile_bounds,
+    has_tiles_catalog,
+    read_tiles_catalog
+)
 
-def apply_dilation(raster_data, output_path, distance_m, meters_per_pixel, profile):
+def get_dilation(raster_data, distance_m, meters_per_pixel):
     radius_px = distance_m / meters_per_pixel
     y, x = np.ogrid[-radius_px:radius_px+1, -radius_px:radius_px+1]
     structure = (x**2 + y**2) <= radius_px**2
     dilated_mask = binary_dilation(raster_data == 1, structure=structure)
-    dilated_data = dilated_mask.astype(np.uint8)
+    return dilated_mask.astype(np.uint8)
+
+def apply_dilation(raster_data, output_path, distance_m, meters_per_pixel, profile):
+    dilated_data = get_dilation(raster_data, distance_m, meters_per_pixel)
 
     with rasterio.open(output_path, 'w', **profile) as dst:
         dst.write(dilated_data, 1)
     print(f"✔ Dilation ({distance_m}m) saved to: {output_path}")
 
+def get_distance(raster_data, meters_per_pixel):
+    # Euclidean distance in meters from every pixel to the nearest pixel equal to 1
+    mask = raster_data == 1
+    if not mask.any():
+        return np.full(raster_data.shape, np.inf)
+    return distance_transform_edt(~mask) * meters_per_pixel
+
+def get_proximity_bands(raster_data, distances_m, meters_per_pixel):
+    """
+    Same bands as get_dilation for every distance (pixels within distance_m of a pixel equal to 1),
+    derived from a single distance transform instead of one binary_dilation per distance.
+    Returns the bands and their sum (the ADD_ raster of step 15).
+    """
+    distance = get_distance(raster_data, meters_per_pixel)
+    bands = {}
+    count = np.zeros(raster_data.shape, dtype=np.uint8)
+    for distance_m in distances_m:
+        bands[distance_m] = (distance <= distance_m).astype(np.uint8)
+        count += bands[distance_m]
+    return bands, count
+
 def buffer_features(features_gdf, buffer_m):
     features_proj = features_gdf.to_crs(epsg=3857)
     features_proj['geometry'] = features_proj.geometry.buffer(buffer_m)
@@ -29,8 +79,6 @@ def buffer_features(features_gdf, buffer_m):
 
 def clip_river_to_single_tile(features_path, tile_path, output_dir, prefix, buffer_m, tile_id, tile_log):
 
-    # Read features
-    features_gdf = gpd.read_file(features_path, columns=["QMEAN", "width_m", "geometry"])
     tile_gdf = gpd.read_file(tile_path)
 
     # Clip features to buffered tile geometry
@@ -38,6 +86,9 @@ def clip_river_to_single_tile(features_path, tile_path, output_dir, prefix, buff
     tile_proj = tile_geom.to_crs(epsg=3857)  # project to meters
     tile_buffered = tile_proj.buffer(buffer_m)  # This buffer is applied over the tiles to extract data in the proximities of the tiles
     tile_buffered = tile_buffered.to_crs(tile_gdf.crs).iloc[0]  # back to original CRS and single geometry
+
+    # Read only the candidate features of the buffered tile
+    features_gdf = get_candidate_features(features_path, tile_buffered, tile_gdf.crs, columns=["QMEAN", "width_m", "geometry"])
     clipped = gpd.clip(features_gdf, tile_buffered)
 
     if len(clipped) > 0:
@@ -50,8 +101,8 @@ def clip_river_to_single_tile(features_path, tile_path, output_dir, prefix, buff
         clipped = clipped.dissolve() 
         buffered = buffer_features(clipped, buffer_m)
         buffered = gpd.clip(buffered, tile_gdf['geometry'])
-        out_file = os.path.join(output_dir, f"{prefix}_{tile_id}_{str(buffer_m)}.geojson")
-        buffered.to_file(out_file, driver="GeoJSON")
+        out_file = os.path.join(output_dir, f"{prefix}_{tile_id}_{str(buffer_m)}.fgb")
+        buffered.to_file(out_file, driver="FlatGeobuf")
         tile_log.append({"tile_id": tile_id, "has_features": True})
     else:
         print(f"Tile {tile_id} has no features, skipping save.")
@@ -61,8 +112,6 @@ def clip_river_to_single_tile(features_path, tile_path, output_dir, prefix, buff
 
 def clip_coastline_to_single_tile(features_path, tile_path, output_dir, prefix, buffer_m, tile_id, tile_log):
 
-    # Read features
-    features_gdf = gpd.read_file(features_path)
     tile_gdf = gpd.read_file(tile_path)
 
     # Clip features to buffered tile geometry
@@ -70,14 +119,17 @@ def clip_coastline_to_single_tile(features_path, tile_path, output_dir, prefix,
     tile_proj = tile_geom.to_crs(epsg=3857)  # project to meters
     tile_buffered = tile_proj.buffer(buffer_m)  # This buffer is applied over the tiles to extract data in the proximities of the tiles
     tile_buffered = tile_buffered.to_crs(tile_gdf.crs).iloc[0]  # back to original CRS and single geometry
+
+    # Read only the candidate features of the buffered tile
+    features_gdf = get_candidate_features(features_path, tile_buffered, tile_gdf.crs)
     clipped = gpd.clip(features_gdf, tile_buffered)
 
     if len(clipped) > 0:
         clipped = clipped.dissolve() 
         buffered = buffer_features(clipped, buffer_m)
         buffered = gpd.clip(buffered, tile_gdf['geometry'])
-        out_file = os.path.join(output_dir, f"{prefix}_{tile_id}_{str(buffer_m)}.geojson")
-        buffered.to_file(out_file, driver="GeoJSON")
+        out_file = os.path.join(output_dir, f"{prefix}_{tile_id}_{str(buffer_m)}.fgb")
+        buffered.to_file(out_file, driver="FlatGeobuf")
         tile_log.append({"tile_id": tile_id, "has_features": True})
     else:
         print(f"Tile {tile_id} has no features, skipping save.")
@@ -85,73 +137,72 @@ def clip_coastline_to_single_tile(features_path, tile_path, output_dir, prefix,
 
     return tile_log
     
-def rasterize_tiles(buffer, prefix, tiles_dir, raster_dir, vector_dir, output_dir):
-
-    log = []
-    for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
-        tile_id = os.path.basename(tile_path).replace("TIL_", "").replace("_0.geojson", "")
-        print(f"\n>>> Processing tile: {tile_id}")
-
-        # Build file paths
-        raster_file = os.path.join(raster_dir, f"GTS_{tile_id}.tif")
-        vector_file = os.path.join(vector_dir, f"{prefix}_{tile_id}_{str(buffer)}.geojson")
-        output_file = os.path.join(output_dir, f"{prefix}_{tile_id}_{str(buffer)}.tif")
-
-        raster_exists = os.path.exists(raster_file)
-        vector_exists = os.path.exists(vector_file)
-        masked_created = False
-
-        # Skip if missing vector
-        if not vector_exists:
-            print(f"WARNING: Vector file missing for tile {tile_id}, skipping.")
-            log.append({"tile_id": tile_id, "raster_exists": raster_exists, "vector_exists": vector_exists, "masked_created": masked_created})
-            continue
+def rasterize_tile(tile_path, buffer, prefix, raster_dir, vector_dir, output_dir):
+    tile_id = os.path.basename(tile_path).replace("TIL_", "").replace("_0.geojson", "")
+    print(f"\n>>> Processing tile: {tile_id}")
 
-        # Skip if missing raster
-        if not raster_exists:
-            print(f"WARNING: Raster file missing for tile {tile_id}, skipping.")
-            log.append({"tile_id": tile_id, "raster_exists": raster_exists, "vector_exists": vector_exists, "masked_created": masked_created})
-            continue
+    # Build file paths
+    raster_file = os.path.join(raster_dir, f"GTS_{tile_id}.tif")
+    vector_file = os.path.join(vector_dir, f"{prefix}_{tile_id}_{str(buffer)}.fgb")
+    output_file = os.path.join(output_dir, f"{prefix}_{tile_id}_{str(buffer)}.tif")
 
-        try:
-            # Read vector
-            vector_gdf = gpd.read_file(vector_file)
-            if vector_gdf.empty:
-                print(f"Vector {vector_file} is empty, skipping.")
-                log.append({"tile_id": tile_id, "raster_exists": raster_exists, "vector_exists": False, "masked_created": masked_created})
-                continue
+    raster_exists = os.path.exists(raster_file)
+    vector_exists = os.path.exists(vector_file)
+    masked_created = False
 
-            # Open raster and mask
-            with rasterio.open(raster_file) as src:
-                out_image, out_transform = rasterio.mask.mask(src, [mapping(geom) for geom in vector_gdf.geometry], crop=True)
-                out_image = (out_image > 0).astype(out_image.dtype)
-                out_meta = src.meta.copy()
-
-            # Update metadata
-            out_meta.update({
-                "driver": "GTiff",
-                "height": out_image.shape[1],
-                "width": out_image.shape[2],
-                "transform": out_transform,
-                "compress": "lzw",   # ✅ Apply LZW compression
-            }) 
-
-            # Save masked raster
-            with rasterio.open(output_file, "w", **out_meta) as dest:
-                dest.write(out_image)
-
-            masked_created = True
-            print(f"Masked raster created for {tile_id}")
-
-        except Exception as e:
-            print(f"ERROR: Failed to process {tile_id} → {e}")
-
-        log.append({
-            "tile_id": tile_id,
-            "raster_exists": raster_exists,
-            "vector_exists": vector_exists,
-            "masked_created": masked_created
-        })
+    # Skip if missing vector
+    if not vector_exists:
+        print(f"WARNING: Vector file missing for tile {tile_id}, skipping.")
+        return {"tile_id": tile_id, "raster_exists": raster_exists, "vector_exists": vector_exists, "masked_created": masked_created}
+
+    # Skip if missing raster
+    if not raster_exists:
+        print(f"WARNING: Raster file missing for tile {tile_id}, skipping.")
+        return {"tile_id": tile_id, "raster_exists": raster_exists, "vector_exists": vector_exists, "masked_created": masked_created}
+
+    try:
+        # Read vector
+        vector_gdf = gpd.read_file(vector_file)
+        if vector_gdf.empty:
+            print(f"Vector {vector_file} is empty, skipping.")
+            return {"tile_id": tile_id, "raster_exists": raster_exists, "vector_exists": False, "masked_created": masked_created}
+
+        # Open raster and mask
+        with rasterio.open(raster_file) as src:
+            out_image, out_transform = rasterio.mask.mask(src, [mapping(geom) for geom in vector_gdf.geometry], crop=True)
+            out_image = (out_image > 0).astype(out_image.dtype)
+            out_meta = src.meta.copy()
+
+        # Update metadata
+        out_meta.update({
+            "driver": "GTiff",
+            "height": out_image.shape[1],
+            "width": out_image.shape[2],
+            "transform": out_transform,
+            "compress": "lzw",   # ✅ Apply LZW compression
+        }) 
+
+        # Save masked raster
+        with rasterio.open(output_file, "w", **out_meta) as dest:
+            dest.write(out_image)
+
+        masked_created = True
+        print(f"Masked raster created for {tile_id}")
+
+    except Exception as e:
+        print(f"ERROR: Failed to process {tile_id} → {e}")
+
+    return {
+        "tile_id": tile_id,
+        "raster_exists": raster_exists,
+        "vector_exists": vector_exists,
+        "masked_created": masked_created
+    }
+
+def rasterize_tiles(buffer, prefix, tiles_dir, raster_dir, vector_dir, output_dir, n_workers=1):
+
+    process_tile = partial(rasterize_tile, buffer=buffer, prefix=prefix, raster_dir=raster_dir, vector_dir=vector_dir, output_dir=output_dir)
+    log = process_tiles(process_tile, get_tile_paths(tiles_dir, '_0.geojson'), n_workers)
 
     # # Save log CSV
     # log_df = pd.DataFrame(log)
@@ -159,78 +210,77 @@ def rasterize_tiles(buffer, prefix, tiles_dir, raster_dir, vector_dir, output_di
     # log_df.to_csv(log_file, index=False)
     # print(f"Processing finished. Log saved to {log_file}")
 
-def process_tiles_clips(tiles_dir, features, buffer, prefix, output_dir):
-    log = []
-    for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
-        tile_id = os.path.basename(tile_path).replace("TIL_", "").replace("_0.geojson", "")
-        print(f"\n>>> Processing tile: {tile_id}")
-        if prefix =="RIV":
-            log = clip_river_to_single_tile(features, tile_path, output_dir, prefix, buffer, tile_id, log)
-        elif prefix =="COA":
-            log = clip_coastline_to_single_tile(features, tile_path, output_dir, prefix, buffer, tile_id, log)
-        else:
-            print(f"Unknown prefix {prefix}, skipping tile {tile_id}")
-            continue
+def clip_tile(tile_path, features, buffer, prefix, output_dir):
+    tile_id = os.path.basename(tile_path).replace("TIL_", "").replace("_0.geojson", "")
+    print(f"\n>>> Processing tile: {tile_id}")
+    if prefix =="RIV":
+        return clip_river_to_single_tile(features, tile_path, output_dir, prefix, buffer, tile_id, [])
+    elif prefix =="COA":
+        return clip_coastline_to_single_tile(features, tile_path, output_dir, prefix, buffer, tile_id, [])
+    else:
+        print(f"Unknown prefix {prefix}, skipping tile {tile_id}")
+
+def process_tiles_clips(tiles_dir, features, buffer, prefix, output_dir, n_workers=1):
+    process_tile = partial(clip_tile, features=features, buffer=buffer, prefix=prefix, output_dir=output_dir)
+    log = process_tiles(process_tile, get_tile_paths(tiles_dir, '_0.geojson'), n_workers)
     # Save log  
     # log_df = pd.DataFrame(log)
     # log_csv_path = os.path.join(output_dir, f"{prefix}_{str(buffer)}.csv")
     # log_df.to_csv(log_csv_path, index=False)
     # print(f"Processing finished. Log saved to {log_csv_path}")
 
-def process_tiles_overlay(tiles_dir, input_path, buffers):
-    for buffer in buffers:
-        log = []
-        for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
-            tile_id = os.path.basename(tile_path).replace("TIL_", "").replace("_0.geojson", "")
-            print(f"\n>>> Processing tile: {tile_id}")
-
-            # File paths
-            c300_file = os.path.join(input_path, f'COA_{tile_id}_30000.geojson')
-            riv_file = os.path.join(input_path, f'RIV_{tile_id}_{buffer}.geojson')
-            ove_file = os.path.join(input_path, f'OVE_{tile_id}_{buffer}.geojson')
-
-            # Check existence
-            C300_exists = os.path.exists(c300_file)
-            riv_exists = os.path.exists(riv_file)
-            ove_created = False
-
-            # Check RIV
-            if not riv_exists:
-                print(f"ERROR: RIV file missing for tile {tile_id}, skipping overlay.")
-                log.append({"tile_id": tile_id, "C300_exists": C300_exists, "RIV_exists": riv_exists, "OVE_created": ove_created})
-                continue
+def overlay_tile(tile_path, input_path, buffer):
+    tile_id = os.path.basename(tile_path).replace("TIL_", "").replace("_0.geojson", "")
+    print(f"\n>>> Processing tile: {tile_id}")
 
-            riv_gdf = gpd.read_file(riv_file)
-            if riv_gdf.empty:
-                print(f"ERROR: RIV file for tile {tile_id} is empty, skipping overlay.")
-                riv_exists = False
-                log.append({"tile_id": tile_id, "C300_exists": C300_exists, "RIV_exists": riv_exists, "OVE_created": ove_created})
-                continue
+    # File paths
+    c300_file = os.path.join(input_path, f'COA_{tile_id}_30000.fgb')
+    riv_file = os.path.join(input_path, f'RIV_{tile_id}_{buffer}.fgb')
+    ove_file = os.path.join(input_path, f'OVE_{tile_id}_{buffer}.fgb')
 
-            # Check C30
-            if not C300_exists:
-                print(f"ERROR: C30 file missing for tile {tile_id}, skipping overlay.")
-                log.append({"tile_id": tile_id, "C300_exists": C300_exists, "RIV_exists": riv_exists, "OVE_created": ove_created})
-                continue
+    # Check existence
+    C300_exists = os.path.exists(c300_file)
+    riv_exists = os.path.exists(riv_file)
+    ove_created = False
 
-            c30_gdf = gpd.read_file(c300_file)
-            if c30_gdf.empty:
-                print(f"ERROR: C30 file for tile {tile_id} is empty, skipping overlay.")
-                C300_exists = False
-                log.append({"tile_id": tile_id, "C300_exists": C300_exists, "RIV_exists": riv_exists, "OVE_created": ove_created})
-                continue
+    # Check RIV
+    if not riv_exists:
+        print(f"ERROR: RIV file missing for tile {tile_id}, skipping overlay.")
+        return {"tile_id": tile_id, "C300_exists": C300_exists, "RIV_exists": riv_exists, "OVE_created": ove_created}
+
+    riv_gdf = gpd.read_file(riv_file)
+    if riv_gdf.empty:
+        print(f"ERROR: RIV file for tile {tile_id} is empty, skipping overlay.")
+        riv_exists = False
+        return {"tile_id": tile_id, "C300_exists": C300_exists, "RIV_exists": riv_exists, "OVE_created": ove_created}
+
+    # Check C30
+    if not C300_exists:
+        print(f"ERROR: C30 file missing for tile {tile_id}, skipping overlay.")
+        return {"tile_id": tile_id, "C300_exists": C300_exists, "RIV_exists": riv_exists, "OVE_created": ove_created}
+
+    c30_gdf = gpd.read_file(c300_file)
+    if c30_gdf.empty:
+        print(f"ERROR: C30 file for tile {tile_id} is empty, skipping overlay.")
+        C300_exists = False
+        return {"tile_id": tile_id, "C300_exists": C300_exists, "RIV_exists": riv_exists, "OVE_created": ove_created}
 
-            # Overlay
-            try:
-                ove_gdf = gpd.overlay(c30_gdf, riv_gdf, how="intersection")
-                if len(ove_gdf) > 0:
-                    ove_gdf.to_file(ove_file, driver="GeoJSON")
-                    ove_created = True
-                    print(f"Overlay created for tile {tile_id}.")
-            except Exception as e:
-                print(f"Failed to create overlay for tile {tile_id}: {e}")
+    # Overlay
+    try:
+        ove_gdf = gpd.overlay(c30_gdf, riv_gdf, how="intersection")
+        if len(ove_gdf) > 0:
+            ove_gdf.to_file(ove_file, driver="FlatGeobuf")
+            ove_created = True
+            print(f"Overlay created for tile {tile_id}.")
+    except Exception as e:
+        print(f"Failed to create overlay for tile {tile_id}: {e}")
 
-            log.append({"tile_id": tile_id, "C300_exists": C300_exists, "RIV_exists": riv_exists, "OVE_created": ove_created})
+    return {"tile_id": tile_id, "C300_exists": C300_exists, "RIV_exists": riv_exists, "OVE_created": ove_created}
+
+def process_tiles_overlay(tiles_dir, input_path, buffers, n_workers=1):
+    for buffer in buffers:
+        process_tile = partial(overlay_tile, input_path=input_path, buffer=buffer)
+        log = process_tiles(process_tile, get_tile_paths(tiles_dir, '_0.geojson'), n_workers)
 
         # # Save log
         # log_df = pd.DataFrame(log)
@@ -238,50 +288,1090 @@ def process_tiles_overlay(tiles_dir, input_path, buffers):
         # log_df.to_csv(log_file, index=False)
         # print(f"Processing finished. Log saved to {log_file}")
 
-def clip_subsidence(tiles_dir, raster_file, output_dir, id):
+def get_mercator_sampling(grid):
+    # Pixel size (rows, cols) in EPSG:3857 units at the centre of the grid, the units used by buffer_features
+    res_x, res_y = grid.transform.a, -grid.transform.e
+    latitude = grid.transform.f - res_y * grid.height / 2
+    meters_per_degree = 6378137 * math.pi / 180
+    return (res_y * meters_per_degree / math.cos(math.radians(latitude)), res_x * meters_per_degree)
 
-    log = []
-    for tile_path in glob.glob(os.path.join(tiles_dir, '*_0.geojson')):
-        tile_id = os.path.basename(tile_path).replace("TIL_", "").replace("_0.geojson", "")
-        print(f"\n>>> Processing tile: {tile_id}")
+def get_feature_distance(geometries, grid, halo, sampling):
+    """
+    Distance from every pixel of the grid to the nearest geometry, in the units of sampling.
+    The geometries are rasterized on the grid enlarged by halo pixels, so features just outside
+    the tile are taken into account. Returns inf everywhere without features.
+    """
+    halo_grid = get_halo_grid(grid, halo)
+    shapes = [geom for geom in geometries if geom is not None and not geom.is_empty]
+    if not shapes:
+        return np.full((grid.height, grid.width), np.inf)
+    mask = rasterio.features.rasterize(shapes, out_shape=(halo_grid.height, halo_grid.width),
+                                       transform=halo_grid.transform, all_touched=True, dtype="uint8")
+    if not mask.any():
+        return np.full((grid.height, grid.width), np.inf)
+    distance = distance_transform_edt(mask == 0, sampling=sampling)
+    return distance[halo:halo + grid.height, halo:halo + grid.width]
 
-        sub_file = os.path.join(output_dir, f"CLI_{tile_id}_{id}.tif")
+def rasterize_distance_bands_tile(tile_path, coastline, rivers, coastline_buffers, rivers_buffers,
+                                  coastline_rivers_buffer, raster_dir, coastline_dir, rivers_dir):
+    """
+    Raster version of process_tiles_clips, process_tiles_overlay and rasterize_tiles for one tile.
+    The coastline and rivers are rasterized once on the GTS_ grid and every buffer is a threshold
+    of one distance transform. Writes the number of buffers each GTS_ pixel is in, the ADC_ (coastline)
+    and ADR_ (rivers within coastline_rivers_buffer of the coastline) rasters of steps 17 and 18.
+    """
+    tile_id = os.path.basename(tile_path).replace("TIL_", "").replace("_0.geojson", "")
+    print(f"\n>>> Processing tile: {tile_id}")
 
-        masked_created = False  # default in case it fails
+    raster_file = os.path.join(raster_dir, f"GTS_{tile_id}.tif")
+    adc_file = os.path.join(coastline_dir, f"ADC_{tile_id}.tif")
+    adr_file = os.path.join(rivers_dir, f"ADR_{tile_id}.tif")
+    tile_log = {"tile_id": tile_id, "raster_exists": os.path.exists(raster_file), "ADC_created": False, "ADR_created": False}
 
-        try:
-            tile = gpd.read_file(tile_path)
+    # Skip if missing raster
+    if not tile_log["raster_exists"]:
+        print(f"WARNING: Raster file missing for tile {tile_id}, skipping.")
+        return tile_log
 
-            with rasterio.open(raster_file) as src:
-                out_image, out_transform = rasterio.mask.mask(src, [tile.geometry.iloc[0]], crop=True)
-                out_meta = src.meta.copy()
+    with rasterio.open(raster_file) as src:
+        valid = src.read(1) > 0
+        profile = src.profile
+        grid = TileGrid(src.transform, src.width, src.height, src.crs)
+    profile.update(dtype="uint8", nodata=None, compress="lzw")
 
-            out_meta.update({
-                "driver": "GTiff",
-                "height": out_image.shape[1],
-                "width": out_image.shape[2],
-                "transform": out_transform,
-                "compress": "lzw"
-            })
+    # Features are read within the largest buffer around the tile
+    sampling = get_mercator_sampling(grid)
+    max_buffer = max(coastline_buffers + rivers_buffers + [coastline_rivers_buffer])
+    halo = math.ceil(max_buffer / min(sampling))
+    halo_grid = get_halo_grid(grid, halo)
+    bbox = box(*array_bounds(halo_grid.height, halo_grid.width, halo_grid.transform))
 
-            with rasterio.open(sub_file, "w", **out_meta) as dest:
-                dest.write(out_image)
+    coastline_gdf = get_candidate_features(coastline, bbox, grid.crs)
+    coastline_distance = get_feature_distance(coastline_gdf.to_crs(grid.crs).geometry, grid, halo, sampling)
 
-            masked_created = True
-            print(f"✅ Masked raster created for {tile_id}")
+    # Coastline bands, COA_ in the vector mode
+    if (coastline_distance <= max(coastline_buffers)).any():
+        count = np.zeros(valid.shape, dtype=np.uint8)
+        for buffer_m in coastline_buffers:
+            count += (coastline_distance <= buffer_m) & valid
+        with rasterio.open(adc_file, "w", **profile) as dst:
+            dst.write(count, 1)
+        tile_log["ADC_created"] = True
+        print(f"✔ Saved: {adc_file}")
+    else:
+        print(f"Tile {tile_id} has no coastline features, skipping save.")
 
-        except Exception as e:
-            print(f"⚠️ Failed processing {tile_id}: {e}")
+    # River bands are buffered by the river width first, OVE_ in the vector mode
+    rivers_gdf = get_candidate_features(rivers, bbox, grid.crs, columns=["width_m", "geometry"])
+    rivers_proj = rivers_gdf.to_crs(epsg=3857)
+    rivers_geometries = rivers_proj.geometry.buffer(rivers_proj["width_m"]).to_crs(grid.crs)
+    rivers_distance = get_feature_distance(rivers_geometries, grid, halo, sampling)
+    near_coastline = coastline_distance <= coastline_rivers_buffer
 
-        log.append({
-            "tile_id": tile_id,
-            "raster_created": masked_created
+    if ((rivers_distance <= max(rivers_buffers)) & near_coastline).any():
+        count = np.zeros(valid.shape, dtype=np.uint8)
+        for buffer_m in rivers_buffers:
+            count += (rivers_distance <= buffer_m) & near_coastline & valid
+        with rasterio.open(adr_file, "w", **profile) as dst:
+            dst.write(count, 1)
+        tile_log["ADR_created"] = True
+        print(f"✔ Saved: {adr_file}")
+    else:
+        print(f"Tile {tile_id} has no river features near the coastline, skipping save.")
+
+    return tile_log
+
+def rasterize_distance_bands(tiles_dir, coastline, rivers, coastline_buffers, rivers_buffers,
+                             coastline_rivers_buffer, raster_dir, coastline_dir, rivers_dir, n_workers=1):
+    process_tile = partial(rasterize_distance_bands_tile, coastline=coastline, rivers=rivers,
+                           coastline_buffers=coastline_buffers, rivers_buffers=rivers_buffers,
+                           coastline_rivers_buffer=coastline_rivers_buffer, raster_dir=raster_dir,
+                           coastline_dir=coastline_dir, rivers_dir=rivers_dir)
+    return process_tiles(process_tile, get_tile_paths(tiles_dir, '_0.geojson'), n_workers)
+
+def clip_subsidence_tile(tile_path, raster_file, output_dir, id):
+    tile_id = os.path.basename(tile_path).replace("TIL_", "").replace("_0.geojson", "")
+    print(f"\n>>> Processing tile: {tile_id}")
+
+    sub_file = os.path.join(output_dir, f"CLI_{tile_id}_{id}.tif")
+
+    masked_created = False  # default in case it fails
+
+    try:
+        tile = gpd.read_file(tile_path)
+
+        with rasterio.open(raster_file) as src:
+            out_image, out_transform = rasterio.mask.mask(src, [tile.geometry.iloc[0]], crop=True)
+            out_meta = src.meta.copy()
+
+        out_meta.update({
+            "driver": "GTiff",
+            "height": out_image.shape[1],
+            "width": out_image.shape[2],
+            "transform": out_transform,
+            "compress": "lzw"
         })
 
+        with rasterio.open(sub_file, "w", **out_meta) as dest:
+            dest.write(out_image)
+
+        masked_created = True
+        print(f"✅ Masked raster created for {tile_id}")
+
+    except Exception as e:
+        print(f"⚠️ Failed processing {tile_id}: {e}")
+
+    return {
+        "tile_id": tile_id,
+        "raster_created": masked_created
+    }
+
+def clip_subsidence(tiles_dir, raster_file, output_dir, id, n_workers=1):
+
+    process_tile = partial(clip_subsidence_tile, raster_file=raster_file, output_dir=output_dir, id=id)
+    log = process_tiles(process_tile, get_tile_paths(tiles_dir, '_0.geojson'), n_workers)
+
     # Save log CSV
     log_df = pd.DataFrame(log)
     log_file = os.path.join(output_dir, f"clipping_log_{id}.csv")
     log_df.to_csv(log_file, index=False)
     print(f"Processing finished. Log saved to {log_file}")
 
-    return log_df
\ No newline at end of file
+    return log_df
+
+# ------ Raster calculator (NumPy) -----------
+# In-process replacement for qgis_utilities.raster_calculator. Expressions use the
+# QGIS raster calculator syntax ("LAYER@1" references, = != < > <= >=, AND, OR,
+# + - * / ^, max, min, abs, sqrt, ln, log10 and if) and are evaluated block by block.
+
+CALCULATOR_NODATA = -3.4028234663852886e+38  # Same nodata value written by qgis:rastercalculator
+
+CALCULATOR_FUNCTIONS = {
+    "max": (2, np.maximum),
+    "min": (2, np.minimum),
+    "abs": (1, np.abs),
+    "sqrt": (1, np.sqrt),
+    "ln": (1, np.log),
+    "log10": (1, np.log10),
+    "if": (3, np.where),
+}
+
+CALCULATOR_TOKENS = re.compile(
+    r"\s*(?:(?P<number>\d+\.?\d*(?:[eE][-+]?\d+)?|\.\d+(?:[eE][-+]?\d+)?)"
+    r"|(?P<name>[A-Za-z_]\w*)"
+    r"|(?P<op><=|>=|!=|<>|=|<|>|\+|-|\*|/|\^|\(|\)|,))"
+)
+
+def get_layer_source(layer):
+    # Accept both file paths and QgsRasterLayer objects
+    source = getattr(layer, "source", None)
+    return source() if callable(source) else str(layer)
+
+def get_layer_names(layer):
+    source = get_layer_source(layer)
+    names = {source, os.path.splitext(source)[0], os.path.basename(source),
+             os.path.splitext(os.path.basename(source))[0]}
+    name = getattr(layer, "name", None)
+    if callable(name):
+        names.add(name())
+    return names
+
+def replace_layer_references(expression, input_rasters):
+    """
+    Replaces every "LAYER@band" reference in the expression by a placeholder (__ref_<layer>_<band>)
+    and returns the new expression and the referenced (layer index, band) pairs.
+    """
+    candidates = []
+    for i, layer in enumerate(input_rasters):
+        candidates.extend((name, i) for name in get_layer_names(layer))
+    # Longest names first so that "GMW_X_2020" is not matched as "GMW_X"
+    candidates.sort(key=lambda c: len(c[0]), reverse=True)
+
+    references = set()
+    for name, i in candidates:
+        # "LAYER@1", "LAYER"@1 and LAYER@1, each matched as a single token
+        escaped = re.escape(name)
+        pattern = re.compile(r'(?<![\w./\\])(?:"' + escaped + r'@(\d+)"|"' + escaped + r'"@(\d+)|'
+                             + escaped + r'@(\d+))')
+
+        def to_placeholder(match, i=i):
+            band = int(next(g for g in match.groups() if g is not None))
+            references.add((i, band))
+            return f" __ref_{i}_{band} "
+
+        expression = pattern.sub(to_placeholder, expression)
+
+    if "@" in expression:
+        raise ValueError(f"Unresolved raster reference in expression: {expression}")
+    return expression, sorted(references)
+
+def tokenize_expression(expression):
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = CALCULATOR_TOKENS.match(expression, position)
+        if match is None:
+            raise ValueError(f"Invalid character in expression at position {position}: {expression[position:]}")
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "name" and value.upper() in ("AND", "OR"):
+            kind, value = "op", value.upper()
+        tokens.append((kind, value))
+        position = match.end()
+    return tokens
+
+def parse_expression(expression):
+    """
+    Parses a raster calculator expression (with placeholders) into a nested tuple tree,
+    following the QGIS operator precedence: OR < AND < comparisons < +,- < *,/ < ^ < unary minus.
+    """
+    tokens = tokenize_expression(expression)
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else (None, None)
+
+    def take(expected=None):
+        nonlocal position
+        kind, value = peek()
+        if kind is None or (expected is not None and value != expected):
+            raise ValueError(f"Expected '{expected}' in expression, found '{value}'")
+        position += 1
+        return kind, value
+
+    def binary(operand, operators):
+        def parse():
+            node = operand()
+            while peek()[0] == "op" and peek()[1] in operators:
+                _, op = take()
+                node = ("binary", op, node, operand())
+            return node
+        return parse
+
+    def power():
+        node = unary()
+        if peek() == ("op", "^"):
+            take()
+            node = ("binary", "^", node, power())
+        return node
+
+    def unary():
+        if peek() == ("op", "-"):
+            take()
+            return ("negative", unary())
+        if peek() == ("op", "+"):
+            take()
+            return unary()
+        return primary()
+
+    def primary():
+        kind, value = take()
+        if kind == "number":
+            return ("number", float(value))
+        if kind == "name" and value.startswith("__ref_"):
+            layer, band = value[len("__ref_"):].split("_")
+            return ("layer", int(layer), int(band))
+        if kind == "name" and value.lower() in CALCULATOR_FUNCTIONS:
+            take("(")
+            arguments = [disjunction()]
+            while peek() == ("op", ","):
+                take()
+                arguments.append(disjunction())
+            take(")")
+            n_args = CALCULATOR_FUNCTIONS[value.lower()][0]
+            if len(arguments) != n_args:
+                raise ValueError(f"Function {value} expects {n_args} arguments, got {len(arguments)}")
+            return ("function", value.lower(), arguments)
+        if value == "(":
+            node = disjunction()
+            take(")")
+            return node
+        raise ValueError(f"Unexpected token in expression: '{value}'")
+
+    product = binary(power, ("*", "/"))
+    addition = binary(product, ("+", "-"))
+    comparison = binary(addition, ("=", "!=", "<>", "<", ">", "<=", ">="))
+    conjunction = binary(comparison, ("AND",))
+    disjunction = binary(conjunction, ("OR",))
+
+    tree = disjunction()
+    if position != len(tokens):
+        raise ValueError(f"Unexpected token in expression: '{tokens[position][1]}'")
+    return tree
+
+def evaluate_expression(tree, arrays):
+    """
+    Evaluates a parsed expression over NumPy arrays. `arrays` maps (layer index, band) to arrays.
+    Comparisons and logical operators return 1/0 as in the QGIS raster calculator.
+    """
+    node_type = tree[0]
+    if node_type == "number":
+        return tree[1]
+    if node_type == "layer":
+        return arrays[(tree[1], tree[2])]
+    if node_type == "negative":
+        return -evaluate_expression(tree[1], arrays)
+    if node_type == "function":
+        arguments = [evaluate_expression(a, arrays) for a in tree[2]]
+        if tree[1] == "if":
+            arguments[0] = np.asarray(arguments[0]) != 0
+        return CALCULATOR_FUNCTIONS[tree[1]][1](*arguments)
+
+    _, op, left, right = tree
+    a = evaluate_expression(left, arrays)
+    b = evaluate_expression(right, arrays)
+    if op == "+":
+        return a + b
+    if op == "-":
+        return a - b
+    if op == "*":
+        return a * b
+    if op == "/":
+        return np.divide(a, b)
+    if op == "^":
+        return np.power(a, b)
+    if op == "=":
+        return np.equal(a, b).astype(np.float64)
+    if op in ("!=", "<>"):
+        return np.not_equal(a, b).astype(np.float64)
+    if op == "<":
+        return np.less(a, b).astype(np.float64)
+    if op == ">":
+        return np.greater(a, b).astype(np.float64)
+    if op == "<=":
+        return np.less_equal(a, b).astype(np.float64)
+    if op == ">=":
+        return np.greater_equal(a, b).astype(np.float64)
+    if op == "AND":
+        return np.logical_and(a, b).astype(np.float64)
+    if op == "OR":
+        return np.logical_or(a, b).astype(np.float64)
+    raise ValueError(f"Unknown operator {op}")
+
+def raster_calculator(expression, input_rasters, output_raster, block_rows=512, compress=None):
+    """
+    Evaluates a QGIS raster calculator expression with NumPy, reading the inputs by row blocks.
+    The first input raster defines the output grid; inputs on a different grid are resampled
+    (nearest neighbour) on the fly. Pixels where any referenced input is nodata, or where the
+    result is not finite, are written as nodata.
+    """
+    print(f"📐 Raster calculator expression:\n{expression}")
+    placeholder_expression, references = replace_layer_references(expression, input_rasters)
+    tree = parse_expression(placeholder_expression)
+
+    sources = [rasterio.open(get_layer_source(layer)) for layer in input_rasters]
+    readers = []
+    try:
+        reference = sources[0]
+        for src in sources:
+            same_grid = (src.crs == reference.crs and src.transform == reference.transform
+                         and src.width == reference.width and src.height == reference.height)
+            if same_grid:
+                readers.append(src)
+            else:
+                readers.append(WarpedVRT(src, crs=reference.crs, transform=reference.transform,
+                                         width=reference.width, height=reference.height,
+                                         resampling=Resampling.nearest))
+
+        profile = {
+            "driver": "GTiff",
+            "dtype": "float32",
+            "count": 1,
+            "width": reference.width,
+            "height": reference.height,
+            "crs": reference.crs,
+            "transform": reference.transform,
+            "nodata": CALCULATOR_NODATA,
+        }
+        if compress:
+            profile["compress"] = compress
+
+        with rasterio.open(output_raster, "w", **profile) as dst:
+            for row_off in range(0, reference.height, block_rows):
+                window = Window(0, row_off, reference.width, min(block_rows, reference.height - row_off))
+                arrays = {}
+                invalid = np.zeros((int(window.height), int(window.width)), dtype=bool)
+                for layer, band in references:
+                    data = readers[layer].read(band, window=window, masked=True)
+                    arrays[(layer, band)] = data.data.astype(np.float64)
+                    invalid |= np.ma.getmaskarray(data)
+
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    result = np.broadcast_to(evaluate_expression(tree, arrays), invalid.shape)
+                    result = np.where(invalid | ~np.isfinite(result), CALCULATOR_NODATA, result)
+                dst.write(result.astype(np.float32), 1, window=window)
+    finally:
+        for reader in readers:
+            if isinstance(reader, WarpedVRT):
+                reader.close()
+        for src in sources:
+            src.close()
+
+
+# ------ Reclassification -----------
+# Lookup-table replacement of the '("X@1" = k) * v + ... / 100' expressions built from the
+# *_multipliers dicts of config.json.
+
+def reclassify_array(array, mapping, scale=100):
+    """
+    Maps every value k of mapping to mapping[k] / scale with a single lookup table.
+    Values not in mapping (and non integer values) get 0, as in the chained expressions.
+    """
+    keys = np.array([int(k) for k in mapping], dtype=np.int64)
+    values = np.array(list(mapping.values()), dtype=np.float64) / scale
+    offset = min(keys.min(), 0)
+    lut = np.zeros(keys.max() - offset + 2, dtype=np.float64)  # Last entry for values out of range
+    lut[keys - offset] = values
+
+    array = np.asarray(array)
+    if np.issubdtype(array.dtype, np.floating):
+        valid = np.isfinite(array) & (array == np.floor(array))
+        index = np.where(valid, array, -1 + offset).astype(np.int64) - offset
+    else:
+        index = array.astype(np.int64) - offset
+    index = np.where((index >= 0) & (index < len(lut) - 1), index, len(lut) - 1)
+    return lut[index]
+
+def reclassify(input_raster, mapping, output_raster, scale=100, dtype="float32", band=1, block_rows=512):
+    """
+    Reclassifies a raster by block windows with reclassify_array. Nodata pixels stay nodata.
+    dtype="float32" writes mapping[k] / scale with the raster calculator nodata value.
+    dtype="uint8" writes the mapping values themselves (0-254) with nodata 255 and 1 / scale as the
+    band scale factor, so that readers applying the scale get the same values as the float32 output.
+    """
+    with rasterio.open(input_raster) as src:
+        profile = {
+            "driver": "GTiff",
+            "dtype": dtype,
+            "count": 1,
+            "width": src.width,
+            "height": src.height,
+            "crs": src.crs,
+            "transform": src.transform,
+            "compress": "lzw",
+        }
+        if dtype == "uint8":
+            profile["nodata"] = 255
+            output_scale = 1
+        else:
+            profile["nodata"] = CALCULATOR_NODATA
+            output_scale = scale
+
+        with rasterio.open(output_raster, "w", **profile) as dst:
+            for row_off in range(0, src.height, block_rows):
+                window = Window(0, row_off, src.width, min(block_rows, src.height - row_off))
+                data = src.read(band, window=window, masked=True)
+                result = reclassify_array(data.data, mapping, output_scale)
+                result = np.where(np.ma.getmaskarray(data), profile["nodata"], result)
+                dst.write(result.astype(dtype), 1, window=window)
+            if dtype == "uint8":
+                dst.scales = (1 / scale,)
+    print(f"✔ Saved: {output_raster}")
+
+# ------ Intertidal classes -----------
+# Categorical INT_ raster of 07_process_intertidal_space.py, one pass over the ELE_ and GTS_ pair
+# instead of the MSL_, HAT_ and BEY_ expressions. MSL_ = 1, BEY_ = 2 and HAT_ = 2 or 3.
+
+INTERTIDAL_MSL = 1  # Above 0 and below HAT
+INTERTIDAL_BEY = 2  # Above HAT and below HAT + intertidal_slr_correction
+INTERTIDAL_HAT = 3  # Above HAT + intertidal_slr_correction
+
+def classify_intertidal_array(elevation, tide, mangrove_correction, slr_correction):
+    # Same arithmetic as the raster calculator expressions of step 07 (elevation in m, corrections in cm)
+    corrected = elevation * 100 - mangrove_correction
+    above_hat = corrected > tide * 100
+    classes = np.zeros(elevation.shape, dtype=np.uint8)
+    classes[(elevation > 0) & ~above_hat] = INTERTIDAL_MSL
+    classes[above_hat] = INTERTIDAL_HAT
+    classes[above_hat & (corrected <= (tide + slr_correction / 100) * 100)] = INTERTIDAL_BEY
+    return classes
+
+def get_accommodation_mapping(multipliers):
+    # accommodation_multipliers are given for MSL * 2 + BEY, translated here to the intertidal classes
+    unc_values = {INTERTIDAL_MSL: 2, INTERTIDAL_BEY: 1}
+    return {str(c): multipliers[str(v)] for c, v in unc_values.items() if str(v) in multipliers}
+
+def classify_intertidal(elevation_raster, tide_raster, output_raster, mangrove_correction, slr_correction, mapping=None, scale=100, block_rows=512):
+    """
+    Writes the intertidal classes as a uint8 raster on the grid of the elevation raster, reading both inputs
+    once per block. Both are on the catalog grid of the tile (get_catalog_tile_grid), so they are combined by
+    index. Pixels where either input is nodata get 0, as after fill_and_compress.
+    With a mapping the classes are reclassified before writing (as reclassify does), e.g. to write ACC_ directly.
+    """
+    with rasterio.open(elevation_raster) as elevation_src, rasterio.open(tide_raster) as tide_src:
+        grid = TileGrid(elevation_src.transform, elevation_src.width, elevation_src.height, elevation_src.crs)
+        if not is_on_grid(tide_src, grid):
+            raise ValueError(f"{tide_raster} is not on the tile grid of {elevation_raster}")
+        profile = {
+            "driver": "GTiff",
+            "dtype": "uint8",
+            "count": 1,
+            "width": elevation_src.width,
+            "height": elevation_src.height,
+            "crs": elevation_src.crs,
+            "transform": elevation_src.transform,
+            "compress": "lzw",
+        }
+        if mapping is not None:
+            profile.update(dtype="float32", nodata=CALCULATOR_NODATA)
+        with rasterio.open(output_raster, "w", **profile) as dst:
+            for row_off in range(0, elevation_src.height, block_rows):
+                window = Window(0, row_off, elevation_src.width, min(block_rows, elevation_src.height - row_off))
+                elevation = elevation_src.read(1, window=window, masked=True)
+                tide = tide_src.read(1, window=window, masked=True)
+                classes = classify_intertidal_array(elevation.data.astype(np.float64), tide.data.astype(np.float64),
+                                                    mangrove_correction, slr_correction)
+                classes[np.ma.getmaskarray(elevation) | np.ma.getmaskarray(tide)] = 0
+                if mapping is not None:
+                    classes = reclassify_array(classes, mapping, scale).astype(np.float32)
+                dst.write(classes, 1, window=window)
+    print(f"✔ Saved: {output_raster}")
+
+# ------ In-memory tile rasters -----------
+# Array equivalents of the qgis_utilities steps (reproject_raster, fill_raster, compress_raster)
+# so that a tile can be processed without writing intermediate rasters.
+
+TileGrid = namedtuple("TileGrid", ["transform", "width", "height", "crs"])
+
+def get_tile_grid(bounds, resolution, crs="EPSG:4326"):
+    # Same grid as gdalwarp/gdal_rasterize with -te xmin ymin xmax ymax -tr resolution resolution
+    xmin, ymin, xmax, ymax = bounds
+    width = int((xmax - xmin) / resolution + 0.5)
+    height = int((ymax - ymin) / resolution + 0.5)
+    transform = from_origin(xmin, ymax, resolution, resolution)
+    return TileGrid(transform, width, height, CRS.from_user_input(crs))
+
+def get_catalog_tile_grid(tile_path, resolution):
+    # Grid of a tile from the bounds index of the tiles catalog (01_processing_tiles.py). Every product of
+    # the tile at this resolution is written on it, so their arrays can be combined by index
+    return get_tile_grid(get_tile_bounds(tile_path), resolution)
+
+def get_grid_bounds(grid):
+    # (xmin, ymin, xmax, ymax) covered by the pixels of the grid
+    return array_bounds(grid.height, grid.width, grid.transform)
+
+def get_grid_projwin(grid):
+    # Extent for the QGIS gdal algorithms, with -tr resolution it gives back the same grid
+    xmin, ymin, xmax, ymax = get_grid_bounds(grid)
+    return f"{xmin},{xmax},{ymax},{ymin} [EPSG:4326]"
+
+def is_on_grid(src, grid):
+    # True when an open raster has the shape and pixel grid of the TileGrid
+    return (src.crs == grid.crs and src.width == grid.width and src.height == grid.height
+            and src.transform.almost_equals(grid.transform))
+
+# ------ Archive ingest -----------
+# The Clark and GMW rasters come as large zip archives. Reading them through /vsizip/ decompresses
+# the members again for every tile, so they are extracted once into Cloud-Optimized GeoTIFFs
+# (internal tiles and overviews) and the VRT mosaics are built over those.
+
+def get_ingest_record_path(zip_path, output_dir):
+    return os.path.join(output_dir, f"{os.path.basename(zip_path)}.ingest.json")
+
+def is_ingested(zip_path, members, output_dir):
+    # Same archive, same members and COGs unchanged since they were written
+    record_path = get_ingest_record_path(zip_path, output_dir)
+    if not os.path.exists(record_path):
+        return False
+    with open(record_path, "r") as f:
+        record = json.load(f)
+    stat = os.stat(zip_path)
+    if record.get("archive") != {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}:
+        return False
+    if sorted(record.get("members", {})) != sorted(members):
+        return False
+    return all(
+        get_file_hash(os.path.join(output_dir, item["cog"])) == item["sha1"]
+        for item in record["members"].values()
+    )
+
+def convert_zip_member(zip_path, output_dir, member):
+    # Extract to a temporary GeoTIFF (zipfile checks the CRC-32 of the member) and write it as COG
+    cog_name = os.path.basename(member)
+    cog_path = os.path.join(output_dir, cog_name)
+    tmp_path = os.path.join(output_dir, f"TMP_{cog_name}")
+    with zipfile.ZipFile(zip_path, "r") as z:
+        crc = z.getinfo(member).CRC
+        with z.open(member) as src, open(tmp_path, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+    rasterio.shutil.copy(tmp_path, cog_path, driver="COG", compress="lzw", blocksize=512,
+                         overviews="auto", overview_resampling="nearest", bigtiff="if_safer")
+    os.remove(tmp_path)
+    print(f"✔ Saved: {cog_path}")
+    return {"member": member, "crc": crc, "cog": cog_name, "sha1": get_file_hash(cog_path)}
+
+def ingest_zip(zip_path, members, output_dir, n_workers=1):
+    """
+    Converts the given members of a zip archive to COGs in output_dir and returns their paths.
+    Archives already converted (ingest record next to the COGs, see is_ingested) are skipped.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if is_ingested(zip_path, members, output_dir):
+        print(f"✔ Already ingested: {zip_path}")
+    else:
+        log = process_tiles(partial(convert_zip_member, zip_path, output_dir), members, n_workers)
+        stat = os.stat(zip_path)
+        record = {
+            "archive": {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns},
+            "members": {item.pop("member"): item for item in log},
+        }
+        with open(get_ingest_record_path(zip_path, output_dir), "w") as f:
+            json.dump(record, f, indent=4, sort_keys=True)
+    return [os.path.join(output_dir, os.path.basename(member)) for member in members]
+
+# ------ VRT sources -----------
+# Footprints of the sources of the global mosaics, so the VRTs only list the sources that
+# intersect the tiles of the run (tiles catalog of 01_processing_tiles.py).
+
+def get_physical_path(source_path):
+    # File on disk behind a GDAL path, the zip archive for /vsizip/ members
+    match = re.match(r"/vsizip/(.+?\.zip)/", source_path, flags=re.IGNORECASE)
+    return match.group(1) if match else source_path
+
+def read_source_footprint(source_path):
+    with rasterio.open(source_path) as src:
+        bounds = rasterio.warp.transform_bounds(src.crs, "EPSG:4326", *src.bounds)
+    return {"path": source_path, "bounds": list(bounds)}
+
+def get_source_footprints(source_paths, cache_path, n_workers=1):
+    """
+    EPSG:4326 bounds of raster sources. They are cached in cache_path with the size and mtime of the
+    file they are read from (the zip archive for /vsizip/ members), so the next run only opens new
+    or changed sources.
+    """
+    cache = {}
+    if os.path.exists(cache_path):
+        with open(cache_path, "r") as f:
+            cache = json.load(f)
+
+    stamps = {}
+    for path in {get_physical_path(p) for p in source_paths}:
+        stat = os.stat(path)
+        stamps[path] = [stat.st_size, stat.st_mtime_ns]
+
+    missing = [p for p in source_paths if cache.get(p, {}).get("stamp") != stamps[get_physical_path(p)]]
+    for item in process_tiles(read_source_footprint, missing, n_workers):
+        cache[item["path"]] = {"stamp": stamps[get_physical_path(item["path"])], "bounds": item["bounds"]}
+
+    cache = {p: cache[p] for p in source_paths}
+    if missing:
+        with open(cache_path, "w") as f:
+            json.dump(cache, f, indent=4)
+        print(f"✔ Saved: {cache_path}")
+    return {p: item["bounds"] for p, item in cache.items()}
+
+def filter_sources_by_tiles(source_paths, tiles_dir, buffer_meters, cache_path, n_workers=1):
+    """
+    Sources whose footprint intersects a tile of the catalog buffered by buffer_meters, in their
+    original order. All sources are kept when there are no tiles.
+    """
+    if not source_paths or not has_tiles_catalog(tiles_dir, buffer_meters):
+        return source_paths
+    footprints = get_source_footprints(source_paths, cache_path, n_workers)
+    boxes = gpd.GeoSeries([box(*footprints[p]) for p in source_paths], crs="EPSG:4326")
+    tiles = read_tiles_catalog(tiles_dir, buffer_meters).to_crs("EPSG:4326")
+    _, idx = boxes.sindex.query(tiles.geometry, predicate="intersects")
+    selected = [source_paths[i] for i in sorted(set(idx.tolist()))]
+    print(f"{len(selected)} of {len(source_paths)} sources intersect the tiles")
+    return selected
+
+# ------ Raster reader cache -----------
+# The global mosaics (Clark, DeltaDTM, GMW, permanent water) are VRTs over /vsizip/ members.
+# Opening them once per worker process keeps the parsed sources, the open zip members and the
+# GDAL block cache (general_utilities.set_gdal_cache) alive from one tile to the next.
+
+open_mosaics = {}  # VRT datasets kept open in this process, keyed by path
+
+@contextmanager
+def open_raster(input_raster):
+    # VRTs are taken from the cache and left open, any other raster is opened and closed as usual
+    if not str(input_raster).lower().endswith(".vrt"):
+        with rasterio.open(input_raster) as src:
+            yield src
+        return
+
+    path = os.path.abspath(input_raster)
+    mtime = os.path.getmtime(path)
+    if path in open_mosaics and open_mosaics[path][0] != mtime:
+        open_mosaics.pop(path)[1].close()
+    if path not in open_mosaics:
+        open_mosaics[path] = (mtime, rasterio.open(path))
+    yield open_mosaics[path][1]
+
+def close_rasters():
+    for _, src in open_mosaics.values():
+        src.close()
+    open_mosaics.clear()
+
+def warp_raster(input_raster, output_raster, resolution, bounds):
+    """
+    In-process equivalent of qgis_utilities.reproject_raster (nearest neighbour, EPSG:4326, data type and
+    nodata of the source) that reads through the cached mosaic instead of reopening the VRT in gdalwarp.
+    A resolution of None keeps the resolution of the source, as gdalwarp without -tr does.
+    """
+    with open_raster(input_raster) as src:
+        if resolution is None:
+            xmin, ymin, xmax, ymax = bounds
+            width = max(int((xmax - xmin) / src.res[0] + 0.5), 1)
+            height = max(int((ymax - ymin) / src.res[1] + 0.5), 1)
+            grid = TileGrid(from_bounds(xmin, ymin, xmax, ymax, width, height), width, height, CRS.from_epsg(4326))
+        else:
+            grid = get_tile_grid(bounds, resolution)
+        with WarpedVRT(src, crs=grid.crs, transform=grid.transform, width=grid.width,
+                       height=grid.height, resampling=Resampling.nearest) as vrt:
+            data = vrt.read()
+        profile = {
+            "driver": "GTiff",
+            "dtype": src.dtypes[0],
+            "count": src.count,
+            "width": grid.width,
+            "height": grid.height,
+            "crs": grid.crs,
+            "transform": grid.transform,
+            "nodata": src.nodata
+        }
+    with rasterio.open(output_raster, "w", **profile) as dst:
+        dst.write(data)
+    print(f"✔ Saved: {output_raster}")
+
+def read_raster_to_grid(input_raster, grid, band=1, fill_value=0, masked=False, resampling=Resampling.nearest):
+    """
+    Reads a raster (GeoTIFF or VRT) warped to the tile grid. Nodata and pixels outside the source
+    are replaced by fill_value, as reproject_raster followed by fill_raster does, unless masked=True.
+    """
+    with open_raster(input_raster) as src:
+        with WarpedVRT(src, crs=grid.crs, transform=grid.transform, width=grid.width,
+                       height=grid.height, resampling=resampling) as vrt:
+            data = vrt.read(band, masked=True)
+    if masked:
+        return data
+    return data.filled(fill_value)
+
+def get_halo_grid(grid, halo):
+    # Tile grid enlarged by halo pixels on every side
+    transform = grid.transform * Affine.translation(-halo, -halo)
+    return TileGrid(transform, grid.width + 2 * halo, grid.height + 2 * halo, grid.crs)
+
+def build_mosaic_vrt(input_rasters, output_vrt):
+    """
+    Writes the VRT mosaic that gdal.BuildVRT gives for single band rasters on the same pixel grid (the
+    tiles of one product), without the GDAL Python bindings. Every raster is placed at the offset of its
+    origin, so they have to share the resolution of the first one and be aligned with it.
+    """
+    with rasterio.open(input_rasters[0]) as src:
+        crs, (xres, yres), dtype, nodata = src.crs, src.res, src.dtypes[0], src.nodata
+    sources = []
+    for input_raster in input_rasters:
+        with rasterio.open(input_raster) as src:
+            sources.append((os.path.abspath(input_raster), src.bounds, src.width, src.height, src.block_shapes[0]))
+    xmin = min(bounds.left for _, bounds, *_ in sources)
+    ymax = max(bounds.top for _, bounds, *_ in sources)
+    xmax = max(bounds.right for _, bounds, *_ in sources)
+    ymin = min(bounds.bottom for _, bounds, *_ in sources)
+    data_type = rasterio.dtypes.typename_fwd[rasterio.dtypes.dtype_rev[dtype]]
+
+    root = ET.Element("VRTDataset", rasterXSize=str(round((xmax - xmin) / xres)), rasterYSize=str(round((ymax - ymin) / yres)))
+    ET.SubElement(root, "SRS").text = crs.to_wkt()
+    ET.SubElement(root, "GeoTransform").text = ", ".join(repr(float(v)) for v in (xmin, xres, 0, ymax, 0, -yres))
+    band = ET.SubElement(root, "VRTRasterBand", dataType=data_type, band="1")
+    if nodata is not None:
+        ET.SubElement(band, "NoDataValue").text = repr(nodata)
+    for path, bounds, width, height, (block_y, block_x) in sources:
+        # Later rasters are drawn over the previous ones, except on their nodata pixels
+        source = ET.SubElement(band, "SimpleSource" if nodata is None else "ComplexSource")
+        ET.SubElement(source, "SourceFilename", relativeToVRT="0").text = path
+        ET.SubElement(source, "SourceBand").text = "1"
+        ET.SubElement(source, "SourceProperties", RasterXSize=str(width), RasterYSize=str(height), DataType=data_type,
+                      BlockXSize=str(block_x), BlockYSize=str(block_y))
+        ET.SubElement(source, "SrcRect", xOff="0", yOff="0", xSize=str(width), ySize=str(height))
+        ET.SubElement(source, "DstRect", xOff=str(round((bounds.left - xmin) / xres)),
+                      yOff=str(round((ymax - bounds.top) / yres)), xSize=str(width), ySize=str(height))
+        if nodata is not None:
+            ET.SubElement(source, "NODATA").text = repr(nodata)
+    ET.ElementTree(root).write(output_vrt)
+
+def get_vrt_sources(vrt_path, grid):
+    """
+    Source files of a VRT mosaic that overlap the grid, with the (rows, cols) slices they cover in it.
+    The grid has to be aligned with the pixels of the mosaic (get_snapped_bounds).
+    """
+    with rasterio.open(vrt_path) as src:
+        col_off, row_off = ~src.transform * (grid.transform.c, grid.transform.f)
+    col_off, row_off = round(col_off), round(row_off)
+    vrt_dir = os.path.dirname(vrt_path)
+
+    sources = {}
+    for source in ET.parse(vrt_path).getroot().find("VRTRasterBand"):
+        source_file = source.find("SourceFilename")
+        rect = source.find("DstRect")
+        if source_file is None or rect is None:
+            continue
+        path = source_file.text
+        if source_file.get("relativeToVRT") == "1":
+            path = os.path.join(vrt_dir, path)
+        x0 = round(float(rect.get("xOff"))) - col_off
+        y0 = round(float(rect.get("yOff"))) - row_off
+        x1 = x0 + round(float(rect.get("xSize")))
+        y1 = y0 + round(float(rect.get("ySize")))
+        rows = slice(max(y0, 0), min(y1, grid.height))
+        cols = slice(max(x0, 0), min(x1, grid.width))
+        if rows.start < rows.stop and cols.start < cols.stop:
+            sources[path] = (rows, cols)
+    return sources
+
+def read_raster_with_halo(vrt_path, grid, halo, fallback_raster=None):
+    """
+    Reads the tile grid enlarged by halo pixels from a VRT mosaic of the tile and its neighbours on the
+    same pixel grid, so only the halo strips of the neighbouring tiles are read. Pixels not covered by any
+    tile of the mosaic are warped from fallback_raster. Returns the array and the enlarged TileGrid.
+    """
+    halo_grid = get_halo_grid(grid, halo)
+    with open_raster(vrt_path) as src:
+        col_off, row_off = ~src.transform * (halo_grid.transform.c, halo_grid.transform.f)
+        window = Window(round(col_off), round(row_off), halo_grid.width, halo_grid.height)
+        data = src.read(1, window=window, boundless=True, fill_value=0)
+
+    if fallback_raster is None:
+        return data, halo_grid
+
+    covered = np.zeros(data.shape, dtype=bool)
+    for rows, cols in get_vrt_sources(vrt_path, halo_grid).values():
+        covered[rows, cols] = True
+    if covered.all():
+        return data, halo_grid
+
+    # Warp only the bounding box of the uncovered pixels
+    rows = np.flatnonzero(~covered.all(axis=1))
+    cols = np.flatnonzero(~covered.all(axis=0))
+    window = Window(cols[0], rows[0], cols[-1] - cols[0] + 1, rows[-1] - rows[0] + 1)
+    fallback_grid = TileGrid(rasterio.windows.transform(window, halo_grid.transform), window.width, window.height, grid.crs)
+    fallback = read_raster_to_grid(fallback_raster, fallback_grid)
+    rows, cols = window.toslices()
+    data[rows, cols] = np.where(covered[rows, cols], data[rows, cols], fallback)
+    return data, halo_grid
+
+def get_nearest_labels(tree, grid, block=32):
+    """
+    Index of the nearest point for every pixel center, computed per block of block x block pixels.
+    A block takes the label of the point nearest to its center when the second nearest point is farther
+    by more than the block diagonal: no pixel of the block can then be closer to another point. Only the
+    blocks near a Voronoi boundary are queried pixel by pixel, so the labels are exactly the per-pixel ones.
+    """
+    a, c, e, f = grid.transform.a, grid.transform.c, grid.transform.e, grid.transform.f
+    labels = np.zeros((grid.height, grid.width), dtype=np.int64)
+    if tree.n == 1:
+        return labels
+
+    row_starts = np.arange(0, grid.height, block)
+    col_starts = np.arange(0, grid.width, block)
+    row_ends = np.minimum(row_starts + block, grid.height)
+    col_ends = np.minimum(col_starts + block, grid.width)
+
+    # Centers and half diagonals of the blocks, between the centers of their first and last pixels
+    xx, yy = np.meshgrid(c + (col_starts + col_ends) / 2 * a, f + (row_starts + row_ends) / 2 * e)
+    radius = np.hypot(*np.meshgrid((col_ends - col_starts - 1) / 2 * abs(a), (row_ends - row_starts - 1) / 2 * abs(e)))
+    distances, idx = tree.query(np.column_stack([xx.ravel(), yy.ravel()]), k=2, workers=-1)
+    certain = (distances[:, 1] - distances[:, 0] > 2 * radius.ravel() + 1e-9).reshape(xx.shape)
+    idx = idx[:, 0].reshape(xx.shape)
+
+    for i, (row_start, row_end) in enumerate(zip(row_starts, row_ends)):
+        for j, (col_start, col_end) in enumerate(zip(col_starts, col_ends)):
+            if certain[i, j]:
+                labels[row_start:row_end, col_start:col_end] = idx[i, j]
+                continue
+            px, py = np.meshgrid(c + (np.arange(col_start, col_end) + 0.5) * a, f + (np.arange(row_start, row_end) + 0.5) * e)
+            _, nearest = tree.query(np.column_stack([px.ravel(), py.ravel()]), workers=-1)
+            labels[row_start:row_end, col_start:col_end] = nearest.reshape(px.shape)
+    return labels
+
+def get_nearest_values(points, values, grid, neighbours=1, power=2, block_rows=512, coarse_block=0):
+    """
+    Value of the nearest point at the center of every pixel of the grid, which is the same as rasterizing
+    the Voronoi polygons of the points (distances in the units of the grid CRS, as native:voronoipolygons).
+    With neighbours > 1 the values of the nearest points are interpolated by inverse distance weighting.
+    With coarse_block the nearest points are found coarse to fine (get_nearest_labels), with the same result.
+    """
+    tree = cKDTree(points)
+    neighbours = min(neighbours, len(points))
+    if neighbours == 1 and coarse_block:
+        return values[get_nearest_labels(tree, grid, coarse_block)].astype("float32")
+    cols = grid.transform.c + (np.arange(grid.width) + 0.5) * grid.transform.a
+    nearest = np.zeros((grid.height, grid.width), dtype="float32")
+    for row_start in range(0, grid.height, block_rows):
+        rows = np.arange(row_start, min(row_start + block_rows, grid.height))
+        ys = grid.transform.f + (rows + 0.5) * grid.transform.e
+        xx, yy = np.meshgrid(cols, ys)
+        distances, idx = tree.query(np.column_stack([xx.ravel(), yy.ravel()]), k=neighbours, workers=-1)
+        if neighbours == 1:
+            block = values[idx]
+        else:
+            weights = 1 / np.maximum(distances, 1e-12) ** power
+            block = (weights * values[idx]).sum(axis=1) / weights.sum(axis=1)
+        nearest[rows] = block.reshape(len(rows), grid.width)
+    return nearest
+
+def rasterize_nearest_points(points_path, field, clip_vector, tile_vector, resolution, output_raster, neighbours=1, coarse_block=0):
+    """
+    Array equivalent of qgis_utilities.get_voronoi_from_gtsm followed by rasterize_vector and compress_raster:
+    the points inside clip_vector (e.g. the 200 km tile buffer) give their field value to the pixels of the
+    tile they are nearest to. Pixels outside tile_vector, or all of them when there are no points, are 0 (nodata).
+    """
+    clip_geometry = gpd.read_file(clip_vector).to_crs("EPSG:4326").union_all()
+    tile = gpd.read_file(tile_vector).to_crs("EPSG:4326")
+    grid = get_catalog_tile_grid(tile_vector, resolution)
+
+    points = get_candidate_features(points_path, clip_geometry, "EPSG:4326", [field]).to_crs("EPSG:4326")
+    points = points[points.intersects(clip_geometry)]
+    if points.empty:
+        nearest = np.zeros((grid.height, grid.width), dtype="float32")
+    else:
+        coords = np.column_stack([points.geometry.x, points.geometry.y])
+        nearest = get_nearest_values(coords, points[field].to_numpy(dtype="float32"), grid, neighbours, coarse_block=coarse_block)
+        inside = rasterio.features.geometry_mask(tile.geometry, (grid.height, grid.width), grid.transform, invert=True)
+        nearest[~inside] = 0
+    write_raster(nearest, grid, output_raster, nodata=0)
+
+def resample_array_to_grid(array, transform, crs, grid, nodata=CALCULATOR_NODATA, resampling=Resampling.nearest):
+    destination = np.full((grid.height, grid.width), nodata, dtype=array.dtype)
+    rasterio.warp.reproject(
+        source=array,
+        destination=destination,
+        src_transform=transform,
+        src_crs=crs,
+        src_nodata=nodata,
+        dst_transform=grid.transform,
+        dst_crs=grid.crs,
+        dst_nodata=nodata,
+        resampling=resampling
+    )
+    return destination
+
+def write_raster(array, grid, output_raster, dtype="float32", nodata=CALCULATOR_NODATA, compress="lzw", predictor=None, tiled=False, blocksize=512):
+    # Write a single band GeoTIFF on the tile grid, with the creation options of fill_and_write
+    profile = {
+        "driver": "GTiff",
+        "dtype": dtype,
+        "count": 1,
+        "width": grid.width,
+        "height": grid.height,
+        "crs": grid.crs,
+        "transform": grid.transform,
+        "nodata": nodata,
+    }
+    if compress:
+        profile["compress"] = compress
+    if compress and predictor:
+        profile["predictor"] = predictor
+    if tiled:
+        profile.update(tiled=True, blockxsize=blocksize, blockysize=blocksize)
+    with rasterio.open(output_raster, "w", **profile) as dst:
+        dst.write(array.astype(dtype), 1)
+    print(f"✔ Saved: {output_raster}")
+
+def fill_and_write(input_raster, output_raster, fill_value=0, compress="lzw", predictor=None, tiled=False, blocksize=512):
+    """
+    In-process replacement for qgis_utilities.fill_and_compress (native:fillnodata + gdal:translate), written
+    in one pass: nodata is replaced by fill_value in every block before it is encoded, and the output has no
+    nodata value, as the QGIS chain. fill_value=None keeps nodata, which replaces compress_raster alone.
+    compress, predictor (2 for integers, 3 for floating point) and tiled/blocksize are GeoTIFF creation options.
+    """
+    with rasterio.open(input_raster) as src:
+        profile = {
+            "driver": "GTiff",
+            "dtype": src.dtypes[0],
+            "count": src.count,
+            "width": src.width,
+            "height": src.height,
+            "crs": src.crs,
+            "transform": src.transform,
+            "nodata": src.nodata if fill_value is None else None,
+        }
+        if compress:
+            profile["compress"] = compress
+        if compress and predictor:
+            profile["predictor"] = predictor
+        if tiled:
+            profile.update(tiled=True, blockxsize=blocksize, blockysize=blocksize)
+
+        with rasterio.open(output_raster, "w", **profile) as dst:
+            for row_off in range(0, src.height, blocksize):
+                window = Window(0, row_off, src.width, min(blocksize, src.height - row_off))
+                data = src.read(window=window, masked=fill_value is not None)
+                if fill_value is not None:
+                    data = data.filled(fill_value)
+                dst.write(data, window=window)
+    print(f"✔ Saved: {output_raster}")
+
+def write_raster_stack(input_rasters, bounds, output_raster, resolution=None, band_names=None, dtype="uint8", fill_value=0):
+    """
+    Writes a multi-band LZW compressed GeoTIFF with one band per input raster (e.g. the yearly GMW
+    VRTs), each read once for the tile window. Nodata is filled with fill_value as fill_and_compress
+    does. The resolution defaults to the one of the first input.
+    """
+    if resolution is None:
+        with rasterio.open(input_rasters[0]) as src:
+            resolution = src.res[0]
+    grid = get_tile_grid(bounds, resolution)
+    profile = {
+        "driver": "GTiff",
+        "dtype": dtype,
+        "count": len(input_rasters),
+        "width": grid.width,
+        "height": grid.height,
+        "crs": grid.crs,
+        "transform": grid.transform,
+        "compress": "lzw",
+        "tiled": True,
+    }
+    with rasterio.open(output_raster, "w", **profile) as dst:
+        for i, input_raster in enumerate(input_rasters, start=1):
+            dst.write(read_raster_to_grid(input_raster, grid, fill_value=fill_value).astype(dtype), i)
+            if band_names:
+                dst.set_band_description(i, str(band_names[i - 1]))
+    print(f"✔ Saved: {output_raster}")
+
+def read_raster_bands(band_sources):
+    """
+    Reads a list of (raster, band) pairs on the same grid (e.g. the bands of the GMS stack of step 10
+    or the GMW_{tile}_{year} rasters) as a (n, rows, cols) array. Returns the array and the TileGrid.
+    """
+    arrays = []
+    for input_raster, band in band_sources:
+        with rasterio.open(input_raster) as src:
+            arrays.append(src.read(band))
+            grid = TileGrid(src.transform, src.width, src.height, src.crs)
+    return np.stack(arrays), grid
+
+def get_presence_score(stack, years, multipliers, last=True, scale=100):
+    """
+    Linear replacement of the "(Y_i = 1) * year_i * (Y_j != 1) * ..." expressions of steps 11 and 12.
+    Finds the last (or first) layer of the stack, in the order of years, where the pixel is mangrove
+    with one argmax along the time axis and maps it to multipliers[year] / scale with a lookup table.
+    Pixels that are never mangrove get 0.
+    """
+    presence = stack == 1
+    n = len(years)
+    if last:
+        index = n - 1 - np.argmax(presence[::-1], axis=0)
+    else:
+        index = np.argmax(presence, axis=0)
+    index = np.where(presence.any(axis=0), index, n)
+    lut = np.array([multipliers.get(str(year), 0) for year in years] + [0], dtype=np.float64) / scale
+    return lut[index].astype(np.float32)
+
+def clip_raster_to_geometry(input_raster, geometry):
+    # Same clip as clip_subsidence (mask + crop), returned as a masked array
+    with rasterio.open(input_raster) as src:
+        out_image, out_transform = rasterio.mask.mask(src, [geometry], crop=True, filled=False)
+        crs = src.crs
+    return out_image[0], out_transform, crs
+
+def fill_extrapolation_array(masked_array, distance):
+    # In-memory equivalent of qgis_utilities.fill_extrapolation (gdal:fillnodata)
+    valid = ~np.ma.getmaskarray(masked_array)
+    filled = rasterio.fill.fillnodata(masked_array.filled(0), mask=valid.astype(np.uint8),
+                                      max_search_distance=distance, smoothing_iterations=0)
+    valid = rasterio.fill.fillnodata(valid.astype(np.uint8), mask=valid.astype(np.uint8),
+                                     max_search_distance=distance, smoothing_iterations=0) > 0
+    return np.ma.masked_array(filled, mask=~valid)
@@ -0,0 +1,31 @@
+#!/bin/bash
+
+# Exit immediately if a command fails
+set -e
+
+# Load conda into the shell
+source /opt/miniforge3/etc/profile.d/conda.sh
+
+# Activate your QGIS environment
+conda activate qgis_env
+
+# Navigate to your project directory
+cd /p/11211992-tki-mangrove-restoration/02_scripts_and_processing/mrpm_tools/workflow_linux_testing
+
+# Run the Python scripts that prepare tiles, mosaics and tides
+python 01_processing_tiles.py
+python 02_create_clark_vrt.py
+python 04_process_gtsm.py
+python 05_create_deltadtm_vrt.py
+python 09_create_gmw_vrt.py
+
+# Switch to Rasterio environment
+conda deactivate
+conda activate mrpm_env
+
+# Run the Python scripts that prepare vector distances and landcover
+python 16_process_coastline_rivers_distance.py
+python 21_process_landcover.py
+
+# Run steps 03 to 25 per tile in memory, writing only the final products
+python 03_25_fused_tile_pipeline.py
@@ -0,0 +1,40 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+# The workflow scripts import the utilities from their own folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def write_test_raster(tmp_path):
+    """
+    Writes a single band GeoTIFF, by default on a 0.01 degree grid at (117, -1), and returns its path.
+    A name without extension is written as tmp_path/name.tif, a name with one as the given path under tmp_path.
+    """
+    def write(name, array, nodata=None, dtype="float32", west=117, north=-1, res=0.01):
+        path = os.path.join(str(tmp_path), name if os.path.splitext(name)[1] else f"{name}.tif")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        profile = {
+            "driver": "GTiff",
+            "dtype": dtype,
+            "count": 1,
+            "width": array.shape[1],
+            "height": array.shape[0],
+            "crs": "EPSG:4326",
+            "transform": from_origin(west, north, res, res),
+            "nodata": nodata,
+        }
+        with rasterio.open(path, "w", **profile) as dst:
+            dst.write(np.asarray(array, dtype=dtype), 1)
+        return path
+    return write
+
+
+def read_test_raster(path):
+    with rasterio.open(path) as src:
+        return src.read(1, masked=True)
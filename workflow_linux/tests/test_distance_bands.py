@@ -0,0 +1,95 @@
+import json
+import os
+
+import geopandas as gpd
+import numpy as np
+import rasterio
+from shapely.geometry import LineString, box
+
+from ras_utilities import (
+    fill_and_write,
+    process_tiles_clips,
+    raster_calculator,
+    rasterize_distance_bands_tile,
+    rasterize_tiles,
+    reclassify,
+    warp_raster,
+)
+
+TILE_ID = "S02E117"
+TILE_BOUNDS = (117, -2, 118, -1)
+RES = 0.004
+BUFFERS = [500, 2500, 5000, 7500]
+# Not the reclassify defaults, so a mode writing PRC_ without fill_and_write has another profile
+WRITE_OPTIONS = {"compress": "deflate", "predictor": 3, "tiled": True, "blocksize": 128}
+
+
+def run_vector_mode(tiles_dir, coastline, tides_dir, work_dir, multipliers):
+    # Step 16 vector mode, then step 17 process_tile with the in-process equivalents of its QGIS algorithms
+    input_rasters = []
+    expr_terms = []
+    for buffer_m in sorted(BUFFERS, reverse=True):
+        process_tiles_clips(tiles_dir, coastline, buffer_m, "COA", work_dir)
+        rasterize_tiles(buffer_m, "COA", tiles_dir, tides_dir, work_dir, work_dir)
+        coa = os.path.join(work_dir, f"COA_{TILE_ID}_{buffer_m}")
+        warp_raster(f"{coa}.tif", f"{coa}_r.tif", RES, TILE_BOUNDS)
+        fill_and_write(f"{coa}_r.tif", f"{coa}_f.tif", compress=None)
+        input_rasters.append(f"{coa}_f.tif")
+        expr_terms.append(f'("COA_{TILE_ID}_{buffer_m}_f@1" = 1) * 1')
+
+    add_raster = os.path.join(work_dir, f"ADC_{TILE_ID}.tif")
+    nor_raster = os.path.join(work_dir, f"NOC_{TILE_ID}.tif")
+    com_raster = os.path.join(work_dir, f"PRC_{TILE_ID}.tif")
+    raster_calculator(f'({" + ".join(expr_terms)})', input_rasters, add_raster)
+    reclassify(add_raster, multipliers, nor_raster)
+    fill_and_write(nor_raster, com_raster, fill_value=None, **WRITE_OPTIONS)
+    return com_raster
+
+
+def run_raster_mode(tile_path, coastline, rivers, tides_dir, work_dir, multipliers):
+    # Step 16 raster mode, then step 17 process_tile_bands
+    rasterize_distance_bands_tile(tile_path, coastline, rivers, BUFFERS, [250], 30000, tides_dir, work_dir, work_dir)
+    add_raster = os.path.join(work_dir, f"ADC_{TILE_ID}.tif")
+    nor_raster = os.path.join(work_dir, f"NOC_{TILE_ID}.tif")
+    com_raster = os.path.join(work_dir, f"PRC_{TILE_ID}.tif")
+    reclassify(add_raster, multipliers, nor_raster)
+    fill_and_write(nor_raster, com_raster, fill_value=None, **WRITE_OPTIONS)
+    return com_raster
+
+
+def test_distance_bands_modes_match(write_test_raster, tmp_path):
+    tiles_dir = str(tmp_path / "tiles")
+    os.makedirs(tiles_dir)
+    tile_path = os.path.join(tiles_dir, f"TIL_{TILE_ID}_0.geojson")
+    gpd.GeoDataFrame({"id": [TILE_ID]}, geometry=[box(*TILE_BOUNDS)], crs="EPSG:4326").to_file(tile_path, driver="GeoJSON")
+
+    # A coastline crossing the tile and a river far from it, on a tides raster with nodata over the coastline
+    coastline = str(tmp_path / "coastline.gpkg")
+    rivers = str(tmp_path / "rivers.gpkg")
+    gpd.GeoDataFrame(geometry=[LineString([(116.9, -1.7), (117.4, -1.45), (118.1, -1.6)])],
+                     crs="EPSG:4326").to_file(coastline)
+    gpd.GeoDataFrame({"width_m": [50.0]}, geometry=[LineString([(125, 5), (125.1, 5.1)])],
+                     crs="EPSG:4326").to_file(rivers)
+    tides = np.full((250, 250), 1.5)
+    tides[100:150, 100:140] = 0
+    tides_dir = os.path.dirname(write_test_raster(os.path.join("tides", f"GTS_{TILE_ID}.tif"), tides, nodata=0,
+                                                  west=TILE_BOUNDS[0], north=TILE_BOUNDS[3], res=RES))
+
+    with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.json"), "r") as f:
+        multipliers = json.load(f)["proximity_coastline_multipliers"]
+    os.makedirs(tmp_path / "vector")
+    os.makedirs(tmp_path / "raster")
+    vector_raster = run_vector_mode(tiles_dir, coastline, tides_dir, str(tmp_path / "vector"), multipliers)
+    raster_raster = run_raster_mode(tile_path, coastline, rivers, tides_dir, str(tmp_path / "raster"), multipliers)
+
+    with rasterio.open(vector_raster) as vector, rasterio.open(raster_raster) as raster:
+        assert vector.profile == raster.profile
+        vector_data, raster_data = vector.read(1), raster.read(1)
+    # Same classes, only the pixels on the edge of a buffer differ, by one band
+    classes = sorted({0} | {value / 100 for value in multipliers.values()})
+    assert np.unique(vector_data).tolist() == np.unique(raster_data).tolist() == np.float32(classes).tolist()
+    band = lambda data: np.searchsorted(np.float32(classes), data)
+    assert np.abs(band(vector_data) - band(raster_data)).max() == 1
+    assert (vector_data != raster_data).mean() < 0.02
+    # The nodata of the tides is 0 in both modes
+    assert not vector_data[100:150, 100:140].any() and not raster_data[100:150, 100:140].any()
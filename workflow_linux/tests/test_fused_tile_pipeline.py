@@ -0,0 +1,272 @@
+import importlib.util
+import json
+import math
+import os
+import shutil
+
+import geopandas as gpd
+import numpy as np
+import pytest
+import rasterio
+from shapely.geometry import LineString, box, mapping
+
+from general_utilities import get_snapped_bounds, get_tile_bounds
+from ras_utilities import (
+    CALCULATOR_NODATA,
+    TileGrid,
+    build_mosaic_vrt,
+    classify_intertidal,
+    clip_subsidence,
+    fill_and_write,
+    fill_extrapolation_array,
+    get_accommodation_mapping,
+    get_catalog_tile_grid,
+    get_grid_bounds,
+    get_presence_score,
+    get_proximity_bands,
+    raster_calculator,
+    rasterize_distance_bands_tile,
+    read_raster_bands,
+    read_raster_with_halo,
+    reclassify,
+    warp_raster,
+    write_raster,
+)
+
+WORKFLOW_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TILE_ID = "S02E117"
+TILE_BOUNDS = (117, -2, 118, -1)
+RES = 0.02
+WRITE_OPTIONS = {"compress": "lzw", "predictor": None, "tiled": False, "blocksize": 512}
+
+
+def write_tile(tiles_dir, buffer_meters, bounds):
+    path = os.path.join(tiles_dir, f"TIL_{TILE_ID}_{buffer_meters}.geojson")
+    with open(path, "w") as f:
+        json.dump({"type": "FeatureCollection", "features": [
+            {"type": "Feature", "properties": {}, "geometry": mapping(box(*bounds))}]}, f)
+    return path
+
+
+@pytest.fixture
+def fused_tile(write_test_raster, tmp_path, monkeypatch):
+    """Synthetic inputs for one tile, the config of the fused pipeline and its module loaded on them."""
+    rng = np.random.default_rng(0)
+    data_dir = str(tmp_path / "data")
+    sources = str(tmp_path / "sources")
+    tiles_dir = os.path.join(data_dir, "1_Tiles", "test")
+    os.makedirs(tiles_dir)
+    tile_path = write_tile(tiles_dir, 0, TILE_BOUNDS)
+    write_tile(tiles_dir, 10000, (116.9, -2.1, 118.1, -0.9))
+
+    shape = (70, 70)  # 116.8 to 118.2 and -2.2 to -0.8 at RES
+    source_grid = {"west": 116.8, "north": -0.8, "res": RES}
+    dtm = rng.uniform(-1, 3, shape)
+    dtm[:5] = -9999
+    write_test_raster(os.path.join(sources, "clark.tif"), rng.integers(1, 6, shape), dtype="uint8", **source_grid)
+    write_test_raster(os.path.join(sources, "deltadtm.tif"), dtm, nodata=-9999, **source_grid)
+    write_test_raster(os.path.join(sources, "occurrence.tif"), rng.integers(0, 101, shape), dtype="uint8", **source_grid)
+    # Subsidence classes at a finer resolution, with a nodata strip wider than the 50 pixel extrapolation
+    for year in ["2010", "2040"]:
+        subsidence = rng.integers(1, 7, (280, 280))
+        subsidence[:, :120] = 0
+        write_test_raster(os.path.join(sources, f"GSH_{year}.tif"), subsidence, nodata=0, dtype="uint8",
+                          west=116.8, north=-0.8, res=0.005)
+
+    gmw_dir = os.path.join(data_dir, "4_GMW", "test")
+    for year in [2019, 2020]:
+        write_test_raster(os.path.join(gmw_dir, f"gmw_v3_{year}_gtiff.vrt"), rng.uniform(size=shape) > 0.9,
+                          nodata=0, dtype="uint8", **source_grid)
+
+    tile_shape = (50, 50)
+    tile_grid = {"west": TILE_BOUNDS[0], "north": TILE_BOUNDS[3], "res": RES}
+    gts = rng.uniform(0.5, 2, tile_shape)
+    gts[:, :3] = CALCULATOR_NODATA
+    gts_path = write_test_raster(os.path.join(data_dir, "8_Tides", "test", f"GTS_{TILE_ID}.tif"), gts,
+                      nodata=CALCULATOR_NODATA, **tile_grid)
+    write_test_raster(os.path.join(data_dir, "11_Landcover", "test", f"LAN_{TILE_ID}.tif"),
+                      rng.uniform(size=tile_shape) > 0.8, **tile_grid)
+    # Step 16 raster mode with coastline bands only, the missing rivers layer is replaced by EMA_ in step 25
+    coastline = os.path.join(sources, "coastline.gpkg")
+    rivers = os.path.join(sources, "rivers.gpkg")
+    gpd.GeoDataFrame(geometry=[LineString([(116.9, -1.7), (117.4, -1.45), (118.1, -1.6)])],
+                     crs="EPSG:4326").to_file(coastline)
+    gpd.GeoDataFrame({"width_m": [50.0]}, geometry=[LineString([(125, 5), (125.1, 5.1)])],
+                     crs="EPSG:4326").to_file(rivers)
+    coastline_dir = os.path.join(data_dir, "13_Coastline", "test")
+    rivers_dir = os.path.join(data_dir, "6_Rivers", "test")
+    os.makedirs(coastline_dir)
+    os.makedirs(rivers_dir)
+    rasterize_distance_bands_tile(tile_path, coastline, rivers, [500, 2500, 5000, 7500], [250, 500, 2500], 30000,
+                                  os.path.dirname(gts_path), coastline_dir, rivers_dir)
+
+    with open(os.path.join(WORKFLOW_DIR, "config.json"), "r") as f:
+        config = json.load(f)
+    config.update({
+        "country_name": "test", "data_dir": data_dir, "n_workers": 1, "incremental": False,
+        "target_res_deg": RES, "target_res_deg_for_seed_dispersal": 0.01, "raster_write_options": WRITE_OPTIONS,
+        "vrt_footprint_filter": False, "clark_vrt": os.path.join(sources, "clark.tif"),
+        "deltadtm_vrt": os.path.join(sources, "deltadtm.tif"),
+        "permanent_water_vrt": os.path.join(sources, "occurrence.tif"),
+        "subsidence_data_2010": os.path.join(sources, "GSH_2010.tif"),
+        "subsidence_data_2040": os.path.join(sources, "GSH_2040.tif"),
+        # Different from the 2010 ones, so that each year is checked against its own multipliers
+        "subsidence_multipliers_2040": {"1": 100, "2": 90, "3": 70, "4": 50, "5": 30, "6": 10},
+        "gmw_years": [2019, 2020], "gmw_stack": False, "gmw_last_year": 2020,
+        "historical_gmw_years": [2019, 2020], "recruitment_gmw_years": [2020, 2019],
+        "historical_gmw_multipliers": {"2019": 87, "2020": 100},
+        "recruitment_gmw_multipliers": {"2019": 87, "2020": 100},
+        "distance_bands_mode": "raster",
+    })
+    monkeypatch.chdir(tmp_path)
+    with open("config.json", "w") as f:
+        json.dump(config, f)
+
+    spec = importlib.util.spec_from_file_location("fused_tile_pipeline",
+                                                  os.path.join(WORKFLOW_DIR, "03_25_fused_tile_pipeline.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module, config, tile_path
+
+
+def run_step_chain(config, tile_path, work_dir):
+    """
+    Steps 03 to 25 with their in-process functions and expressions. The QGIS algorithms of steps 15, 17
+    and 20 are replaced by their rasterio equivalents: warp_raster for reproject_raster, fill_and_write
+    with fill_value=None for compress_raster and fill_extrapolation_array for fill_extrapolation.
+    """
+    os.makedirs(work_dir)
+    grid = get_catalog_tile_grid(tile_path, RES)
+    bounds = get_grid_bounds(grid)
+    path = lambda name: os.path.join(work_dir, f"{name}_{TILE_ID}.tif")
+
+    # Step 03
+    warp_raster(config["clark_vrt"], path("CLA"), RES, bounds)
+    reclassify(path("CLA"), config["clark_multipliers"], path("BIN"))
+    fill_and_write(path("BIN"), path("PON"), **WRITE_OPTIONS)
+
+    # Step 06
+    warp_raster(config["deltadtm_vrt"], path("CUT"), RES, bounds)
+    fill_and_write(path("CUT"), path("FIL"), compress=None)
+    raster_calculator(f'(({path("FIL")}@1) * 1 + ({path("PON")}@1) / 10000)', [path("FIL"), path("PON")], path("COR"))
+    fill_and_write(path("COR"), path("ELE"), fill_value=None, **WRITE_OPTIONS)
+
+    # Steps 07 and 08, categorical mode straight to ACC_
+    gts_raster = os.path.join(config["data_dir"], "8_Tides", "test", f"GTS_{TILE_ID}.tif")
+    classify_intertidal(path("ELE"), gts_raster, path("ACC"), config["deltadtm_mangrove_correction"],
+                        config["intertidal_slr_correction"], get_accommodation_mapping(config["accommodation_multipliers"]))
+
+    # Step 10, one GMW_ raster per year
+    gmw_dir = os.path.join(config["data_dir"], "4_GMW", "test")
+    for year in config["gmw_years"]:
+        warp_raster(os.path.join(gmw_dir, f"gmw_v3_{year}_gtiff.vrt"), path(f"REP_{year}"), RES, bounds)
+        fill_and_write(path(f"REP_{year}"), os.path.join(work_dir, f"GMW_{TILE_ID}_{year}.tif"), **WRITE_OPTIONS)
+
+    # Step 11
+    gmw_bands = [(os.path.join(work_dir, f"GMW_{TILE_ID}_{year}.tif"), 1) for year in config["historical_gmw_years"]]
+    gmw_stack, gmw_grid = read_raster_bands(gmw_bands)
+    write_raster(get_presence_score(gmw_stack, config["historical_gmw_years"], config["historical_gmw_multipliers"]),
+                 gmw_grid, path("HIS"))
+
+    # Step 13 with the "vrt" halo mode, the last GMW year on the snapped tile grid
+    gmw_vrt = os.path.join(gmw_dir, f"gmw_v3_{config['gmw_last_year']}_gtiff.vrt")
+    seed_res = config["target_res_deg_for_seed_dispersal"]
+    warp_raster(gmw_vrt, path("CLI"), seed_res, get_snapped_bounds(get_tile_bounds(tile_path, rounding=False), seed_res))
+    fill_and_write(path("CLI"), path("REP"), **WRITE_OPTIONS)
+
+    # Step 14, the halo is read from the mosaic of the REP_ rasters and the GMW VRT around it
+    meters_per_pixel = seed_res * 111320
+    halo = math.ceil(max(config["proximity_distances"]) / meters_per_pixel)
+    build_mosaic_vrt([path("REP")], os.path.join(work_dir, "REP_mosaic.vrt"))
+    with rasterio.open(path("REP")) as src:
+        profile = src.profile
+        rep_grid = TileGrid(src.transform, src.width, src.height, src.crs)
+    raster_data, _ = read_raster_with_halo(os.path.join(work_dir, "REP_mosaic.vrt"), rep_grid, halo, gmw_vrt)
+    _, count = get_proximity_bands(raster_data, config["proximity_distances"], meters_per_pixel)
+    profile.update(dtype="uint8", nodata=None, compress="lzw")
+    with rasterio.open(path("ADD"), "w", **profile) as dst:
+        dst.write(count[halo:halo + rep_grid.height, halo:halo + rep_grid.width], 1)
+
+    # Step 15
+    reclassify(path("ADD"), config["proximity_gmw_multipliers"], path("CAL"))
+    warp_raster(path("CAL"), path("SEE_CLI"), RES, bounds)
+    fill_and_write(path("SEE_CLI"), path("SEE"), fill_value=None)
+
+    # Step 17, raster mode on the ADC_ raster of step 16
+    adc_raster = os.path.join(config["data_dir"], "13_Coastline", "test", f"ADC_{TILE_ID}.tif")
+    reclassify(adc_raster, config["proximity_coastline_multipliers"], path("NOC"))
+    fill_and_write(path("NOC"), path("PRC"), fill_value=None, **WRITE_OPTIONS)
+
+    # Steps 19 and 20
+    tiles_dir = os.path.dirname(tile_path)
+    nor_rasters = []
+    for year in ["2010", "2040"]:
+        clip_subsidence(tiles_dir, config[f"subsidence_data_{year}"], work_dir, year)
+        with rasterio.open(os.path.join(work_dir, f"CLI_{TILE_ID}_{year}.tif")) as src:
+            cli = src.read(1, masked=True)
+            profile = src.profile
+        with rasterio.open(path(f"FIL_{year}"), "w", **profile) as dst:
+            dst.write(fill_extrapolation_array(cli, 50).filled(profile["nodata"]), 1)
+        nor_rasters.append(os.path.join(work_dir, f"NOR_{TILE_ID}_{year}.tif"))
+        reclassify(path(f"FIL_{year}"), config[f"subsidence_multipliers_{year}"], nor_rasters[-1], scale=1)
+    raster_calculator(f'(((("NOR_{TILE_ID}_2010@1")  + ("NOR_{TILE_ID}_2040@1")) / 200) + '
+                      f'max("NOR_{TILE_ID}_2010@1", "NOR_{TILE_ID}_2040@1") /100) /2 ', nor_rasters, path("SUB_CAL"))
+    warp_raster(path("SUB_CAL"), path("SUB_REP"), RES, bounds)
+    fill_and_write(path("SUB_REP"), path("SUB"), fill_value=None)
+
+    # Step 22
+    warp_raster(config["permanent_water_vrt"], path("OCC"), RES, bounds)
+    raster_calculator(f'(("OCC_{TILE_ID}@1" > {config["permanent_water_threshold"]}) - "PON_{TILE_ID}@1") > 0 ',
+                      [path("OCC"), path("PON")], path("BIW"))
+    fill_and_write(path("BIW"), path("WAT"), **WRITE_OPTIONS)
+
+    # Steps 23 and 24
+    lan_raster = os.path.join(config["data_dir"], "11_Landcover", "test", f"LAN_{TILE_ID}.tif")
+    mask_rasters = [os.path.join(work_dir, f"GMW_{TILE_ID}_2020.tif"), lan_raster, path("WAT")]
+    for product, operator in [("NVA", ">"), ("EMA", "<")]:
+        raster_calculator(f'("GMW_{TILE_ID}_2020@1" + "LAN_{TILE_ID}@1" + "WAT_{TILE_ID}@1") {operator} 0',
+                          mask_rasters, path(f"BI{product[0]}"))
+        fill_and_write(path(f"BI{product[0]}"), path(product), **WRITE_OPTIONS)
+
+    # Step 25, with EMA_ in place of the missing PRR_
+    shutil.copy(path("EMA"), path("PRR"))
+    raster_calculator(
+        f'if("NVA_{TILE_ID}@1" = 0, ("PON_{TILE_ID}@1" + "ACC_{TILE_ID}@1" + "HIS_{TILE_ID}@1" + "SEE_{TILE_ID}@1" + '
+        f'max("PRR_{TILE_ID}@1", "PRC_{TILE_ID}@1") + "SUB_{TILE_ID}@1") / 6, 0)',
+        [path(p) for p in ["NVA", "PON", "ACC", "HIS", "SEE", "PRR", "PRC", "SUB"]], path("BIM"))
+    fill_and_write(path("BIM"), path("MPM"), **WRITE_OPTIONS)
+    return path
+
+
+def test_fused_products_match_step_chain(fused_tile, tmp_path):
+    module, config, tile_path = fused_tile
+    module.process_tile(tile_path)
+    step_path = run_step_chain(config, tile_path, str(tmp_path / "steps"))
+
+    for product in ["PON", "ELE", "ACC", "HIS", "SEE", "PRC", "SUB", "WAT", "NVA", "EMA", "MPM"]:
+        fused_raster = os.path.join(module.output_dirs[product], f"{product}_{TILE_ID}.tif")
+        with rasterio.open(fused_raster) as fused, rasterio.open(step_path(product)) as step:
+            assert (fused.dtypes, fused.nodata) == (step.dtypes, step.nodata), product
+            assert fused.transform.almost_equals(step.transform), product
+            assert fused.shape == step.shape, product
+            np.testing.assert_array_equal(fused.read(1), step.read(1), err_msg=product)
+
+    # The SUB_ nodata strip and the nodata of the tides reach the products
+    with rasterio.open(step_path("SUB")) as src:
+        assert src.read(1, masked=True).mask.any()
+    with rasterio.open(step_path("MPM")) as src:
+        assert (src.read(1) > 0).any()
+
+
+def test_fused_products_keep_step_nodata(fused_tile):
+    module, config, tile_path = fused_tile
+    module.process_tile(tile_path)
+    for product in config["fused_outputs"]:
+        output_raster = os.path.join(module.output_dirs[product], f"{product}_{TILE_ID}.tif")
+        if product == "PRR":
+            assert not os.path.exists(output_raster)
+            continue
+        with rasterio.open(output_raster) as src:
+            assert src.dtypes[0] == "float32", product
+            expected = None if product in ["PON", "WAT", "NVA", "EMA", "MPM"] else CALCULATOR_NODATA
+            assert src.nodata == expected, product
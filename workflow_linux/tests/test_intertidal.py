@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from conftest import read_test_raster
+from ras_utilities import (
+    CALCULATOR_NODATA,
+    INTERTIDAL_BEY,
+    INTERTIDAL_HAT,
+    INTERTIDAL_MSL,
+    classify_intertidal,
+    classify_intertidal_array,
+    get_accommodation_mapping,
+    raster_calculator,
+    reclassify,
+)
+
+CORRECTION = 48
+SLR = 100
+MULTIPLIERS = {"1": 25, "2": 100}
+
+
+def get_step07_expressions(elevation_name, tide_name):
+    # The three raster calculator expressions of step 07
+    corrected = f"({elevation_name}@1 * 100 - {CORRECTION})"
+    return {
+        "MSL": f"(({elevation_name}@1 > 0) AND ({corrected} <= ({tide_name}@1 * 100)))",
+        "HAT": f"({corrected} > ({tide_name}@1 * 100))",
+        "BEY": f"(({corrected} > ({tide_name}@1 * 100)) AND ({corrected} <= (({tide_name}@1 + {SLR}/100) * 100)))",
+    }
+
+
+@pytest.fixture
+def elevation_and_tide(write_test_raster):
+    rng = np.random.default_rng(0)
+    # Values on a 1 cm step, so that many pixels fall on the class boundaries
+    elevation = (rng.integers(-100, 400, (60, 50)) / 100).astype(np.float32)
+    tide = (rng.integers(50, 250, (60, 50)) / 100).astype(np.float32)
+    tide[:, :4] = CALCULATOR_NODATA
+    return (write_test_raster("ELE_T", elevation, nodata=CALCULATOR_NODATA),
+            write_test_raster("GTS_T", tide, nodata=CALCULATOR_NODATA), elevation, tide)
+
+
+def test_classify_intertidal_matches_step07_expressions(elevation_and_tide, tmp_path):
+    elevation_raster, tide_raster, elevation, tide = elevation_and_tide
+    references = {}
+    for name, expression in get_step07_expressions("ELE_T", "GTS_T").items():
+        output = str(tmp_path / f"{name}.tif")
+        raster_calculator(expression, [elevation_raster, tide_raster], output)
+        # As after fill_and_compress
+        references[name] = read_test_raster(output).filled(0)
+
+    int_raster = str(tmp_path / "INT.tif")
+    classify_intertidal(elevation_raster, tide_raster, int_raster, CORRECTION, SLR)
+    classes = read_test_raster(int_raster).data
+    assert classes.dtype == np.uint8
+    np.testing.assert_array_equal(classes == INTERTIDAL_MSL, references["MSL"] == 1)
+    np.testing.assert_array_equal((classes == INTERTIDAL_BEY) | (classes == INTERTIDAL_HAT), references["HAT"] == 1)
+    np.testing.assert_array_equal(classes == INTERTIDAL_BEY, references["BEY"] == 1)
+    assert (classes[:, :4] == 0).all()
+    assert {INTERTIDAL_MSL, INTERTIDAL_BEY, INTERTIDAL_HAT} <= set(np.unique(classes))
+
+    # The same classes from the arrays, where the tide is valid
+    array_classes = classify_intertidal_array(elevation.astype(np.float64), tide.astype(np.float64), CORRECTION, SLR)
+    np.testing.assert_array_equal(array_classes[:, 4:], classes[:, 4:])
+
+    # Step 08: ACC_ from the classes and from "MSL@1"*2+"BEY@1"*1
+    acc_raster = str(tmp_path / "ACC.tif")
+    reclassify(int_raster, get_accommodation_mapping(MULTIPLIERS), acc_raster)
+    unc = references["MSL"] * 2 + references["BEY"]
+    expected = np.select([unc == 2, unc == 1], [MULTIPLIERS["2"] / 100, MULTIPLIERS["1"] / 100], 0).astype(np.float32)
+    np.testing.assert_array_equal(read_test_raster(acc_raster).data, expected)
@@ -0,0 +1,68 @@
+import os
+
+import pytest
+
+import general_utilities
+from general_utilities import get_manifest_entry, is_up_to_date, write_manifest
+
+
+def write_file(path, content):
+    with open(path, "w") as f:
+        f.write(content)
+    return str(path)
+
+
+def test_utility_modules_are_manifest_inputs(tmp_path, monkeypatch):
+    module = write_file(tmp_path / "ras_utilities.py", "def reclassify(): pass\n")
+    monkeypatch.setattr(general_utilities, "utility_modules", [module])
+    tile_input = write_file(tmp_path / "GTS_T.tif", "tile")
+    output = write_file(tmp_path / "ACC_T.tif", "output")
+
+    entry = get_manifest_entry([tile_input], {"multipliers": [1, 2]})
+    assert sorted(entry["inputs"]) == ["GTS_T.tif", "ras_utilities.py"]
+    write_manifest(str(tmp_path), "ACC", "T", [output], entry)
+    assert is_up_to_date(str(tmp_path), "ACC", "T", [output], get_manifest_entry([tile_input], {"multipliers": [1, 2]}))
+
+    # A fix in a utility module invalidates the products written before it
+    write_file(module, "def reclassify(): return 0\n")
+    assert not is_up_to_date(str(tmp_path), "ACC", "T", [output], get_manifest_entry([tile_input], {"multipliers": [1, 2]}))
+
+
+def test_vrt_inputs_include_their_sources(tmp_path, monkeypatch):
+    monkeypatch.setattr(general_utilities, "utility_modules", [])
+    os.makedirs(tmp_path / "tiles")
+    first = write_file(tmp_path / "tiles" / "A.tif", "first")
+    write_file(tmp_path / "tiles" / "B.tif", "second")
+    vrt = write_file(tmp_path / "mosaic.vrt", (
+        '<VRTDataset rasterXSize="20" rasterYSize="10"><VRTRasterBand dataType="Byte" band="1">'
+        '<SimpleSource><SourceFilename relativeToVRT="1">tiles/A.tif</SourceFilename></SimpleSource>'
+        f'<SimpleSource><SourceFilename relativeToVRT="0">{tmp_path / "tiles" / "B.tif"}</SourceFilename></SimpleSource>'
+        '</VRTRasterBand></VRTDataset>'))
+    assert general_utilities.get_vrt_source_files(vrt) == [first, str(tmp_path / "tiles" / "B.tif")]
+
+    entry = get_manifest_entry([vrt], {})
+    # A source tile rewritten behind the unchanged VRT XML changes the stamp of the VRT
+    os.utime(first, ns=(0, 0))
+    assert get_manifest_entry([vrt], {}) != entry
+
+
+def test_large_inputs_and_outputs_are_not_read(tmp_path, monkeypatch):
+    monkeypatch.setattr(general_utilities, "utility_modules", [])
+    monkeypatch.setattr(general_utilities, "large_file_size", 4)
+    global_input = write_file(tmp_path / "GSH.tif", "global raster")
+    tile_input = write_file(tmp_path / "GTS_T.tif", "gts")
+    output = write_file(tmp_path / "SUB_T.tif", "output")
+
+    entry = get_manifest_entry([global_input, tile_input], {})
+    assert entry["inputs"]["GSH.tif"] == general_utilities.get_size_stamp(global_input)
+    assert entry["inputs"]["GTS_T.tif"] == general_utilities.get_file_hash(tile_input)
+
+    # Neither the large input nor the output is read when checking the tile
+    write_manifest(str(tmp_path), "SUB", "T", [output], entry)
+    monkeypatch.setattr(general_utilities, "get_file_hash", lambda path: pytest.fail(f"{path} was hashed"))
+    assert get_manifest_entry([global_input], {})["inputs"]["GSH.tif"] == entry["inputs"]["GSH.tif"]
+    assert is_up_to_date(str(tmp_path), "SUB", "T", [output], entry)
+
+    # An overwritten output is rebuilt
+    write_file(output, "overwritten output")
+    assert not is_up_to_date(str(tmp_path), "SUB", "T", [output], entry)
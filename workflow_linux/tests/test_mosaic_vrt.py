@@ -0,0 +1,46 @@
+import numpy as np
+import rasterio
+import rasterio.merge
+
+from ras_utilities import build_mosaic_vrt, get_halo_grid, get_tile_grid, get_vrt_sources, read_raster_with_halo
+
+
+def test_build_mosaic_vrt_matches_merge(write_test_raster, tmp_path):
+    rng = np.random.default_rng(0)
+    # Three 1 degree tiles of an L shape, the missing corner is outside all of them
+    tiles = [write_test_raster(f"REP_{i}", rng.integers(0, 2, (100, 100)), dtype="uint8", west=west, north=north)
+             for i, (west, north) in enumerate([(117, -1), (118, -1), (117, -2)])]
+    vrt = str(tmp_path / "REP_mosaic.vrt")
+    build_mosaic_vrt(tiles, vrt)
+
+    merged, transform = rasterio.merge.merge(tiles)
+    with rasterio.open(vrt) as src:
+        assert src.transform.almost_equals(transform)
+        assert src.crs == "EPSG:4326" and src.dtypes[0] == "uint8"
+        np.testing.assert_array_equal(src.read(1), merged[0])
+
+    # Step 14 reads the tile and the halo strips of its neighbours back from the mosaic
+    grid = get_tile_grid((117, -2, 118, -1), 0.01)
+    halo = 10
+    data, _ = read_raster_with_halo(vrt, grid, halo)
+    sources = get_vrt_sources(vrt, get_halo_grid(grid, halo))
+    assert sorted(sources) == sorted(tiles)
+    assert sources[tiles[0]] == (slice(halo, 100 + halo), slice(halo, 100 + halo))
+    np.testing.assert_array_equal(data[halo:-halo, halo:], merged[0][:100, :100 + halo])
+    np.testing.assert_array_equal(data[-halo:, halo:-halo], merged[0][100:100 + halo, :100])
+
+def test_build_mosaic_vrt_keeps_nodata(write_test_raster, tmp_path):
+    first = np.full((10, 10), 7, dtype=np.float32)
+    second = np.full((10, 10), -9999, dtype=np.float32)
+    second[:, 5:] = 3
+    tiles = [write_test_raster("A", first, nodata=-9999),
+             write_test_raster("B", second, nodata=-9999, west=117.05)]
+    vrt = str(tmp_path / "mosaic.vrt")
+    build_mosaic_vrt(tiles, vrt)
+
+    with rasterio.open(vrt) as src:
+        assert src.nodata == -9999 and src.width == 15
+        data = src.read(1)
+    # Nodata pixels of the second tile do not hide the first one
+    np.testing.assert_array_equal(data[:, :10], 7)
+    np.testing.assert_array_equal(data[:, 10:], 3)
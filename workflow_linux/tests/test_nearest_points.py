@@ -0,0 +1,85 @@
+import geopandas as gpd
+import numpy as np
+import pytest
+import rasterio
+import rasterio.features
+import shapely
+from shapely.geometry import box
+
+from scipy.spatial import cKDTree
+
+from ras_utilities import get_nearest_labels, get_nearest_values, get_tile_grid, rasterize_nearest_points
+
+TILE_BOUNDS = (117, -2, 118, -1)
+
+
+@pytest.fixture
+def gtsm_tile(tmp_path):
+    """Random stations around a 1 degree tile, with the tile vector and its 200 km buffer."""
+    rng = np.random.default_rng(0)
+    n = 300
+    points = gpd.GeoDataFrame({"HAT": rng.uniform(0.5, 3, n).astype("float32")},
+                              geometry=gpd.points_from_xy(rng.uniform(114, 121, n), rng.uniform(-5, 2, n)),
+                              crs="EPSG:4326")
+    points_path = str(tmp_path / "gtsm.gpkg")
+    points.to_file(points_path)
+
+    tile = gpd.GeoDataFrame({"id": ["S02E117"]}, geometry=[box(*TILE_BOUNDS)], crs="EPSG:4326")
+    tile_path = str(tmp_path / "TIL_S02E117_0.geojson")
+    buffer_path = str(tmp_path / "TIL_S02E117_200000.geojson")
+    tile.to_file(tile_path, driver="GeoJSON")
+    buffered = tile.to_crs("EPSG:3857")
+    buffered["geometry"] = buffered.buffer(200000)
+    buffered.to_crs("EPSG:4326").to_file(buffer_path, driver="GeoJSON")
+    return points_path, tile_path, buffer_path
+
+
+def get_voronoi_reference(points_path, tile_path, buffer_path, resolution):
+    # Clip the stations to the buffer, build their Voronoi polygons, clip them to the tile and rasterize them
+    clip_geometry = gpd.read_file(buffer_path).union_all()
+    points = gpd.read_file(points_path)
+    points = points[points.intersects(clip_geometry)]
+    extent = box(*points.total_bounds).buffer(10)
+    polygons = shapely.voronoi_polygons(shapely.MultiPoint(list(points.geometry)), extend_to=extent)
+    voronoi = gpd.GeoDataFrame(geometry=list(polygons.geoms), crs=points.crs)
+    voronoi = gpd.sjoin(voronoi, points, predicate="contains")
+    voronoi["geometry"] = voronoi.intersection(gpd.read_file(tile_path).union_all())
+    voronoi = voronoi[~voronoi.is_empty]
+    grid = get_tile_grid(TILE_BOUNDS, resolution)
+    return rasterio.features.rasterize(zip(voronoi.geometry, voronoi["HAT"]), out_shape=(grid.height, grid.width),
+                                       transform=grid.transform, fill=0, dtype="float32")
+
+
+@pytest.mark.parametrize("coarse_block", [0, 16])
+def test_rasterize_nearest_points_matches_voronoi(gtsm_tile, tmp_path, coarse_block):
+    points_path, tile_path, buffer_path = gtsm_tile
+    output = str(tmp_path / "GTS.tif")
+    rasterize_nearest_points(points_path, "HAT", buffer_path, tile_path, 0.004, output, coarse_block=coarse_block)
+
+    with rasterio.open(output) as src:
+        result = src.read(1)
+        assert src.nodata == 0
+    reference = get_voronoi_reference(points_path, tile_path, buffer_path, 0.004)
+    assert result.shape == reference.shape == (250, 250)
+    np.testing.assert_array_equal(result, reference)
+
+
+@pytest.mark.parametrize("n_points", [1, 2, 20, 300, 3000])
+@pytest.mark.parametrize("block", [7, 32])
+def test_get_nearest_labels_matches_full_query(n_points, block):
+    rng = np.random.default_rng(n_points)
+    points = np.column_stack([rng.uniform(116, 119, n_points), rng.uniform(-3, 0, n_points)])
+    tree = cKDTree(points)
+    # Neither dimension is a multiple of the block size
+    grid = get_tile_grid(TILE_BOUNDS, 0.003)
+    assert (grid.height, grid.width) == (333, 333)
+
+    labels = get_nearest_labels(tree, grid, block)
+    xx, yy = np.meshgrid(grid.transform.c + (np.arange(grid.width) + 0.5) * grid.transform.a,
+                         grid.transform.f + (np.arange(grid.height) + 0.5) * grid.transform.e)
+    _, expected = tree.query(np.column_stack([xx.ravel(), yy.ravel()]))
+    np.testing.assert_array_equal(labels, expected.reshape(xx.shape))
+
+    values = rng.uniform(0.5, 3, n_points).astype("float32")
+    np.testing.assert_array_equal(get_nearest_values(points, values, grid, coarse_block=block),
+                                  get_nearest_values(points, values, grid))
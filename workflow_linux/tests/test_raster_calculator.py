@@ -0,0 +1,137 @@
+import re
+
+import numpy as np
+import pytest
+
+from conftest import read_test_raster
+from ras_utilities import CALCULATOR_NODATA, parse_expression, raster_calculator, replace_layer_references
+
+
+@pytest.mark.parametrize("expression, expected", [
+    ('1-"X@1"', "1- __ref_0_1 "),
+    ('- -X@1', "- - __ref_0_1 "),
+    ('"X"@1 * 2', " __ref_0_1  * 2"),
+    ('X@1-Y@1', " __ref_0_1 - __ref_1_1 "),
+    ('"X@1"-"Y@1"', " __ref_0_1 - __ref_1_1 "),
+    ('("/data/tiles/X.tif"@1) / 10000', "( __ref_0_1 ) / 10000"),
+    ('(/data/tiles/X.tif@1) * 1', "( __ref_0_1 ) * 1"),
+])
+def test_replace_layer_references(expression, expected):
+    replaced, references = replace_layer_references(expression, ["/data/tiles/X.tif", "/data/tiles/Y.tif"])
+    assert replaced == expected
+    assert references == sorted({(i, 1) for i in range(2) if f"__ref_{i}_1" in expected})
+    parse_expression(replaced)
+
+
+def test_replace_layer_references_longest_name_and_band():
+    replaced, references = replace_layer_references(
+        '"GMW_T_2020@1" + "GMW_T@1" + "GMS_T@3"', ["GMW_T.tif", "GMW_T_2020.tif", "GMS_T.tif"])
+    assert replaced == " __ref_1_1  +  __ref_0_1  +  __ref_2_3 "
+    assert references == [(0, 1), (1, 1), (2, 3)]
+
+
+def test_replace_layer_references_unknown_layer():
+    with pytest.raises(ValueError):
+        replace_layer_references('"Z@1" + "X@1"', ["X.tif"])
+
+
+def test_replace_layer_references_does_not_match_inside_names():
+    with pytest.raises(ValueError):
+        replace_layer_references('"OTHER_X@1"', ["X.tif"])
+
+
+CORRECTION = 45
+SLR = 30
+
+# Expression shapes of steps 06-25, with the NumPy result they must reproduce
+STEP_EXPRESSIONS = {
+    "06_elevation": (
+        "((FIL@1) * 1 + (PON@1) / 10000)",
+        lambda r: r["FIL"] + r["PON"] / 10000),
+    "07_msl": (
+        f"((ELE@1 > 0) AND ((ELE@1 * 100 - {CORRECTION}) <= (GTS@1 * 100)))",
+        lambda r: (r["ELE"] > 0) & (r["ELE"] * 100 - CORRECTION <= r["GTS"] * 100)),
+    "07_hat": (
+        f"((ELE@1 * 100 - {CORRECTION}) > (GTS@1 * 100))",
+        lambda r: r["ELE"] * 100 - CORRECTION > r["GTS"] * 100),
+    "07_bey": (
+        f"(((ELE@1 * 100 - {CORRECTION}) > (GTS@1 * 100)) AND "
+        f"((ELE@1 * 100 - {CORRECTION}) <= ((GTS@1 + {SLR}/100) * 100)))",
+        lambda r: (r["ELE"] * 100 - CORRECTION > r["GTS"] * 100)
+        & (r["ELE"] * 100 - CORRECTION <= (r["GTS"] + SLR / 100) * 100)),
+    "08_accommodation": (
+        '"MSL@1"*2+"BEY@1"*1',
+        lambda r: r["MSL"] * 2 + r["BEY"]),
+    "15_proximity": (
+        '"DIL_500@1" + "DIL_2500@1" + "DIL_10000@1"',
+        lambda r: r["DIL_500"] + r["DIL_2500"] + r["DIL_10000"]),
+    "17_18_distance_bands": (
+        '(("BUF_500@1" = 1) * 1 + ("BUF_5000@1" = 1) * 1)',
+        lambda r: (r["BUF_500"] == 1) * 1 + (r["BUF_5000"] == 1) * 1),
+    "20_subsidence": (
+        '(((("NOR_2010@1")  + ("NOR_2040@1")) / 200) + max("NOR_2010@1", "NOR_2040@1") /100) /2 ',
+        lambda r: ((r["NOR_2010"] + r["NOR_2040"]) / 200 + np.maximum(r["NOR_2010"], r["NOR_2040"]) / 100) / 2),
+    "22_permanent_water": (
+        '(("CLA@1" > 50) - "PON@1") > 0 ',
+        lambda r: (r["CLA"] > 50) * 1.0 - r["PON"] > 0),
+    "23_no_valid_areas": (
+        '("GMW_2020@1" + "LAN@1" + "WAT@1") > 0',
+        lambda r: r["GMW_2020"] + r["LAN"] + r["WAT"] > 0),
+    "24_empty_areas": (
+        '("GMW_2020@1" + "LAN@1" + "WAT@1") < 0',
+        lambda r: r["GMW_2020"] + r["LAN"] + r["WAT"] < 0),
+    "25_mangrove_potential": (
+        'if("NVA@1" = 0, ("PON@1" + "ACC@1" + "HIS@1" + "SEE@1" + max("PRR@1", "PRC@1") + "SUB@1") / 6, 0)',
+        lambda r: np.where(r["NVA"] == 0, (r["PON"] + r["ACC"] + r["HIS"] + r["SEE"]
+                                           + np.maximum(r["PRR"], r["PRC"]) + r["SUB"]) / 6, 0)),
+}
+
+LAYER_VALUES = {
+    "ELE": (-1.0, 4.0), "GTS": (0.0, 3.0), "CLA": (0.0, 100.0), "FIL": (-2.0, 10.0),
+    "NOR_2010": (0.0, 100.0), "NOR_2040": (0.0, 100.0),
+}
+
+
+@pytest.mark.parametrize("step", sorted(STEP_EXPRESSIONS))
+def test_step_expressions(step, write_test_raster, tmp_path):
+    expression, expected = STEP_EXPRESSIONS[step]
+    # Longest names first, as "NOR_2010" also ends in a valid reference
+    names = sorted(set(re.findall(r"[A-Z]+(?:_\d+)?(?=@1)", expression)), key=len, reverse=True)
+    rng = np.random.default_rng(len(step))
+    arrays, paths = {}, {}
+    for name in names:
+        if name in LAYER_VALUES:
+            arrays[name] = rng.uniform(*LAYER_VALUES[name], size=(40, 30)).round(2).astype(np.float32)
+        else:
+            arrays[name] = rng.integers(0, 2, size=(40, 30)).astype(np.float32)
+        paths[name] = write_test_raster(name, arrays[name])
+
+    if step == "06_elevation":
+        # Step 06 references the layers by their full path
+        for name in names:
+            expression = expression.replace(f"{name}@1", f"{paths[name]}@1")
+
+    output = str(tmp_path / "output.tif")
+    raster_calculator(expression, list(paths.values()), output, block_rows=7)
+
+    result = read_test_raster(output)
+    assert not result.mask.any()
+    reference = {name: array.astype(np.float64) for name, array in arrays.items()}
+    np.testing.assert_array_equal(result.data, np.asarray(expected(reference), dtype=np.float32))
+
+
+def test_nodata_propagates(write_test_raster, tmp_path):
+    a = np.arange(12, dtype=np.float32).reshape(3, 4)
+    b = np.ones((3, 4), dtype=np.float32)
+    b[0, 0] = 0
+    a_path = write_test_raster("A", a, nodata=5)
+    b_path = write_test_raster("B", b)
+    output = str(tmp_path / "output.tif")
+    raster_calculator('"A@1" / "B@1"', [a_path, b_path], output)
+
+    result = read_test_raster(output)
+    assert result.fill_value == np.float32(CALCULATOR_NODATA)
+    # Nodata in A and the division by zero at (0, 0) (0 / 0) are written as nodata
+    expected_mask = (a == 5) | (b == 0)
+    np.testing.assert_array_equal(result.mask, expected_mask)
+    np.testing.assert_array_equal(result.compressed(), a[~expected_mask])
@@ -0,0 +1,83 @@
+import json
+import os
+
+import geopandas as gpd
+import numpy as np
+import pytest
+from shapely.geometry import box
+
+from general_utilities import get_tiles_bounds_path, get_tiles_catalog_path, get_tiles_vectors, read_tiles_catalog
+from ras_utilities import filter_sources_by_tiles
+
+BUFFERS = [10000, 200000]
+
+
+def get_tiles():
+    return gpd.GeoDataFrame({"id": ["S01E117", "S01E118"], "country": ["Indonesia", "Indonesia"]},
+                            geometry=[box(117, -1, 118, 0), box(118, -1, 119, 0)], crs="EPSG:4326")
+
+
+def write_tiles_vectors_per_tile(output_dir, tiles_geometry, buffer_crs, buffer_meters):
+    # Previous get_tiles_vector and get_tiles_vector_with_buffer: one row GeoDataFrame per tile
+    for i, row in tiles_geometry.iterrows():
+        tile_geom = tiles_geometry.loc[[i]]
+        if buffer_meters:
+            tile_geom_proj = tile_geom.to_crs(buffer_crs)
+            tile_geom_proj['geometry'] = tile_geom_proj.buffer(buffer_meters)
+            tile_geom = tile_geom_proj.to_crs(tiles_geometry.crs)
+        tile_geom.to_file(os.path.join(output_dir, f"TIL_{row['id']}_{buffer_meters}.geojson"), driver="GeoJSON")
+
+def test_get_tiles_vectors_matches_per_tile_buffers(tmp_path):
+    rng = np.random.default_rng(0)
+    corners = {(int(x), int(y)) for x, y in zip(rng.integers(-180, 179, 20), rng.integers(-40, 40, 20))}
+    tiles = gpd.GeoDataFrame({"id": [f"T{x}_{y}" for x, y in corners], "country": "Test"},
+                             geometry=[box(x, y, x + 1, y + 1) for x, y in corners], crs="EPSG:4326")
+    reference_dir, output_dir = tmp_path / "reference", tmp_path / "output"
+    reference_dir.mkdir()
+    output_dir.mkdir()
+    for buffer_meters in [0] + BUFFERS:
+        write_tiles_vectors_per_tile(str(reference_dir), tiles, "EPSG:3857", buffer_meters)
+    get_tiles_vectors(str(output_dir), tiles, "EPSG:3857", BUFFERS)
+
+    reference_files = sorted(os.listdir(reference_dir))
+    assert len(reference_files) == 3 * len(tiles)
+    for name in reference_files:
+        assert (output_dir / name).read_bytes() == (reference_dir / name).read_bytes(), name
+
+
+def raise_import_error(*args, **kwargs):
+    raise ImportError("Missing optional dependency 'pyarrow'")
+
+
+@pytest.mark.parametrize("buffer_meters", [0] + BUFFERS)
+def test_read_tiles_catalog_without_pyarrow(tmp_path, monkeypatch, buffer_meters):
+    get_tiles_vectors(str(tmp_path), get_tiles(), "EPSG:3857", BUFFERS)
+    catalog = read_tiles_catalog(str(tmp_path), buffer_meters)
+
+    monkeypatch.setattr(gpd, "read_parquet", raise_import_error)
+    vectors = read_tiles_catalog(str(tmp_path), buffer_meters)
+    assert list(vectors.index) == list(catalog.index)
+    assert (vectors["country"] == catalog["country"]).all()
+    assert vectors.geometry.geom_equals_exact(catalog.geometry, tolerance=1e-9).all()
+
+
+def test_filter_sources_by_tiles_without_pyarrow(write_test_raster, tmp_path, monkeypatch):
+    monkeypatch.setattr(gpd.GeoDataFrame, "to_parquet", raise_import_error)
+    tiles_dir = str(tmp_path / "tiles")
+    os.makedirs(tiles_dir)
+    get_tiles_vectors(tiles_dir, get_tiles(), "EPSG:3857", BUFFERS)
+    assert not os.path.exists(get_tiles_catalog_path(tiles_dir))
+    with open(get_tiles_bounds_path(tiles_dir), "r") as f:
+        assert sorted(json.load(f)["S01E117"]) == ["0", "10000", "200000"]
+
+    # Inside a tile, within 10 km of a tile and far from both
+    sources = [write_test_raster(name, np.zeros((10, 10)), dtype="uint8", west=west, north=north, res=0.1)
+               for name, west, north in [("inside", 117.2, -0.2), ("near", 119.05, -0.2), ("far", 125, -5)]]
+    cache_path = str(tmp_path / "footprints.json")
+    assert filter_sources_by_tiles(sources, tiles_dir, 0, cache_path) == sources[:1]
+    assert filter_sources_by_tiles(sources, tiles_dir, 10000, cache_path) == sources[:2]
+
+
+def test_filter_sources_by_tiles_without_tiles(write_test_raster, tmp_path):
+    sources = [write_test_raster("far", np.zeros((10, 10)), dtype="uint8", west=125, north=-5, res=0.1)]
+    assert filter_sources_by_tiles(sources, str(tmp_path), 0, str(tmp_path / "footprints.json")) == sources